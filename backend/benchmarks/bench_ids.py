@@ -0,0 +1,83 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from uuid import uuid4
+from sqlalchemy import Column, DateTime, Index, MetaData, String, Table, Uuid, create_engine, event, insert, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ids import BinaryUUID, uuid7
+
+"""
+bench_ids.py
+
+Compares primary keys on SQLite: random UUIDv4 stored as 32 hex characters (the previous
+models), time-ordered UUIDv7 as hex characters, and UUIDv7 as 16 bytes (ids.BinaryUUID,
+the current models).
+
+For each setup a fresh database gets a posts-like table (id primary key, owner_id, title,
+created_at, index on (created_at, id) like the feed index) and --rows inserts in transactions
+of --batch rows. The page cache is limited to --cache-kib, so once the indexes outgrow it the
+cost of touching random pages shows. Reported are the insert rate of the first and the last
+tenth of the rows, and the size of the table and its indexes (dbstat).
+
+Usage (from the backend directory):
+    python benchmarks/bench_ids.py --rows 500000 --batch 100 --cache-kib 8000
+"""
+
+SETUPS = {
+    'uuid4-text': (Uuid(), uuid4),
+    'uuid7-text': (Uuid(), uuid7),
+    'uuid7-binary': (BinaryUUID(), uuid7),
+}
+
+def run(setup: str, rows: int, batch: int, cache_kib: int, directory: str) -> tuple[float, float, dict[str, int]]:
+    column_type, make_id = SETUPS[setup]
+    metadata = MetaData()
+    posts = Table('posts', metadata,
+                  Column('id', column_type, primary_key=True),
+                  Column('owner_id', column_type, nullable=False),
+                  Column('title', String(100), nullable=False),
+                  Column('created_at', DateTime(timezone=True), nullable=False),
+                  Index('ix_posts_created_at_id', 'created_at', 'id'))
+    engine = create_engine(f'sqlite:///{directory}/{setup}.db')
+    event.listen(engine, 'connect', lambda connection, _: connection.execute(f'PRAGMA cache_size = -{cache_kib}'))
+    metadata.create_all(engine)
+    owners = [uuid4() for _ in range(100)]
+    tenth = max(rows // 10 // batch, 1) * batch
+    rates = []
+    with engine.connect() as connection:
+        started = time.perf_counter()
+        for done in range(0, rows, batch):
+            connection.execute(insert(posts), [
+                {'id': make_id(), 'owner_id': owners[(done + i) % len(owners)], 'title': 'benchmark post',
+                 'created_at': datetime.now(timezone.utc)} for i in range(batch)
+            ])
+            connection.commit()
+            if (done + batch) % tenth == 0:
+                rates.append(tenth / (time.perf_counter() - started))
+                started = time.perf_counter()
+        sizes = dict(connection.execute(text('SELECT name, SUM(pgsize) FROM dbstat GROUP BY name')).all())
+    engine.dispose()
+    return rates[0], rates[-1], sizes
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--setup', nargs='+', choices=SETUPS, default=list(SETUPS))
+    parser.add_argument('--rows', type=int, default=500_000)
+    parser.add_argument('--batch', type=int, default=100)
+    parser.add_argument('--cache-kib', type=int, default=8000)
+    args = parser.parse_args()
+
+    print(f'{"setup":<14}{"first rows/s":>13}{"last rows/s":>13}{"table MiB":>11}{"pk MiB":>9}{"feed ix MiB":>13}')
+    for setup in args.setup:
+        with tempfile.TemporaryDirectory() as tmp:
+            first, last, sizes = run(setup, args.rows, args.batch, args.cache_kib, tmp)
+        primary_key = next(size for name, size in sizes.items() if name.startswith('sqlite_autoindex_posts'))
+        print(f'{setup:<14}{first:>13.0f}{last:>13.0f}{sizes["posts"] / 2**20:>11.1f}'
+              f'{primary_key / 2**20:>9.1f}{sizes["ix_posts_created_at_id"] / 2**20:>13.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+import argparse
+import asyncio
+import os
+import pathlib
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+
+"""
+bench_server.py
+
+Compares the development launcher (main.py: one process, auto-reload) with the
+production launcher (server.py: gunicorn, one uvicorn worker per core, uvloop, httptools).
+
+For each mode the server is started against a fresh, migrated SQLite database, seeded with
+posts, and loaded by a fixed number of concurrent keep-alive clients for a fixed duration.
+Rate limiting is disabled for the benchmark (RATELIMIT_ENABLED=false).
+
+Usage (from the backend directory, requires httpx):
+    python benchmarks/bench_server.py --mode dev prod --duration 15 --concurrency 64
+"""
+
+BACKEND_DIR = pathlib.Path(__file__).resolve().parent.parent
+PORT = 8000
+COMMANDS = {
+    'dev': [sys.executable, 'main.py'],
+    'prod': [sys.executable, 'server.py'],
+}
+
+def start_server(mode: str, database_url: str, extra_env: dict[str, str] | None = None) -> subprocess.Popen:
+    env = {**os.environ, 'DATABASE_URL': database_url, 'PORT': str(PORT), 'RATELIMIT_ENABLED': 'false', **(extra_env or {})}
+    subprocess.run([sys.executable, '-m', 'alembic', 'upgrade', 'head'], cwd=BACKEND_DIR, env=env,
+                   check=True, capture_output=True)
+    # own process group, so the reloader/gunicorn children are stopped together with the server
+    process = subprocess.Popen(COMMANDS[mode], cwd=BACKEND_DIR, env=env, start_new_session=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f'http://127.0.0.1:{PORT}/', timeout=1)
+            return process
+        except httpx.TransportError:
+            time.sleep(0.2)
+    stop_server(process)
+    raise RuntimeError(f'{mode} server did not start')
+
+def stop_server(process: subprocess.Popen) -> None:
+    os.killpg(process.pid, signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+
+def seed(posts: int) -> None:
+    with httpx.Client(base_url=f'http://127.0.0.1:{PORT}') as client:
+        client.post('/users/', json={'username': 'benchuser', 'password': 'benchpassword'}).raise_for_status()
+        token = client.post('/auth/token', data={'username': 'benchuser', 'password': 'benchpassword'}).json()
+        headers = {'Authorization': f'Bearer {token["access_token"]}'}
+        for i in range(posts):
+            client.post('/posts/', json={'title': f'post {i}', 'content': 'benchmark'}, headers=headers).raise_for_status()
+
+async def load(path: str, duration: float, concurrency: int) -> tuple[list[float], int]:
+    latencies: list[float] = []
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def client_loop(client: httpx.AsyncClient):
+        nonlocal errors
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                response = await client.get(path)
+                if response.status_code != 200:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{PORT}', limits=limits, timeout=30) as client:
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+    return latencies, errors
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(p / 100 * len(sorted_values)))]
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', nargs='+', choices=COMMANDS, default=['dev', 'prod'])
+    parser.add_argument('--paths', nargs='+', default=['/', '/posts/?limit=20'])
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--posts', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f'{"mode":<6}{"path":<20}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"errors":>8}')
+    for mode in args.mode:
+        with tempfile.TemporaryDirectory() as tmp:
+            process = start_server(mode, f'sqlite:///{tmp}/bench.db')
+            try:
+                seed(args.posts)
+                for path in args.paths:
+                    asyncio.run(load(path, 2, args.concurrency)) # warm up
+                    latencies, errors = asyncio.run(load(path, args.duration, args.concurrency))
+                    latencies.sort()
+                    print(f'{mode:<6}{path:<20}{len(latencies) / args.duration:>10.0f}'
+                          f'{percentile(latencies, 50) * 1000:>10.1f}{percentile(latencies, 95) * 1000:>10.1f}'
+                          f'{percentile(latencies, 99) * 1000:>10.1f}{errors:>8}')
+            finally:
+                stop_server(process)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+import argparse
+import asyncio
+import itertools
+import tempfile
+import time
+import httpx
+from bench_server import PORT, percentile, seed, start_server, stop_server
+
+"""
+bench_sqlite.py
+
+Compares SQLite with default settings (SQLITE_PROFILE=false) with the SQLite profile of
+database.py (WAL, synchronous=NORMAL, busy_timeout, mmap/cache sizes, a read-only connection
+pool and a single serialized writer per process).
+
+For each setup the production server (server.py, WEB_CONCURRENCY worker processes) is started
+against a fresh, migrated SQLite database seeded with posts. Then reader and writer clients
+run at the same time for a fixed duration:
+    - readers: GET /posts/?limit=20
+    - writers: each with its own user, alternately POST and DELETE /posts/{id}/like on the seeded posts
+Errors are responses other than 200, typically 500 'database is locked'.
+
+Usage (from the backend directory, requires httpx):
+    python benchmarks/bench_sqlite.py --setup default profile --duration 15 --readers 32 --writers 16 --workers 4
+"""
+
+SETUPS = {
+    'default': {'SQLITE_PROFILE': 'false'},
+    'profile': {'SQLITE_PROFILE': 'true'},
+}
+
+def create_writers(count: int) -> list[dict[str, str]]:
+    headers = []
+    with httpx.Client(base_url=f'http://127.0.0.1:{PORT}', timeout=30) as client:
+        for i in range(count):
+            username, password = f'benchwriter{i}', 'benchpassword'
+            client.post('/users/', json={'username': username, 'password': password}).raise_for_status()
+            token = client.post('/auth/token', data={'username': username, 'password': password}).json()
+            headers.append({'Authorization': f'Bearer {token["access_token"]}'})
+    return headers
+
+async def load(duration: float, readers: int, writer_headers: list[dict[str, str]],
+               post_ids: list[str]) -> dict[str, tuple[list[float], int]]:
+    results = {'read': ([], 0), 'write': ([], 0)}
+    deadline = time.monotonic() + duration
+
+    def record(kind: str, started: float, ok: bool) -> None:
+        latencies, errors = results[kind]
+        if ok:
+            latencies.append(time.perf_counter() - started)
+        else:
+            results[kind] = (latencies, errors + 1)
+
+    async def reader(client: httpx.AsyncClient) -> None:
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                response = await client.get('/posts/?limit=20')
+                record('read', started, response.status_code == 200)
+            except httpx.HTTPError:
+                record('read', started, False)
+
+    async def writer(client: httpx.AsyncClient, headers: dict[str, str]) -> None:
+        for post_id in itertools.cycle(post_ids):
+            if time.monotonic() >= deadline:
+                return
+            for method in ('POST', 'DELETE'): # the like is always removed again, so the next run starts clean
+                started = time.perf_counter()
+                try:
+                    response = await client.request(method, f'/posts/{post_id}/like', headers=headers)
+                    record('write', started, response.status_code == 200)
+                except httpx.HTTPError:
+                    record('write', started, False)
+
+    concurrency = readers + len(writer_headers)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{PORT}', limits=limits, timeout=30) as client:
+        await asyncio.gather(*(reader(client) for _ in range(readers)),
+                             *(writer(client, headers) for headers in writer_headers))
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--setup', nargs='+', choices=SETUPS, default=list(SETUPS))
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--readers', type=int, default=32)
+    parser.add_argument('--writers', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--posts', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f'{"setup":<9}{"kind":<7}{"req/s":>8}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"errors":>8}')
+    for setup in args.setup:
+        with tempfile.TemporaryDirectory() as tmp:
+            process = start_server('prod', f'sqlite:///{tmp}/bench.db',
+                                   {**SETUPS[setup], 'WEB_CONCURRENCY': str(args.workers)})
+            try:
+                seed(args.posts)
+                post_ids = [post['id'] for post in httpx.get(f'http://127.0.0.1:{PORT}/posts/?limit=100').json()]
+                writer_headers = create_writers(args.writers)
+                asyncio.run(load(2, args.readers, writer_headers, post_ids)) # warm up
+                results = asyncio.run(load(args.duration, args.readers, writer_headers, post_ids))
+                for kind, (latencies, errors) in results.items():
+                    latencies.sort()
+                    print(f'{setup:<9}{kind:<7}{len(latencies) / args.duration:>8.0f}'
+                          f'{percentile(latencies, 50) * 1000:>10.1f}{percentile(latencies, 95) * 1000:>10.1f}'
+                          f'{percentile(latencies, 99) * 1000:>10.1f}{errors:>8}')
+            finally:
+                stop_server(process)
+
+if __name__ == '__main__':
+    main()
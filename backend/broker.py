@@ -0,0 +1,193 @@
+import asyncio
+import json
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from collections.abc import AsyncIterator, Callable
+from fastapi import Request
+from settings import logger
+
+"""
+broker.py
+
+In-process publish/subscribe broker for real-time events.
+
+Services publish events (dicts) to topics, e.g. 'post:<post_id>' or 'user:<user_id>',
+after their transaction is committed. Each subscriber owns a bounded queue, and events are
+fanned out to every subscriber of the topic.
+
+Backpressure:
+    A slow consumer never blocks publishers or other subscribers. When its queue is full the
+    oldest event is dropped and counted, and the subscriber is told how many events it missed.
+    A subscriber that keeps falling behind (more than MAX_DROPPED_EVENTS dropped) is closed.
+
+Backends:
+    Delivery goes through a BrokerBackend. LocalBackend delivers within the current process;
+    a cross-worker backend only has to implement publish() and call deliver() for events
+    received from other workers.
+
+Usage:
+    await broker.start() / await broker.stop() from the FastAPI lifespan.
+    broker.publish('post:<id>', {'type': 'like', ...}) from any thread.
+    async for chunk in stream_sse(request, 'post:<id>'): ...
+"""
+
+SUBSCRIBER_QUEUE_SIZE = 100
+MAX_DROPPED_EVENTS = 1000
+SSE_HEARTBEAT_SECONDS = 15
+
+Deliver = Callable[[str, dict], None]
+
+class BrokerBackend(ABC):
+    """Transport used by the broker to deliver published events to subscribers"""
+    async def start(self, deliver: Deliver) -> None:
+        self.deliver = deliver
+
+    async def stop(self) -> None:
+        pass
+
+    @abstractmethod
+    def publish(self, topic: str, event: dict) -> None:
+        """Delivers event to the subscribers of topic, in every process sharing the backend"""
+
+class LocalBackend(BrokerBackend):
+    """Delivers events to subscribers in the current process only"""
+    def publish(self, topic: str, event: dict) -> None:
+        self.deliver(topic, event)
+
+class Subscription:
+    """A subscriber to one or more topics, with a bounded queue of pending events"""
+    def __init__(self, broker: "EventBroker", topics: tuple[str, ...], maxsize: int):
+        self.broker = broker
+        self.topics = topics
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, event: dict | None) -> None:
+        """Adds an event to the queue, dropping the oldest event if the subscriber is behind. Must run on the event loop."""
+        if self.closed:
+            return
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            if self.dropped > MAX_DROPPED_EVENTS:
+                logger.warning('Closing slow subscriber', extra={'topics': self.topics, 'dropped': self.dropped})
+                self.close()
+                return
+        self.queue.put_nowait(event)
+
+    def close(self) -> None:
+        """Unsubscribes and wakes up the consumer, which then stops iterating"""
+        if self.closed:
+            return
+        self.broker._unsubscribe(self)
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+        self.closed = True
+
+    async def get(self, timeout: float | None = None) -> dict | None:
+        """Waits for the next event. Returns None when the subscription is closed, raises TimeoutError on timeout"""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def __enter__(self) -> "Subscription":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+class EventBroker:
+    """Topic based pub/sub broker with per-subscriber bounded queues"""
+    def __init__(self, backend: BrokerBackend | None = None):
+        self.backend = backend or LocalBackend()
+        self._subscribers: dict[str, set[Subscription]] = defaultdict(set)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._lock = threading.Lock()
+
+    async def start(self) -> None:
+        """Binds the broker to the running event loop and starts the backend"""
+        self._loop = asyncio.get_running_loop()
+        await self.backend.start(self._deliver)
+        logger.info('Event broker started', extra={'backend': type(self.backend).__name__})
+
+    async def stop(self) -> None:
+        """Stops the backend and closes all subscriptions, ending open event streams"""
+        await self.backend.stop()
+        with self._lock:
+            subscriptions = {sub for subs in self._subscribers.values() for sub in subs}
+        for subscription in subscriptions:
+            subscription.close()
+        self._loop = None
+        logger.info('Event broker stopped')
+
+    def subscribe(self, *topics: str, maxsize: int = SUBSCRIBER_QUEUE_SIZE) -> Subscription:
+        """Subscribes to topics. Use as a context manager to unsubscribe when done"""
+        subscription = Subscription(self, topics, maxsize)
+        with self._lock:
+            for topic in topics:
+                self._subscribers[topic].add(subscription)
+        logger.debug('Subscribed to topics', extra={'topics': topics})
+        return subscription
+
+    def _unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            for topic in subscription.topics:
+                subscribers = self._subscribers.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[topic]
+
+    def publish(self, topic: str, event: dict) -> None:
+        """Publishes an event to a topic. Safe to call from any thread; a no-op if the broker is not started"""
+        if self._loop is None:
+            return
+        try:
+            self.backend.publish(topic, event)
+        except Exception:
+            logger.exception('Failed to publish event', extra={'topic': topic})
+
+    def _deliver(self, topic: str, event: dict) -> None:
+        """Fans an event out to the local subscribers of a topic"""
+        loop = self._loop
+        if loop is None:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers.get(topic, ()))
+        if not subscribers:
+            return
+        event = {'topic': topic, **event}
+        for subscription in subscribers:
+            if _in_loop_thread(loop):
+                subscription.put(event)
+            else:
+                loop.call_soon_threadsafe(subscription.put, event)
+
+def _in_loop_thread(loop: asyncio.AbstractEventLoop) -> bool:
+    try:
+        return asyncio.get_running_loop() is loop
+    except RuntimeError:
+        return False
+
+async def stream_sse(request: Request, *topics: str) -> AsyncIterator[str]:
+    """
+    Subscribes to topics and yields the events formatted as Server-Sent Events.
+    Sends a heartbeat comment while idle, so dead connections are detected.
+    """
+    with broker.subscribe(*topics) as subscription:
+        yield ': connected\n\n'
+        while not await request.is_disconnected():
+            try:
+                event = await subscription.get(timeout=SSE_HEARTBEAT_SECONDS)
+            except TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            if event is None:
+                break
+            if subscription.dropped:
+                yield f'event: lagged\ndata: {json.dumps({"dropped": subscription.dropped})}\n\n'
+                subscription.dropped = 0
+            yield f'event: {event.get("type", "message")}\ndata: {json.dumps(event, default=str)}\n\n'
+
+broker = EventBroker()
@@ -0,0 +1,137 @@
+import hashlib
+import math
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Any
+
+"""
+cache.py
+
+Small in-process caches shared by the services.
+
+- TTLCache:
+    Thread-safe LRU cache where every entry expires ttl seconds after it was stored.
+    Entries live in the memory of one worker process, so a cached value can be stale
+    for up to ttl seconds after another worker changed the underlying data.
+
+- BloomFilter:
+    Compact set membership test without false negatives. A hit can be a false positive (at
+    most error_rate at capacity), so hits have to be confirmed against the exact data.
+
+- HyperLogLog:
+    Estimate of the number of distinct keys added, in 2**precision bytes whatever the number of
+    keys (4 KB at the default precision 12, standard error 1.04 / sqrt(2**12) = 1.6%). Sketches
+    merge by taking the maximum of each register. Merging is idempotent, so a sketch can be
+    merged into another any number of times.
+"""
+
+class TTLCache:
+    """Thread-safe LRU cache with a time-to-live per entry"""
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Returns the cached value of key, or default if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Stores value under key, evicting the least recently used entry when full"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def update(self, key: Hashable, change: Callable[[Any], None]) -> None:
+        """Applies change to the cached value of key in place, if it is cached. Keeps the expiry time."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                change(entry[1])
+
+    def pop(self, key: Hashable) -> None:
+        """Removes key from the cache"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Removes all entries"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class BloomFilter:
+    """Bloom filter of bytes keys, sized for capacity keys at error_rate false positives"""
+    def __init__(self, capacity: int, error_rate: float = 0.01) -> None:
+        capacity = max(capacity, 1)
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hashes = max(round(self.size / capacity * math.log(2)), 1)
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: bytes):
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hashes): # double hashing
+            yield (first + i * second) % self.size
+
+    def add(self, key: bytes) -> None:
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: bytes) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+class HyperLogLog:
+    """HyperLogLog sketch of 2**precision one-byte registers, counting distinct bytes keys"""
+    def __init__(self, precision: int = 12, registers: bytes | None = None) -> None:
+        self.precision = precision
+        self._registers = bytearray(registers) if registers is not None else bytearray(1 << precision)
+
+    def add(self, key: bytes) -> None:
+        value = int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+        width = 64 - self.precision
+        index, rest = value >> width, value & ((1 << width) - 1)
+        rank = width - rest.bit_length() + 1 # position of the first 1 bit after the index bits
+        if rank > self._registers[index]:
+            self._registers[index] = rank
+
+    def merge(self, other: "HyperLogLog") -> None:
+        if other.precision != self.precision:
+            raise ValueError('cannot merge sketches of different precision')
+        self._registers = bytearray(map(max, self._registers, other._registers))
+
+    def count(self) -> int:
+        """Estimated number of distinct keys added"""
+        registers = len(self._registers)
+        alpha = 0.7213 / (1 + 1.079 / registers)
+        estimate = alpha * registers ** 2 / sum(2.0 ** -rank for rank in self._registers)
+        zeros = self._registers.count(0)
+        if estimate <= 2.5 * registers and zeros: # small range correction: linear counting
+            estimate = registers * math.log(registers / zeros)
+        return round(estimate)
+
+    def to_bytes(self) -> bytes:
+        """Compressed sketch, a few bytes for few keys as most registers are 0"""
+        return zlib.compress(bytes([self.precision]) + self._registers)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        raw = zlib.decompress(data)
+        return cls(raw[0], raw[1:])
@@ -0,0 +1,122 @@
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+from pydantic import BaseModel
+from sqlalchemy import BigInteger, Text, cast, delete, exists, func, make_url
+from sqlalchemy.orm import Session, aliased
+from database import SessionLocal
+from models.models import Change
+from settings import get_settings, logger
+from sharding import shard_ids
+
+"""
+changes.py
+
+Change feed (outbox) of users, posts, comments and likes, for consumers syncing incrementally
+instead of re-reading the lists. Served by GET /changes (see change_service.py).
+
+Every mutation in post_service, comment_service and user_service records a change in its own
+transaction (record_change), so an entry exists if and only if the change was committed. An
+entry names the entity, the operation and, for creates and updates, the entity as the API returns
+it. Deletes cascade like the API: a deleted user takes everything the user made (posts, comments,
+likes) with it, a deleted post its comments and likes, a deleted comment its replies. Changes of
+likes_count and comments_count are not recorded, they follow from the like and comment entries.
+
+Ordering:
+    Entries are read in (txid, seq) order. On SQLite writes are serialized, txid is 0 and seq
+    is the commit order. On PostgreSQL sequence values are taken before commit, so a transaction
+    can commit an entry with a lower seq than one already read. There txid is the transaction
+    id and readers only return entries of transactions older than every running transaction
+    (visible_txid_bound), so nothing commits behind a position that was read.
+    With sharding the entries are written to the shard of the transaction (home_shard), each
+    shard has its own sequence and a cursor holds one position per shard.
+
+Retention (ChangeCompactor, every worker process, every CHANGES_COMPACT_INTERVAL_SECONDS):
+    - entries older than changes_compact_after_minutes are deleted if a newer entry of the same
+      entity follows, the newest entry of an entity holds its latest state
+    - entries older than changes_retention_hours are deleted, cursors older than that are
+      refused and the consumer has to sync from scratch
+
+Usage:
+    record_change(session, 'post', post.id, post.owner_id, 'update', PostPublic.model_validate(post))
+    session.commit()
+
+    await change_compactor.start() / await change_compactor.stop() from the FastAPI lifespan.
+"""
+
+settings = get_settings()
+CHANGES_RETENTION = timedelta(hours=settings.changes_retention_hours)
+CHANGES_COMPACT_AFTER = timedelta(minutes=settings.changes_compact_after_minutes)
+CHANGES_COMPACT_INTERVAL_SECONDS = 600
+POSTGRESQL = make_url(settings.database_url).get_backend_name() == 'postgresql'
+
+def _as_bigint(xid8):
+    return cast(cast(xid8, Text), BigInteger)
+
+def visible_txid_bound():
+    """Transaction id below which every transaction has ended (PostgreSQL), entries with a lower txid can be read"""
+    return _as_bigint(func.pg_snapshot_xmin(func.pg_current_snapshot()))
+
+def record_change(session: Session, entity: str, entity_id: UUID, user_id: UUID, op: str,
+                  data: BaseModel | None = None) -> None:
+    """
+    Adds an entry to the change feed in the callers transaction. data is the entity as the API
+    returns it (None for deletes).
+    """
+    session.add(Change(entity=entity, entity_id=entity_id, user_id=user_id, op=op,
+                       data=data.model_dump(mode='json') if data is not None else None,
+                       txid=_as_bigint(func.pg_current_xact_id()) if POSTGRESQL else 0))
+    logger.debug('Change recorded', extra={'entity': entity, 'entity_id': entity_id, 'op': op})
+
+def compact_changes() -> tuple[int, int]:
+    """Deletes superseded and expired entries on every shard, returns how many (compacted, expired)"""
+    now = datetime.now(timezone.utc)
+    newer = aliased(Change)
+    superseded = exists().where(newer.entity == Change.entity, newer.entity_id == Change.entity_id,
+                                newer.user_id == Change.user_id, newer.seq > Change.seq)
+    compacted = expired = 0
+    with SessionLocal() as session:
+        for shard_id in shard_ids():
+            bind_arguments = {'shard_id': shard_id}
+            compacted += session.execute(
+                delete(Change).where(Change.created_at < now - CHANGES_COMPACT_AFTER, superseded)
+                .execution_options(synchronize_session=False), bind_arguments=bind_arguments,
+            ).rowcount
+            expired += session.execute(
+                delete(Change).where(Change.created_at < now - CHANGES_RETENTION)
+                .execution_options(synchronize_session=False), bind_arguments=bind_arguments,
+            ).rowcount
+            session.commit()
+    logger.info('Change feed compacted', extra={'compacted': compacted, 'expired': expired})
+    return compacted, expired
+
+class ChangeCompactor:
+    """Runs compact_changes periodically in this process"""
+    def __init__(self, interval_seconds: float) -> None:
+        self.interval_seconds = interval_seconds
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run())
+        logger.info('Change compactor started', extra={'interval_seconds': self.interval_seconds})
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        self._task = None
+        logger.info('Change compactor stopped')
+
+    async def _run(self) -> None:
+        while True:
+            # jitter, so the worker processes don't all compact at the same time
+            await asyncio.sleep(self.interval_seconds * random.uniform(0.5, 1.5))
+            try:
+                await asyncio.to_thread(compact_changes)
+            except Exception:
+                logger.exception('Compacting the change feed failed')
+
+change_compactor = ChangeCompactor(CHANGES_COMPACT_INTERVAL_SECONDS)
@@ -1,6 +1,15 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
-from settings import get_settings
+import re
+import sys
+import threading
+import time
+from sqlalchemy import Engine, create_engine, event, make_url
+from sqlalchemy.ext.horizontal_shard import ShardedSession
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from sqlalchemy.sql import Select
+from settings import get_settings, logger
+from profiling import current_profile
+from tracing import SPAN_KIND_CLIENT, record_span, recording
+from sharding import SHARDED, execute_chooser, identity_chooser, shard_chooser
 
 """
 database.py
@@ -8,20 +17,129 @@ database.py
 Provides the SQLAlchemy database configuration for the application.
 
 Responsibilities:
-- Configure the SQLAlchemy engine (based on DATABASE_URL from settings)
+- Configure the SQLAlchemy engine (based on DATABASE_URL from settings), and the engines of the
+  other shards (SHARD_URLS) with ShardSession routing between them (see sharding.py)
 - Define the declarative base class for ORM models
-- Provide a session factory (SessionLocal) for database access
-- Expose a dependency function (get_session) for FastAPI routes
+- Provide session factories for database access: SessionLocal, and ReadSessionLocal for sessions
+  that only read
+- Expose dependency functions (get_session, get_read_session) for FastAPI routes
+- Configure SQLite file databases for concurrent use (sqlite_profile setting)
+- Warm up the connection pool on startup (warm_up_connection_pool)
+- Log slow statements (slower than slow_query_ms) with their normalized SQL, parameter shape,
+  calling service function and duration, optionally with the query plan on first occurrence
+- Record statement durations of requests run under the profiler (profiling.py)
+- Record a span per statement of traced requests (tracing.py)
+
+SQLite profile:
+    By default every SQLite connection uses a rollback journal, so readers wait for writers,
+    and concurrent writers fail with 'database is locked' when their lock upgrades collide.
+    With the profile:
+    - the database runs in WAL mode with synchronous=NORMAL, so readers never block the writer
+      or each other and a commit does not wait for fsync (durable at the next checkpoint)
+    - busy_timeout makes a connection wait for the write lock instead of failing
+    - mmap_size and cache_size keep hot pages in memory
+    - writes go through a single connection per process (engine) whose transactions start
+      with BEGIN IMMEDIATE, so writers queue for the pool and the database write lock up
+      front instead of failing on the upgrade from a read lock
+    - reads go through a pool of query_only connections (read_engine), used by ReadSessionLocal
+    - SessionLocal sessions (SQLiteProfileSession) read from the read pool until their transaction
+      writes, so the writer connection and the write lock are held from the first write to the
+      commit only, not for the whole request. Like READ COMMITTED on PostgreSQL, rows read before
+      the first write may have been changed by a concurrent transaction by the time it writes.
+    For other databases read_engine is engine.
+    With sharding every shard has its own writer and read pool.
 """
 settings = get_settings()
 
-#sqlite_file_name = "database.db"
-#sqlite_url = f"sqlite:///{sqlite_file_name}"
+SQLITE_WRITER_POOL_TIMEOUT = 30
+
+def _is_sqlite_file(database_url: str) -> bool:
+    url = make_url(database_url)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+def _configure_sqlite(dbapi_connection, read_only: bool) -> None:
+    """Pragmas of the SQLite profile, run on every new connection"""
+    dbapi_connection.isolation_level = None # transactions are started by the begin listeners
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL') # persistent, a no-op once the database is in WAL mode
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f'PRAGMA busy_timeout={settings.sqlite_busy_timeout_ms:d}')
+    cursor.execute(f'PRAGMA mmap_size={settings.sqlite_mmap_size_mb * 1024 * 1024:d}')
+    cursor.execute(f'PRAGMA cache_size=-{settings.sqlite_cache_size_mb * 1024:d}') # negative means KiB
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    if read_only:
+        cursor.execute('PRAGMA query_only=ON')
+    cursor.close()
+
+def create_engines(database_url: str, sqlite_profile: bool) -> tuple[Engine, Engine]:
+    """Engine for sessions that write and engine for read-only sessions, the same engine unless the SQLite profile applies"""
+    if not (sqlite_profile and _is_sqlite_file(database_url)):
+        engine = create_engine(database_url)
+        return engine, engine
+    connect_args = {'check_same_thread': False, 'timeout': settings.sqlite_busy_timeout_ms / 1000}
+    writer = create_engine(database_url, connect_args=connect_args,
+                           pool_size=1, max_overflow=0, pool_timeout=SQLITE_WRITER_POOL_TIMEOUT)
+    # a request can use two read connections (the auth dependency and a SessionLocal read), a bounded
+    # pool could deadlock, so connections beyond the pool size are opened on demand (they are cheap)
+    reader = create_engine(database_url, connect_args=connect_args,
+                           pool_size=settings.sqlite_read_pool_size, max_overflow=-1)
+    event.listen(writer, 'connect', lambda dbapi_connection, _: _configure_sqlite(dbapi_connection, read_only=False))
+    event.listen(writer, 'begin', lambda connection: connection.exec_driver_sql('BEGIN IMMEDIATE'))
+    event.listen(reader, 'connect', lambda dbapi_connection, _: _configure_sqlite(dbapi_connection, read_only=True))
+    event.listen(reader, 'begin', lambda connection: connection.exec_driver_sql('BEGIN'))
+    return writer, reader
+
+class SQLiteProfileSession(Session):
+    """Session using the read pool for plain SELECTs until its transaction writes, then the writer connection"""
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if not self.info.get('writing') and isinstance(clause, Select) and clause._for_update_arg is None:
+            return read_engine
+        self.info['writing'] = True
+        return engine
+
+@event.listens_for(SQLiteProfileSession, 'after_transaction_end')
+def _end_writing(session: Session, transaction) -> None:
+    if transaction.parent is None:
+        session.info.pop('writing', None)
+
+# (engine, read_engine) per shard, shard 0 is database_url
+shard_engines = [create_engines(url, settings.sqlite_profile) for url in [settings.database_url, *settings.shard_urls]]
+engine, read_engine = shard_engines[0]
 
-#connect_args = {"check_same_thread": False}
-engine = create_engine(settings.database_url)
+class ShardSession(ShardedSession):
+    """
+    Session routing every statement to its shard (see sharding.py). On each shard it reads like
+    SQLiteProfileSession, from the read engine until the transaction writes to that shard.
+    Sessions created with read_only=True always use the read engines.
+    """
+    def __init__(self, read_only: bool = False, **kw):
+        super().__init__(shard_chooser=shard_chooser, identity_chooser=identity_chooser,
+                         execute_chooser=execute_chooser, **kw)
+        self.read_only = read_only
+
+    def get_bind(self, mapper=None, *, shard_id=None, instance=None, clause=None, **kw):
+        if shard_id is None:
+            shard_id = self._choose_shard_and_assign(mapper, instance, clause=clause)
+        writer, reader = shard_engines[shard_id]
+        writing = self.info.setdefault('writing_shards', set())
+        if self.read_only or (shard_id not in writing and isinstance(clause, Select) and clause._for_update_arg is None):
+            return reader
+        writing.add(shard_id)
+        return writer
+
+@event.listens_for(ShardSession, 'after_transaction_end')
+def _end_shard_transaction(session: Session, transaction) -> None:
+    if transaction.parent is None:
+        session.info.pop('writing_shards', None)
+        session.info.pop('home_shard', None)
 
-SessionLocal = sessionmaker(autoflush=False, autocommit=False, bind=engine)
+if SHARDED:
+    SessionLocal = sessionmaker(autoflush=False, autocommit=False, class_=ShardSession)
+    ReadSessionLocal = sessionmaker(autoflush=False, autocommit=False, class_=ShardSession, read_only=True)
+else:
+    SessionLocal = sessionmaker(autoflush=False, autocommit=False, bind=engine,
+                                class_=SQLiteProfileSession if read_engine is not engine else Session)
+    ReadSessionLocal = sessionmaker(autoflush=False, autocommit=False, bind=read_engine)
 
 Base = declarative_base()
 
@@ -39,3 +157,119 @@ def get_session():
     """
     with SessionLocal() as session:
         yield session
+
+def get_read_session():
+    """
+    Dependency that provides a database session for routes that only read.
+    With the SQLite profile it uses the read-only connection pool, so reads don't wait for the writer.
+    """
+    with ReadSessionLocal() as session:
+        yield session
+
+
+def warm_up_connection_pool() -> None:
+    """
+    Opens connections up to the pool size and returns them to the pool,
+    so the first requests after startup don't pay for connecting.
+    """
+    for pool_engine in {pool_engine for engines in shard_engines for pool_engine in engines}:
+        size = pool_engine.pool.size() if hasattr(pool_engine.pool, 'size') else 1
+        connections = [pool_engine.connect() for _ in range(size)]
+        for connection in connections:
+            connection.exec_driver_sql('SELECT 1')
+            connection.close()
+
+SLOW_QUERY_SECONDS = settings.slow_query_ms / 1000
+MAX_EXPLAINED_STATEMENTS = 1000
+_explained_statements: set[str] = set()
+_explained_lock = threading.Lock()
+
+def normalize_sql(statement: str) -> str:
+    """Collapses whitespace, inlined literals and expanded IN lists, so equal queries log the same SQL"""
+    statement = re.sub(r"'(?:[^']|'')*'", '?', statement)
+    statement = re.sub(r'\b\d+(?:\.\d+)?\b', '?', statement)
+    statement = re.sub(r'\(\s*(?:(?:\?|%s|%\(\w+\)s|:\w+)\s*,\s*)+(?:\?|%s|%\(\w+\)s|:\w+)\s*\)', '(...)', statement)
+    return ' '.join(statement.split())
+
+def parameter_shape(parameters, executemany: bool) -> str | list | dict:
+    """Describes the parameters by type instead of value, values may contain personal data"""
+    if executemany:
+        return f'{len(parameters)} x {parameter_shape(parameters[0], False)}' if parameters else '0 x ()'
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+def _calling_function() -> str | None:
+    """Name of the innermost service/router/job function on the stack"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if module.startswith(('services.', 'routers.', 'jobs', 'main')):
+            return f'{module}.{frame.f_code.co_name}'
+        frame = frame.f_back
+    return None
+
+def _explain(conn, cursor, statement: str, parameters) -> list[str] | str:
+    """Query plan of a statement, without executing it"""
+    postgresql = conn.dialect.name == 'postgresql'
+    prefix = 'EXPLAIN (ANALYZE off) ' if postgresql else 'EXPLAIN QUERY PLAN '
+    explain_cursor = cursor.connection.cursor()
+    try:
+        # runs in the transaction of the statement: on PostgreSQL a failing EXPLAIN would abort it,
+        # the savepoint confines the failure to the EXPLAIN
+        if postgresql:
+            explain_cursor.execute('SAVEPOINT slow_query_explain')
+        try:
+            explain_cursor.execute(prefix + statement, parameters)
+            plan = [' '.join(str(column) for column in row) for row in explain_cursor.fetchall()]
+        except Exception:
+            if postgresql:
+                explain_cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+            raise
+        if postgresql:
+            explain_cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+        return plan
+    except Exception as exc:
+        return f'EXPLAIN failed: {exc!r}'
+    finally:
+        explain_cursor.close()
+
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    # one value per connection: a statement that fails never reaches after_cursor_execute,
+    # the next statement overwrites its start time
+    conn.info['query_start_time'] = time.perf_counter()
+
+def _log_slow_query(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('query_start_time', None)
+    if started is None:
+        return
+    duration = time.perf_counter() - started
+    profile = current_profile.get()
+    if profile is not None:
+        profile.record_query(_calling_function(), duration)
+    if recording():
+        record_span(statement.split(None, 1)[0].upper() if statement.strip() else 'SQL', duration,
+                    {'db.system': conn.dialect.name, 'db.statement': normalize_sql(statement)}, SPAN_KIND_CLIENT)
+    if not SLOW_QUERY_SECONDS or duration < SLOW_QUERY_SECONDS:
+        return
+    sql = normalize_sql(statement)
+    extra = {
+        'sql': sql,
+        'parameters': parameter_shape(parameters, executemany),
+        'caller': _calling_function(),
+        'duration_ms': round(duration * 1000, 1),
+    }
+    if settings.slow_query_explain and not executemany:
+        with _explained_lock:
+            first = sql not in _explained_statements and len(_explained_statements) < MAX_EXPLAINED_STATEMENTS
+            if first:
+                _explained_statements.add(sql)
+        if first:
+            extra['plan'] = _explain(conn, cursor, statement, parameters)
+    logger.warning('Slow query', extra=extra)
+
+for _engine in {shard_engine for engines in shard_engines for shard_engine in engines}:
+    event.listen(_engine, 'before_cursor_execute', _start_query_timer)
+    event.listen(_engine, 'after_cursor_execute', _log_slow_query)
@@ -2,7 +2,7 @@ from settings import Settings, get_settings
 from typing import Annotated
 from fastapi import Depends
 from sqlalchemy.orm import Session
-from database import get_session
+from database import get_session, get_read_session
 
 """
 dependencies.py
@@ -16,6 +16,13 @@ Defines common dependency injection types used across the application.
 - SessionDep:
     Injects a SQLAlchemy Session (from get_session) into routes and services.
     The session is automatically closed after the request.
+    Session calls are blocking, so routes using it are defined with `def` (not `async def`)
+    and run in FastAPI's threadpool instead of on the event loop.
+
+- ReadSessionDep:
+    Injects a SQLAlchemy Session (from get_read_session) into routes and dependencies that only read.
+    With the SQLite profile (see database.py) its connections are read-only.
 """
 SettingsDep = Annotated[Settings, Depends(get_settings)]
-SessionDep = Annotated[Session, Depends(get_session)]
\ No newline at end of file
+SessionDep = Annotated[Session, Depends(get_session)]
+ReadSessionDep = Annotated[Session, Depends(get_read_session)]
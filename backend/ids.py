@@ -0,0 +1,66 @@
+import os
+import time
+from uuid import UUID
+from sqlalchemy import Dialect, LargeBinary, Uuid
+from sqlalchemy.types import TypeDecorator, TypeEngine
+
+"""
+ids.py
+
+Primary keys of the models: time-ordered UUIDs, stored in 16 bytes.
+
+uuid7:
+    Random UUIDv4 keys insert at a random position of the primary key index (and of every
+    index on a column referencing it), so each insert touches another page: page splits,
+    half-empty pages and a working set as large as the index. UUIDv7 (RFC 9562) starts with
+    the unix time in milliseconds, so new rows go to the right edge of the index like an
+    autoincrement key, while ids stay unguessable (74 random bits) and can be created
+    without the database. Ids made in the same millisecond are in random order.
+    With sharding, new_id (sharding.py) makes UUIDv8 ids with the same time prefix and the
+    bucket of the row in the lowest bits.
+
+BinaryUUID:
+    The Uuid type stores UUIDs as 32 hex characters on SQLite. BinaryUUID stores the 16 raw
+    bytes instead, on other databases it is the native UUID type. Blobs sort like the hex
+    strings, so orderings by id don't change. SQLite stores a blob as is whatever the declared
+    type of the column is, the columns keep the CHAR(32) of the migrations, migration
+    a9d3f6b2c7e1 converts the existing values.
+
+Usage:
+    id: Mapped[uuid.UUID] = mapped_column(BinaryUUID, primary_key=True, default=uuid7)
+"""
+
+def time_ordered_uuid(version: int, low_bits: int = 0, low_bits_width: int = 0) -> UUID:
+    """
+    UUID of version (7, or 8 for custom layouts) starting with the unix time in milliseconds,
+    random otherwise except for the low_bits_width lowest bits, set to low_bits
+    """
+    value = time.time_ns() // 1_000_000 << 80 | int.from_bytes(os.urandom(10), 'big')
+    value = value & ~(0xf << 76) | version << 76 # version
+    value = value & ~(0x3 << 62) | 0x2 << 62 # RFC 9562 variant
+    mask = (1 << low_bits_width) - 1
+    return UUID(int=value & ~mask | low_bits & mask)
+
+def uuid7() -> UUID:
+    """Time-ordered UUIDv7, the default primary key of the models"""
+    return time_ordered_uuid(7)
+
+class BinaryUUID(TypeDecorator):
+    """UUID column stored in 16 bytes: a blob on SQLite, the native UUID type elsewhere"""
+    impl = Uuid
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect: Dialect) -> TypeEngine:
+        if dialect.name == 'sqlite':
+            return dialect.type_descriptor(LargeBinary(16))
+        return dialect.type_descriptor(Uuid())
+
+    def process_bind_param(self, value, dialect: Dialect):
+        if value is None or dialect.name != 'sqlite':
+            return value
+        return (value if isinstance(value, UUID) else UUID(str(value))).bytes
+
+    def process_result_value(self, value, dialect: Dialect):
+        if value is None or dialect.name != 'sqlite':
+            return value
+        return UUID(bytes=value)
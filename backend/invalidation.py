@@ -0,0 +1,240 @@
+import asyncio
+import hashlib
+import json
+import os
+import pathlib
+import socket
+import tempfile
+import uuid
+from collections.abc import Callable, Hashable
+from typing import Any
+from sqlalchemy import text
+from database import engine
+from settings import get_settings, logger
+
+"""
+invalidation.py
+
+Cross-worker cache invalidation bus.
+
+Per-process caches (see cache.py) go stale when another worker process handles a write.
+Write paths publish the cache key they changed, and every worker process evicts that key
+from its own cache as soon as the message arrives.
+
+Transports:
+    - PostgresTransport: LISTEN/NOTIFY on the application database. The listening connection
+      is watched by the event loop, so messages are handled without polling.
+    - SocketTransport (SQLite, tests): every process binds a Unix datagram socket in a directory
+      shared by all processes using the same database, and sends messages to all sockets there.
+    On platforms without Unix sockets only the local process is invalidated.
+
+Delivery is best-effort: a worker that misses messages (e.g. while reconnecting) clears all its
+registered caches. Caches must still have a TTL, which bounds staleness if a message is lost.
+
+Usage:
+    invalidation_bus.register('recent_likes', recent_likes_cache, key_type=UUID)
+    invalidation_bus.invalidate('recent_likes', user_id)  # evict here and on all other workers
+    invalidation_bus.publish('recent_likes', user_id)     # evict on all other workers only
+    await invalidation_bus.start() / await invalidation_bus.stop() from the FastAPI lifespan.
+"""
+
+INVALIDATION_CHANNEL = 'cache_invalidation'
+RECONNECT_SECONDS = 1.0
+
+Receive = Callable[[str], None]
+
+class Transport:
+    """Broadcasts messages (str) to the invalidation buses of all worker processes"""
+    async def start(self, receive: Receive) -> None:
+        self.receive = receive
+
+    async def stop(self) -> None:
+        pass
+
+    def send(self, message: str) -> None:
+        pass
+
+class PostgresTransport(Transport):
+    """Sends with NOTIFY on a pooled connection, receives with LISTEN on a dedicated connection"""
+    def __init__(self) -> None:
+        self._connection = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self.on_reconnect: Callable[[], None] = lambda: None
+
+    async def start(self, receive: Receive) -> None:
+        await super().start(receive)
+        self._loop = asyncio.get_running_loop()
+        self._listen()
+
+    def _listen(self) -> None:
+        proxy = engine.raw_connection()
+        proxy.detach() # owned by the transport, never returned to the pool
+        connection = proxy.driver_connection
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(f'LISTEN {INVALIDATION_CHANNEL}')
+        self._connection = connection
+        self._loop.add_reader(connection.fileno(), self._on_readable)
+
+    def _on_readable(self) -> None:
+        connection = self._connection
+        try:
+            connection.poll()
+        except Exception:
+            logger.exception('Invalidation listener connection lost')
+            self._close()
+            self._loop.call_later(RECONNECT_SECONDS, self._reconnect)
+            return
+        while connection.notifies:
+            self.receive(connection.notifies.pop(0).payload)
+
+    def _reconnect(self) -> None:
+        if self._loop is None:
+            return
+        try:
+            self._listen()
+        except Exception:
+            logger.warning('Invalidation listener reconnect failed', exc_info=True)
+            self._loop.call_later(RECONNECT_SECONDS, self._reconnect)
+            return
+        self.on_reconnect() # messages sent while disconnected are lost
+
+    def _close(self) -> None:
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            if self._loop is not None:
+                self._loop.remove_reader(connection.fileno())
+            connection.close()
+
+    async def stop(self) -> None:
+        self._close()
+        self._loop = None
+
+    def send(self, message: str) -> None:
+        with engine.connect() as connection:
+            connection.execute(text('SELECT pg_notify(:channel, :message)'), {'channel': INVALIDATION_CHANNEL, 'message': message})
+            connection.commit()
+
+class SocketTransport(Transport):
+    """Unix datagram socket per process in a directory shared by all processes of the same database"""
+    def __init__(self, directory: pathlib.Path) -> None:
+        self.directory = directory
+        self.path = directory / f'{os.getpid()}-{uuid.uuid4().hex[:8]}.sock'
+        self._socket: socket.socket | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    async def start(self, receive: Receive) -> None:
+        await super().start(receive)
+        self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(str(self.path))
+        sock.setblocking(False)
+        self._socket = sock
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(sock.fileno(), self._on_readable)
+
+    def _on_readable(self) -> None:
+        while True:
+            try:
+                message = self._socket.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                return
+            self.receive(message.decode())
+
+    async def stop(self) -> None:
+        if self._socket is not None:
+            self._loop.remove_reader(self._socket.fileno())
+            self._socket.close()
+            self._socket = None
+            self.path.unlink(missing_ok=True)
+        self._loop = None
+
+    def send(self, message: str) -> None:
+        data = message.encode()
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.setblocking(False)
+            for path in self.directory.glob('*.sock'):
+                if path == self.path:
+                    continue
+                try:
+                    sock.sendto(data, str(path))
+                except (ConnectionRefusedError, FileNotFoundError):
+                    path.unlink(missing_ok=True) # socket of a process that exited without cleaning up
+                except BlockingIOError:
+                    logger.warning('Invalidation message dropped, receiver is behind', extra={'receiver': path.name})
+
+def _default_transport() -> Transport:
+    if engine.dialect.name == 'postgresql':
+        return PostgresTransport()
+    if hasattr(socket, 'AF_UNIX'):
+        settings = get_settings()
+        database = hashlib.sha1(settings.database_url.encode()).hexdigest()[:12]
+        return SocketTransport(pathlib.Path(tempfile.gettempdir()) / f'{settings.app_name}-invalidation-{database}')
+    return Transport()
+
+class InvalidationBus:
+    """Evicts keys from the registered caches of every worker process"""
+    def __init__(self) -> None:
+        self.origin = uuid.uuid4().hex
+        self.transport: Transport | None = None
+        self._caches: dict[str, tuple[Any, Callable[[str], Hashable]]] = {}
+
+    def register(self, namespace: str, cache, key_type: Callable[[str], Hashable] = str) -> None:
+        """Registers a cache (with pop(key) and clear()), key_type converts keys back from str"""
+        self._caches[namespace] = (cache, key_type)
+
+    async def start(self, transport: Transport | None = None) -> None:
+        self.transport = transport or _default_transport()
+        if isinstance(self.transport, PostgresTransport):
+            self.transport.on_reconnect = self._clear_all
+        await self.transport.start(self._receive)
+        logger.info('Invalidation bus started', extra={'transport': type(self.transport).__name__})
+
+    async def stop(self) -> None:
+        if self.transport is not None:
+            await self.transport.stop()
+            self.transport = None
+        logger.info('Invalidation bus stopped')
+
+    def invalidate(self, namespace: str, key: Hashable | None = None) -> None:
+        """Evicts key (all keys if None) from the cache of namespace in this and all other worker processes"""
+        self._evict(namespace, key)
+        self.publish(namespace, key)
+
+    def publish(self, namespace: str, key: Hashable | None = None) -> None:
+        """Evicts key (all keys if None) from the cache of namespace in all other worker processes. Safe to call from any thread"""
+        if self.transport is None:
+            return
+        message = json.dumps({'origin': self.origin, 'namespace': namespace, 'key': None if key is None else str(key)})
+        try:
+            self.transport.send(message)
+        except Exception:
+            logger.exception('Failed to publish invalidation', extra={'namespace': namespace})
+
+    def _receive(self, message: str) -> None:
+        try:
+            payload = json.loads(message)
+        except ValueError:
+            logger.warning('Malformed invalidation message', extra={'invalidation_message': message[:200]})
+            return
+        if payload.get('origin') == self.origin:
+            return
+        namespace, key = payload.get('namespace'), payload.get('key')
+        if namespace not in self._caches:
+            return
+        _, key_type = self._caches[namespace]
+        self._evict(namespace, None if key is None else key_type(key))
+
+    def _evict(self, namespace: str, key: Hashable | None) -> None:
+        cache, _ = self._caches[namespace]
+        if key is None:
+            cache.clear()
+        else:
+            cache.pop(key)
+        logger.debug('Cache key invalidated', extra={'namespace': namespace, 'key': key})
+
+    def _clear_all(self) -> None:
+        for cache, _ in self._caches.values():
+            cache.clear()
+
+invalidation_bus = InvalidationBus()
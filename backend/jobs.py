@@ -0,0 +1,322 @@
+import asyncio
+import os
+import random
+import socket
+import threading
+import time
+from collections.abc import Callable
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple
+from uuid import UUID
+from sqlalchemy import and_, delete, event, or_, select, tuple_, update
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models.models import Job
+from settings import get_settings, logger
+from sharding import shard_ids
+
+"""
+jobs.py
+
+Durable background job queue backed by the jobs table.
+
+Jobs are enqueued in the caller's transaction, so a job exists if and only if the change that
+needs it was committed, and it survives restarts. Worker coroutines, started from the FastAPI
+lifespan, claim jobs and run the registered handlers in a thread.
+
+Claiming:
+    UPDATE jobs SET status = 'running' ... WHERE id IN (SELECT id ... FOR UPDATE SKIP LOCKED)
+    RETURNING ...
+    On PostgreSQL concurrent workers skip each other's rows. SQLite has no row locks, there the
+    single statement runs under the database write lock, which has the same effect.
+    When sharded, jobs are stored on the shard of the transaction enqueuing them, workers claim
+    from one shard after the other, starting at a random one.
+
+Delivery is at-least-once: a job whose worker died is claimed again once its lease
+(JOB_LEASE_SECONDS) expires, so handlers must be idempotent. A worker finishing a job after it
+was claimed again leaves it to the new claim (claims are told apart by attempts). Failed attempts
+are retried with exponential backoff and jitter, after max_attempts the job is kept with status
+'failed'. Jobs that succeed are deleted.
+
+Queues:
+    Each queue in JOB_QUEUES has its own number of worker coroutines per process (concurrency)
+    and number of jobs claimed at once (batch_size). Handlers registered with batch=True get
+    the payloads of all claimed jobs of the same name in one call.
+
+Usage:
+    @job('purge_user', queue='default')
+    def purge_user_job(user_id: str): ...
+
+    enqueue(session, 'purge_user', {'user_id': str(user_id)})
+    session.commit()  # local workers are woken up after the commit
+
+    await job_runner.start() / await job_runner.stop() from the FastAPI lifespan.
+"""
+
+class QueueConfig(NamedTuple):
+    concurrency: int
+    batch_size: int
+
+JOB_QUEUES = {
+    'default': QueueConfig(concurrency=2, batch_size=1),
+    'notifications': QueueConfig(concurrency=1, batch_size=500),
+    'media': QueueConfig(concurrency=get_settings().thumbnail_processes, batch_size=1),
+}
+JOB_POLL_SECONDS = 1.0
+JOB_LEASE_SECONDS = 300
+JOB_BACKOFF_SECONDS = 2
+JOB_MAX_BACKOFF_SECONDS = 600
+
+class JobHandler(NamedTuple):
+    func: Callable
+    queue: str
+    max_attempts: int
+    batch: bool
+
+class ClaimedJob(NamedTuple):
+    id: UUID
+    name: str
+    payload: dict
+    attempts: int
+    max_attempts: int
+    run_at: datetime
+    started_at: datetime
+    shard_id: int | None = None
+
+_handlers: dict[str, JobHandler] = {}
+
+def job(name: str, queue: str = 'default', max_attempts: int = 5, batch: bool = False):
+    """Registers the decorated function as handler of jobs named name"""
+    if queue not in JOB_QUEUES:
+        raise ValueError(f'Unknown job queue {queue}')
+    def register(func: Callable) -> Callable:
+        _handlers[name] = JobHandler(func, queue, max_attempts, batch)
+        return func
+    return register
+
+def enqueue(session: Session, name: str, payload: dict | None = None, delay: float = 0) -> Job:
+    """Adds a job to the callers transaction, it becomes visible to workers when the caller commits"""
+    handler = _handlers[name]
+    db_job = Job(queue=handler.queue, name=name, payload=payload or {}, max_attempts=handler.max_attempts,
+                 run_at=datetime.now(timezone.utc) + timedelta(seconds=delay))
+    session.add(db_job)
+    session.info.setdefault('enqueued_job_queues', set()).add(handler.queue)
+    logger.debug('Job enqueued', extra={'job': name, 'queue': handler.queue})
+    return db_job
+
+@event.listens_for(Session, 'after_commit')
+def _wake_workers_after_commit(session: Session) -> None:
+    for queue in session.info.pop('enqueued_job_queues', ()):
+        job_runner.wake(queue)
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_enqueued_after_rollback(session: Session) -> None:
+    session.info.pop('enqueued_job_queues', None)
+
+def _as_utc(value: datetime) -> datetime:
+    """SQLite returns naive datetimes (stored as UTC)"""
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+def claim_jobs(queue: str, limit: int) -> list[ClaimedJob]:
+    """Claims up to limit runnable jobs of a queue: pending and due, or running with an expired lease"""
+    now = datetime.now(timezone.utc)
+    claimable = (
+        select(Job.id)
+        .where(Job.queue == queue, or_(
+            and_(Job.status == 'pending', Job.run_at <= now),
+            and_(Job.status == 'running', Job.started_at < now - timedelta(seconds=JOB_LEASE_SECONDS)),
+        ))
+        .order_by(Job.run_at)
+        .with_for_update(skip_locked=True)
+    )
+    stmt = (
+        update(Job)
+        .values(status='running', attempts=Job.attempts + 1, started_at=now)
+        .returning(Job.id, Job.name, Job.payload, Job.attempts, Job.max_attempts, Job.run_at, Job.started_at)
+        .execution_options(synchronize_session=False)
+    )
+    shards = shard_ids()
+    start = random.randrange(len(shards))
+    claimed: list[ClaimedJob] = []
+    with SessionLocal() as session:
+        for shard_id in shards[start:] + shards[:start]:
+            if len(claimed) >= limit:
+                break
+            rows = session.execute(stmt.where(Job.id.in_(claimable.limit(limit - len(claimed)))),
+                                   bind_arguments={'shard_id': shard_id}).all()
+            session.commit() # one shard at a time, workers starting at other shards must not wait for each other
+            claimed.extend(ClaimedJob(*row, shard_id=shard_id) for row in rows)
+    return claimed
+
+def _finish_jobs(jobs: list[ClaimedJob], handler: JobHandler | None, error: BaseException | None) -> set[UUID]:
+    """
+    Deletes succeeded jobs, schedules a retry of failed ones or marks them failed. Returns the ids of
+    the jobs left alone because they were claimed again after their lease expired.
+    """
+    by_shard: dict[int | None, list[ClaimedJob]] = {}
+    for claimed in jobs:
+        by_shard.setdefault(claimed.shard_id, []).append(claimed)
+    stale: set[UUID] = set()
+    with SessionLocal() as session:
+        for shard_id, shard_jobs in by_shard.items():
+            bind_arguments = {'shard_id': shard_id}
+            # attempts fences the claim: a new claim increments it, the finished one no longer matches
+            if error is None:
+                deleted = session.execute(
+                    delete(Job).where(tuple_(Job.id, Job.attempts).in_([(claimed.id, claimed.attempts) for claimed in shard_jobs]))
+                    .returning(Job.id),
+                    bind_arguments=bind_arguments,
+                ).scalars().all()
+                stale.update({claimed.id for claimed in shard_jobs} - set(deleted))
+                continue
+            now = datetime.now(timezone.utc)
+            for claimed in shard_jobs:
+                if handler is None or claimed.attempts >= claimed.max_attempts:
+                    values = {'status': 'failed'}
+                else:
+                    backoff = min(JOB_BACKOFF_SECONDS * 2 ** (claimed.attempts - 1), JOB_MAX_BACKOFF_SECONDS)
+                    values = {'status': 'pending', 'run_at': now + timedelta(seconds=backoff * random.uniform(0.5, 1.5))}
+                updated = session.execute(
+                    update(Job).where(Job.id == claimed.id, Job.attempts == claimed.attempts)
+                    .values(last_error=repr(error)[:2000], **values),
+                    bind_arguments=bind_arguments,
+                ).rowcount
+                if not updated:
+                    stale.add(claimed.id)
+        session.commit()
+    if stale:
+        logger.warning('Jobs finished after they were claimed again, result dropped',
+                       extra={'job': jobs[0].name, 'jobs': [str(job_id) for job_id in stale]})
+    return stale
+
+class QueueMetrics:
+    """Counters of the jobs processed by the workers of one queue in this process"""
+    def __init__(self) -> None:
+        self.succeeded = 0
+        self.retried = 0
+        self.failed = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.run_seconds_total = 0.0
+        self.run_seconds_max = 0.0
+
+    def as_dict(self) -> dict:
+        processed = self.succeeded + self.retried + self.failed
+        return {
+            'succeeded': self.succeeded,
+            'retried': self.retried,
+            'failed': self.failed,
+            'wait_seconds_avg': round(self.wait_seconds_total / processed, 3) if processed else 0.0,
+            'wait_seconds_max': round(self.wait_seconds_max, 3),
+            'run_seconds_avg': round(self.run_seconds_total / processed, 3) if processed else 0.0,
+            'run_seconds_max': round(self.run_seconds_max, 3),
+        }
+
+class JobRunner:
+    """Runs the worker coroutines of every queue in this process"""
+    def __init__(self, queues: dict[str, QueueConfig]) -> None:
+        self.queues = queues
+        self.metrics = {queue: QueueMetrics() for queue in queues}
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self._metrics_lock = threading.Lock()
+        self._wakeups: dict[str, asyncio.Event] = {}
+        self._tasks: list[asyncio.Task] = []
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._stopping = False
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._stopping = False
+        for queue, config in self.queues.items():
+            self._wakeups[queue] = asyncio.Event()
+            for _ in range(config.concurrency):
+                self._tasks.append(asyncio.create_task(self._work(queue, config)))
+        logger.info('Job workers started', extra={'worker_id': self.worker_id, 'queues': {queue: config.concurrency for queue, config in self.queues.items()}})
+
+    async def stop(self, timeout: float = 20) -> None:
+        """Stops claiming jobs and waits up to timeout seconds for running jobs to finish"""
+        if not self._tasks:
+            return
+        self._stopping = True
+        for wakeup in self._wakeups.values():
+            wakeup.set()
+        _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending: # unfinished jobs are claimed again once their lease expires
+            task.cancel()
+        self._tasks.clear()
+        self._loop = None
+        logger.info('Job workers stopped', extra={'worker_id': self.worker_id, 'unfinished': len(pending)})
+
+    def wake(self, queue: str) -> None:
+        """Lets the idle workers of queue look for jobs now instead of at the next poll, safe to call from any thread"""
+        loop = self._loop
+        wakeup = self._wakeups.get(queue)
+        if loop is not None and wakeup is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(wakeup.set)
+
+    async def _work(self, queue: str, config: QueueConfig) -> None:
+        wakeup = self._wakeups[queue]
+        while not self._stopping:
+            try:
+                jobs = await asyncio.to_thread(claim_jobs, queue, config.batch_size)
+            except Exception:
+                logger.exception('Claiming jobs failed', extra={'queue': queue})
+                jobs = []
+            if jobs:
+                await asyncio.to_thread(self._run_jobs, queue, jobs)
+                continue
+            wakeup.clear()
+            try:
+                await asyncio.wait_for(wakeup.wait(), JOB_POLL_SECONDS)
+            except TimeoutError:
+                pass
+
+    def _run_jobs(self, queue: str, jobs: list[ClaimedJob]) -> None:
+        by_name: dict[str, list[ClaimedJob]] = {}
+        for claimed in jobs:
+            by_name.setdefault(claimed.name, []).append(claimed)
+        for name, group in by_name.items():
+            handler = _handlers.get(name)
+            if handler is None:
+                logger.error('No handler registered for job', extra={'job': name, 'queue': queue})
+                self._finish(queue, group, None, LookupError(f'No handler registered for job {name}'), 0.0)
+            elif handler.batch:
+                self._run(queue, group, handler, lambda: handler.func([claimed.payload for claimed in group]))
+            else:
+                for claimed in group:
+                    self._run(queue, [claimed], handler, lambda: handler.func(**claimed.payload))
+
+    def _run(self, queue: str, jobs: list[ClaimedJob], handler: JobHandler, call: Callable) -> None:
+        started = time.perf_counter()
+        error = None
+        try:
+            call()
+        except Exception as exc:
+            logger.exception('Job failed', extra={'job': jobs[0].name, 'queue': queue, 'jobs': len(jobs), 'attempts': jobs[0].attempts})
+            error = exc
+        self._finish(queue, jobs, handler, error, time.perf_counter() - started)
+
+    def _finish(self, queue: str, jobs: list[ClaimedJob], handler: JobHandler | None, error: Exception | None,
+                run_seconds: float) -> None:
+        stale = _finish_jobs(jobs, handler, error)
+        with self._metrics_lock:
+            metrics = self.metrics[queue]
+            for claimed in jobs:
+                if claimed.id in stale: # counted by the worker holding the new claim
+                    continue
+                if error is None:
+                    metrics.succeeded += 1
+                elif handler is None or claimed.attempts >= claimed.max_attempts:
+                    metrics.failed += 1
+                else:
+                    metrics.retried += 1
+                wait = max((_as_utc(claimed.started_at) - _as_utc(claimed.run_at)).total_seconds(), 0.0)
+                metrics.wait_seconds_total += wait
+                metrics.wait_seconds_max = max(metrics.wait_seconds_max, wait)
+                metrics.run_seconds_total += run_seconds
+                metrics.run_seconds_max = max(metrics.run_seconds_max, run_seconds)
+        logger.debug('Jobs finished', extra={'job': jobs[0].name, 'queue': queue, 'jobs': len(jobs), 'failed': error is not None, 'run_seconds': run_seconds})
+
+job_runner = JobRunner(JOB_QUEUES)
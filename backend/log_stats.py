@@ -0,0 +1,206 @@
+import argparse
+import glob
+import gzip
+import json
+import math
+import os
+import re
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Iterator, TextIO
+
+"""
+log_stats.py
+
+Summarizes the JSON lines logs written by the file handler of logging_config.json
+(logs/app.log.jsonl and its backups app.log.jsonl.1.gz, .2.gz, ..., see logger.GzipRotatingFileHandler).
+
+The files are streamed line by line, oldest backup first, plain or gzip-compressed, so memory
+does not grow with the size of the logs: only counters per function and per time bucket are kept.
+
+Reported:
+- records, warnings and errors (ERROR and CRITICAL) per function (module.function), sorted by records
+- throughput: records and errors per --bucket seconds
+- latency percentiles of every logged duration (the extra keys in DURATION_KEYS, like wall_ms of
+  'Request profiled' or duration_ms of 'Slow query') per function, settings logged in ms (slow_ms
+  of 'Trace exporter started') are not counted. Durations are counted in a
+  histogram of logarithmic buckets, a percentile is the upper bound of its bucket, at most
+  8% (HISTOGRAM_GROWTH) above the exact value.
+Lines that are no JSON objects (a line cut off by a crash) are counted and skipped.
+
+Usage (from the backend directory):
+    python log_stats.py
+    python log_stats.py --since 2026-10-19T08:00 --until 2026-10-19T09:00 --bucket 300
+    python log_stats.py logs/app.log.jsonl.2.gz --top 10 --json
+"""
+
+DEFAULT_LOG_FILE = 'logs/app.log.jsonl'
+ERROR_LEVELS = {'ERROR', 'CRITICAL'}
+DURATION_KEYS = frozenset({'duration_ms', 'wall_ms', 'cpu_ms', 'db_ms'})
+HISTOGRAM_GROWTH = 1.08
+PERCENTILES = (50, 90, 99)
+BACKUP_SUFFIX = re.compile(r'\.(\d+)(\.gz)?$')
+
+class DurationHistogram:
+    """Counts of durations (ms) in buckets growing by HISTOGRAM_GROWTH, memory bounded by the range of the values"""
+    def __init__(self) -> None:
+        self.buckets: Counter[int] = Counter()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms: float) -> None:
+        # durations below 1 microsecond share the lowest bucket
+        self.buckets[math.floor(math.log(max(ms, 0.001), HISTOGRAM_GROWTH))] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, p: float) -> float:
+        """Upper bound of the bucket holding the p-th percentile"""
+        rank = math.ceil(self.count * p / 100)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(HISTOGRAM_GROWTH ** (bucket + 1), self.max)
+        return self.max
+
+class LogStats:
+    def __init__(self, bucket_seconds: int, since: datetime | None, until: datetime | None) -> None:
+        self.bucket_seconds = bucket_seconds
+        self.since = since
+        self.until = until
+        self.records: Counter[str] = Counter()
+        self.warnings: Counter[str] = Counter()
+        self.errors: Counter[str] = Counter()
+        self.throughput: Counter[datetime] = Counter()
+        self.bucket_errors: Counter[datetime] = Counter()
+        self.durations: dict[tuple[str, str], DurationHistogram] = {}
+        self.skipped = 0
+        self.first: datetime | None = None
+        self.last: datetime | None = None
+
+    def add(self, line: str) -> None:
+        try:
+            record = json.loads(line)
+            timestamp = datetime.fromisoformat(record['timestamp'])
+        except (ValueError, KeyError, TypeError):
+            self.skipped += 1
+            return
+        if (self.since and timestamp < self.since) or (self.until and timestamp >= self.until):
+            return
+        self.first = min(self.first or timestamp, timestamp)
+        self.last = max(self.last or timestamp, timestamp)
+        function = f'{record.get("module")}.{record.get("function")}'
+        level = record.get('level')
+        bucket = datetime.fromtimestamp(timestamp.timestamp() // self.bucket_seconds * self.bucket_seconds, timezone.utc)
+        self.records[function] += 1
+        self.throughput[bucket] += 1
+        if level == 'WARNING':
+            self.warnings[function] += 1
+        elif level in ERROR_LEVELS:
+            self.errors[function] += 1
+            self.bucket_errors[bucket] += 1
+        for key, value in record.items():
+            if key in DURATION_KEYS and isinstance(value, (int, float)) and not isinstance(value, bool):
+                histogram = self.durations.get((function, key))
+                if histogram is None:
+                    histogram = self.durations[function, key] = DurationHistogram()
+                histogram.add(value)
+
+    def report(self, top: int) -> dict:
+        functions = [
+            {'function': function, 'records': records, 'warnings': self.warnings[function],
+             'errors': self.errors[function], 'error_rate': round(self.errors[function] / records, 4)}
+            for function, records in self.records.most_common(top)
+        ]
+        throughput = [
+            {'bucket': bucket.isoformat(), 'records': self.throughput[bucket], 'errors': self.bucket_errors[bucket],
+             'per_second': round(self.throughput[bucket] / self.bucket_seconds, 2)}
+            for bucket in sorted(self.throughput)
+        ]
+        durations = [
+            {'function': function, 'key': key, 'count': histogram.count,
+             'mean': round(histogram.total / histogram.count, 1), 'max': round(histogram.max, 1),
+             **{f'p{p}': round(histogram.percentile(p), 1) for p in PERCENTILES}}
+            for (function, key), histogram in sorted(self.durations.items(), key=lambda item: -item[1].count)[:top]
+        ]
+        return {
+            'records': sum(self.records.values()),
+            'errors': sum(self.errors.values()),
+            'skipped_lines': self.skipped,
+            'first': self.first.isoformat() if self.first else None,
+            'last': self.last.isoformat() if self.last else None,
+            'functions': functions,
+            'throughput': throughput,
+            'durations': durations,
+        }
+
+def log_files(log_file: str) -> list[str]:
+    """log_file and its backups, oldest first (app.log.jsonl.3.gz, ..., .1.gz, app.log.jsonl)"""
+    backups = []
+    for path in glob.glob(glob.escape(log_file) + '.*'):
+        match = BACKUP_SUFFIX.fullmatch(path[len(log_file):])
+        if match:
+            backups.append((int(match.group(1)), path))
+    files = [path for _, path in sorted(backups, reverse=True)]
+    if os.path.exists(log_file):
+        files.append(log_file)
+    return files
+
+def open_log(path: str) -> TextIO:
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace')
+    return open(path, encoding='utf-8', errors='replace')
+
+def read_lines(paths: list[str]) -> Iterator[str]:
+    for path in paths:
+        with open_log(path) as file:
+            yield from file
+
+def _timestamp(value: str) -> datetime:
+    """ISO 8601 date or time, UTC unless it has an offset"""
+    timestamp = datetime.fromisoformat(value)
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+
+def print_report(report: dict) -> None:
+    print(f'{report["records"]} records from {report["first"]} to {report["last"]}, '
+          f'{report["errors"]} errors, {report["skipped_lines"]} lines skipped')
+    print(f'\n{"function":<56}{"records":>9}{"warnings":>10}{"errors":>8}{"error %":>9}')
+    for row in report['functions']:
+        print(f'{row["function"]:<56}{row["records"]:>9}{row["warnings"]:>10}{row["errors"]:>8}{row["error_rate"] * 100:>9.2f}')
+    print(f'\n{"bucket":<27}{"records":>9}{"per s":>9}{"errors":>8}')
+    for row in report['throughput']:
+        print(f'{row["bucket"]:<27}{row["records"]:>9}{row["per_second"]:>9.2f}{row["errors"]:>8}')
+    if report['durations']:
+        header = ''.join(f'{f"p{p}":>9}' for p in PERCENTILES)
+        print(f'\n{"function":<44}{"duration":<12}{"count":>7}{"mean":>9}{header}{"max":>9}')
+        for row in report['durations']:
+            values = ''.join(f'{row[f"p{p}"]:>9.1f}' for p in PERCENTILES)
+            print(f'{row["function"]:<44}{row["key"]:<12}{row["count"]:>7}{row["mean"]:>9.1f}{values}{row["max"]:>9.1f}')
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Summarize the JSON lines logs')
+    parser.add_argument('files', nargs='*', help=f'log files, plain or .gz (default {DEFAULT_LOG_FILE} and its backups)')
+    parser.add_argument('--since', type=_timestamp, help='only records at or after this ISO time (UTC unless given)')
+    parser.add_argument('--until', type=_timestamp, help='only records before this ISO time')
+    parser.add_argument('--bucket', type=int, default=60, help='throughput bucket in seconds (default 60)')
+    parser.add_argument('--top', type=int, default=20, help='functions and durations listed (default 20)')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    paths = args.files or log_files(DEFAULT_LOG_FILE)
+    if not paths:
+        raise SystemExit(f'no log files found at {DEFAULT_LOG_FILE}')
+    stats = LogStats(args.bucket, args.since, args.until)
+    for line in read_lines(paths):
+        stats.add(line)
+    report = stats.report(args.top)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,12 @@
 import datetime as dt
+import gzip
 import json
 import logging
+import os
+import shutil
+import sys
+import threading
+from logging.handlers import RotatingFileHandler
 from typing import override
 
 LOG_RECORD_BUILTIN_ATTRS = {
@@ -65,4 +71,57 @@ class JSONFormatter(logging.Formatter):
 class MaxLevelFilter(logging.Filter):
     @override
     def filter(self, record: logging.LogRecord) -> bool | logging.LogRecord:
-         return record.levelno <= logging.INFO
\ No newline at end of file
+         return record.levelno <= logging.INFO
+
+class GzipRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler keeping its backups gzip-compressed (app.log.jsonl.1.gz, .2.gz, ...).
+
+    A rollover renames the file to app.log.jsonl.1 and compresses it to app.log.jsonl.1.gz in a
+    background thread, so logging does not wait for the compression. The next rollover, and
+    close(), wait for it to finish before shifting the backups. A file left uncompressed by a
+    crash is kept as is and is overwritten by the next rollover.
+    """
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._compressing: threading.Thread | None = None
+
+    @override
+    def rotation_filename(self, default_name: str) -> str:
+        return default_name + '.gz'
+
+    @override
+    def rotate(self, source: str, dest: str) -> None:
+        uncompressed = dest.removesuffix('.gz')
+        if not os.path.exists(source):
+            return
+        os.replace(source, uncompressed)
+        self._compressing = threading.Thread(target=self._compress, args=(uncompressed, dest),
+                                             name='log-compression', daemon=True)
+        self._compressing.start()
+
+    @override
+    def doRollover(self) -> None:
+        self._wait_for_compression()
+        super().doRollover()
+
+    @override
+    def close(self) -> None:
+        self._wait_for_compression()
+        super().close()
+
+    def _wait_for_compression(self) -> None:
+        if self._compressing is not None:
+            self._compressing.join()
+            self._compressing = None
+
+    @staticmethod
+    def _compress(source: str, dest: str) -> None:
+        try:
+            with open(source, 'rb') as plain, gzip.open(dest + '.tmp', 'wb') as compressed:
+                shutil.copyfileobj(plain, compressed)
+            os.replace(dest + '.tmp', dest)
+            os.remove(source)
+        except OSError as exc:
+            # not logged: this runs inside the logging handler
+            print(f'Compressing {source} failed: {exc!r}', file=sys.stderr)
@@ -2,26 +2,45 @@ from fastapi import FastAPI, Depends, HTTPException, status, Request
 from datetime import timedelta
 from typing import Annotated
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 import uvicorn
-from routers import user_router, post_router, comment_router
+from routers import user_router, post_router, comment_router, like_router, attachment_router, admin_router, change_router, tag_router
 from fastapi.security import OAuth2PasswordRequestForm
 from dependencies import SessionDep
-from services.authentication_service import create_access_token, verify_refresh_token, create_refresh_token, authenticate_user ,ACCESS_TOKEN_EXPIRE_MINUTES, Token, revoke_refresh_token
-from slowapi import _rate_limit_exceeded_handler, Limiter
+from services.authentication_service import access_token_claims, create_access_token, verify_refresh_token, create_refresh_token, authenticate_user ,ACCESS_TOKEN_EXPIRE_MINUTES, Token, revoke_refresh_token, pwd_context
+from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
-from slowapi.util import get_remote_address
 from slowapi.middleware import SlowAPIMiddleware
-from settings import setup_logging, logger
+from settings import setup_logging, logger, get_settings
 from contextlib import asynccontextmanager
+from broker import broker
+from jobs import job_runner
+from invalidation import invalidation_bus
+from revocations import revocation_list
+from database import engine, read_engine, warm_up_connection_pool
+from profiling import ProfilingMiddleware
+from memory import MemoryMiddleware
+from rate_limit import limiter
+from thumbnails import thumbnail_pool
+from sharding import BucketMoving, shard_map
+from changes import change_compactor
+from tags import top_tags
+from views import view_counter
+from tracing import TracingMiddleware, instrument_serialization, instrument_services, trace_exporter
 """
 main.py 
 
-Entry point for the whole FastAPI application
+Entry point for the whole FastAPI application.
+Run directly for development (single process, auto-reload), use server.py in production.
 
 Handles FastAPI setup, including:
-- Setup rate-limit (slowapi)
-- Include routers (user, post, comment)
+- Setup rate-limit (slowapi, limits defined in rate_limit.py)
+- Include routers (user, post, comment, like, attachment, change, tag, admin)
 - Add CORS middleware
+- Add the profiling middleware (admin-only per-request profiles, see profiling.py)
+- Add the memory middleware (memory of requests while the admin memory diagnostics run, see memory.py)
+- Add the tracing middleware and trace the service functions (trace ids in the logs, slow request traces, see tracing.py)
+- Answer writes to a bucket being moved between shards with 503 (see sharding.py)
 
 Defines the /auth/* endpoints.
 
@@ -37,19 +56,59 @@ async def lifespan(app: FastAPI):
     #configure logging
     setup_logging()
     logger.info('Logger is setup!')
+    # warm up pools and caches, so the first requests don't pay for it
+    warm_up_connection_pool()
+    pwd_context.dummy_verify() # loads the bcrypt backend
+    app.openapi()
+    await shard_map.start(engine, read_engine) # bucket to shard assignment (sharding.py), before anything queries
+    await broker.start()
+    await invalidation_bus.start()
+    await job_runner.start() # background job workers (jobs.py)
+    await change_compactor.start() # change feed retention (changes.py)
+    await top_tags.start() # GET /tags/top ranking (tags.py)
+    await view_counter.start() # views_count of posts (views.py)
+    await trace_exporter.start() # writes the traces of slow and sampled requests (tracing.py)
+    if get_settings().stateless_auth:
+        await revocation_list.start()
     yield
+    await broker.stop()
+    await change_compactor.stop()
+    await top_tags.stop()
+    await view_counter.stop() # persists the pending views
+    await job_runner.stop()
+    thumbnail_pool.stop() # after the job workers, which wait for renders
+    await invalidation_bus.stop()
+    await revocation_list.stop()
+    await shard_map.stop()
+    await trace_exporter.stop()
 
 app = FastAPI(lifespan=lifespan)
 
 #rate limit using slowapi
-limiter = Limiter(key_func=get_remote_address, strategy="moving-window",default_limits=["10/minute"])
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler) # type: ignore
+
+@app.exception_handler(BucketMoving)
+async def bucket_moving_handler(request: Request, exc: BucketMoving) -> JSONResponse:
+    """The data of the user is being moved to another shard, the write can be retried once the move is done"""
+    logger.warning('Write to a moving bucket refused', extra={'bucket': exc.bucket, 'path': request.url.path})
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={'detail': 'temporarily unavailable, retry shortly'},
+                        headers={'Retry-After': str(max(1, round(2 * get_settings().shard_map_refresh_seconds)))})
+app.add_middleware(ProfilingMiddleware) # innermost, runs in the task of the endpoint
+app.add_middleware(MemoryMiddleware)
 app.add_middleware(SlowAPIMiddleware)
+app.add_middleware(TracingMiddleware) # outside the rate limiter, so its log records carry the trace id too
 
 app.include_router(user_router.router)
 app.include_router(post_router.router)
 app.include_router(comment_router.router)
+app.include_router(like_router.router)
+app.include_router(attachment_router.router)
+app.include_router(change_router.router)
+app.include_router(tag_router.router)
+app.include_router(admin_router.router)
+instrument_services()
+instrument_serialization()
 
 origins_allowed = [
     'http://localhost:3000',
@@ -70,32 +129,33 @@ async def health_status() -> dict:
 
 
 @app.post('/auth/token', response_model=Token)
-async def login(request: Request, form_data: Annotated[OAuth2PasswordRequestForm, Depends()], session: SessionDep):
+def login(request: Request, form_data: Annotated[OAuth2PasswordRequestForm, Depends()], session: SessionDep):
     """Creates a Token object containing access_token and refresh_token if the user is authenticated"""
     user = authenticate_user(form_data.username, form_data.password, session)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Incorrect username or password',
                             headers={'WWW-Authenticate': 'Bearer'})
     
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(data={"sub": str(user.id)}, expires_delta=access_token_expires)
     user_agent = request.headers.get("user-agent", "Unknown")
     refresh_token = create_refresh_token(user.id, user_agent, session)
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(data=access_token_claims(user, refresh_token.id), expires_delta=access_token_expires)
     return Token(access_token=access_token, refresh_token=refresh_token.token, token_type='bearer')
 
 @app.post('/auth/refresh', response_model=Token)
-async def refresh_token(request: Request, refresh_token: str, session: SessionDep):
+def refresh_token(request: Request, refresh_token: str, session: SessionDep):
     """Creates a Token object containing access_token and refresh_token if the input refresh_token is valid"""
     db_token = verify_refresh_token(refresh_token, session)
     user_agent = request.headers.get("user-agent", "Unknown")
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    new_access_token = create_access_token(data={"sub": str(db_token.user_id)}, expires_delta=access_token_expires)
+    # the access token belongs to the session of the new refresh token, which is a new row for another device
     new_refresh_token = create_refresh_token(db_token.user_id, user_agent, session)
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    new_access_token = create_access_token(data=access_token_claims(db_token.user, new_refresh_token.id), expires_delta=access_token_expires)
     
     return Token(access_token=new_access_token, refresh_token=new_refresh_token.token, token_type='bearer')
 
 @app.delete('/auth/logout')
-async def revoke_token(refresh_token: str, session: SessionDep):
+def revoke_token(refresh_token: str, session: SessionDep):
     """Revokes a current device/session"""
     revoke_refresh_token(refresh_token, session)
     return {'msg': "Logged out"}
@@ -0,0 +1,239 @@
+import os
+import resource
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import OrderedDict, defaultdict
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from settings import logger
+
+"""
+memory.py
+
+On-demand memory diagnostics of a worker process, for operators (see the /admin/memory endpoints).
+
+While started (MemoryDiagnostics.start):
+    - tracemalloc traces allocations with up to `frames` frames per allocation. It slows the
+      process down noticeably and uses memory itself, so stop it when done.
+    - snapshots of the traced allocations are kept in memory (last MAX_SNAPSHOTS), listed as
+      top allocation sites (file:line, file, or the full traceback) or diffed against each other:
+      sites growing between two snapshots taken some requests apart are what retains memory.
+    - every request (MemoryMiddleware) records the number of ORM objects it loaded, the
+      largest identity map of its sessions and its peak traced allocation, aggregated per route.
+      The peak of a request is exact only if no other request of the process ran meanwhile
+      (tracemalloc has one peak per process), overlapping requests are counted but not measured.
+Stopping clears the snapshots and the request statistics.
+
+Everything is per worker process: run the endpoints against a single worker (WEB_CONCURRENCY=1),
+or repeat them until the same process answers (the pid is part of every response).
+"""
+
+MAX_SNAPSHOTS = 5
+MAX_FRAMES = 50
+IGNORED_FILES = (tracemalloc.__file__, '<frozen importlib._bootstrap>', '<frozen importlib._bootstrap_external>', '<unknown>')
+
+class RequestMemory:
+    """Memory used by one request"""
+    __slots__ = ('orm_loaded', 'identity_map_peak')
+
+    def __init__(self) -> None:
+        self.orm_loaded = 0
+        self.identity_map_peak = 0
+
+current_request_memory: ContextVar[RequestMemory | None] = ContextVar('current_request_memory', default=None)
+
+def _on_load(session: Session, instance) -> None:
+    request = current_request_memory.get()
+    if request is not None:
+        request.orm_loaded += 1
+        request.identity_map_peak = max(request.identity_map_peak, len(session.identity_map))
+
+def _kib(size: int) -> float:
+    return round(size / 1024, 1)
+
+def _site(frame: tracemalloc.Frame) -> str:
+    """file:line (file when grouped by file), relative to site-packages or the backend directory"""
+    filename = frame.filename
+    for marker in ('site-packages/', 'lib/python'):
+        if marker in filename:
+            filename = filename.split(marker, 1)[1]
+            break
+    else:
+        filename = os.path.relpath(filename) if os.path.isabs(filename) else filename
+    return f'{filename}:{frame.lineno}' if frame.lineno else filename
+
+def _rss_kib() -> float | None:
+    """Resident set size of the process, None where /proc is not available"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return _kib(int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE'))
+    except (OSError, ValueError, IndexError):
+        return None
+
+class MemoryDiagnostics:
+    def __init__(self) -> None:
+        self.active = False
+        self.frames = 0
+        self.started_at: float | None = None
+        self._snapshots: OrderedDict[str, tuple[float, int, tracemalloc.Snapshot]] = OrderedDict() # taken at, traced bytes
+        self._routes: dict[str, dict] = defaultdict(lambda: {
+            'requests': 0, 'overlapped': 0, 'measured': 0, 'peak_total': 0, 'peak_max': 0,
+            'orm_loaded_total': 0, 'orm_loaded_max': 0, 'identity_map_max': 0,
+        })
+        self._in_flight = 0
+        self._overlaps = 0 # bumped whenever a request starts while another one runs
+        self._lock = threading.Lock()
+
+    def start(self, frames: int) -> dict:
+        with self._lock:
+            if not self.active:
+                tracemalloc.start(frames)
+                event.listen(Session, 'loaded_as_persistent', _on_load)
+                self.active = True
+                self.frames = frames
+                self.started_at = time.time()
+                logger.info('Memory diagnostics started', extra={'frames': frames})
+        return self.status()
+
+    def stop(self) -> dict:
+        with self._lock:
+            if self.active:
+                event.remove(Session, 'loaded_as_persistent', _on_load)
+                tracemalloc.stop()
+                self.active = False
+                self.started_at = None
+                self._snapshots.clear()
+                self._routes.clear()
+                logger.info('Memory diagnostics stopped')
+        return self.status()
+
+    def status(self) -> dict:
+        current, peak = tracemalloc.get_traced_memory() if self.active else (0, 0)
+        with self._lock:
+            snapshots = [{'id': snapshot_id, 'taken_at': taken_at, 'traced_kib': _kib(traced)}
+                         for snapshot_id, (taken_at, traced, _) in self._snapshots.items()]
+        return {
+            'pid': os.getpid(),
+            'active': self.active,
+            'frames': self.frames if self.active else None,
+            'started_at': self.started_at,
+            'rss_kib': _rss_kib(),
+            'max_rss_kib': float(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss), # KiB on Linux
+            'traced_kib': _kib(current),
+            'traced_peak_kib': _kib(peak),
+            'tracemalloc_overhead_kib': _kib(tracemalloc.get_tracemalloc_memory()) if self.active else 0.0,
+            'snapshots': snapshots,
+        }
+
+    def take_snapshot(self) -> str | None:
+        """Stores a snapshot of the traced allocations, None if not active"""
+        if not self.active:
+            return None
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, name) for name in IGNORED_FILES])
+        snapshot_id = uuid.uuid4().hex[:12]
+        traced = sum(trace.size for trace in snapshot.traces)
+        with self._lock:
+            self._snapshots[snapshot_id] = (time.time(), traced, snapshot)
+            while len(self._snapshots) > MAX_SNAPSHOTS:
+                self._snapshots.popitem(last=False)
+        return snapshot_id
+
+    def _snapshot(self, snapshot_id: str) -> tracemalloc.Snapshot | None:
+        with self._lock:
+            entry = self._snapshots.get(snapshot_id)
+        return entry[2] if entry else None
+
+    def top(self, snapshot_id: str, key_type: str, limit: int) -> list[dict] | None:
+        """Largest allocation sites of a snapshot, None if the snapshot is unknown"""
+        snapshot = self._snapshot(snapshot_id)
+        if snapshot is None:
+            return None
+        return [{'site': [_site(frame) for frame in stat.traceback] if key_type == 'traceback' else _site(stat.traceback[0]),
+                 'size_kib': _kib(stat.size), 'count': stat.count}
+                for stat in snapshot.statistics(key_type)[:limit]]
+
+    def diff(self, from_id: str, to_id: str, key_type: str, limit: int) -> list[dict] | None:
+        """Allocation sites that grew most from one snapshot to the other, None if a snapshot is unknown"""
+        old, new = self._snapshot(from_id), self._snapshot(to_id)
+        if old is None or new is None:
+            return None
+        return [{'site': [_site(frame) for frame in stat.traceback] if key_type == 'traceback' else _site(stat.traceback[0]),
+                 'size_diff_kib': _kib(stat.size_diff), 'count_diff': stat.count_diff,
+                 'size_kib': _kib(stat.size), 'count': stat.count}
+                for stat in new.compare_to(old, key_type)[:limit]]
+
+    def begin_request(self) -> tuple[RequestMemory, tuple[int, int] | None]:
+        """
+        Starts measuring a request: (its memory, (traced size, overlap generation) at the start,
+        None if it overlaps another request)
+        """
+        with self._lock:
+            self._in_flight += 1
+            alone = self._in_flight == 1
+            if not alone:
+                self._overlaps += 1
+            generation = self._overlaps
+        start = None
+        if alone:
+            tracemalloc.reset_peak()
+            start = (tracemalloc.get_traced_memory()[0], generation)
+        return RequestMemory(), start
+
+    def end_request(self, route: str, request: RequestMemory, start: tuple[int, int] | None) -> None:
+        peak = tracemalloc.get_traced_memory()[1] - start[0] if start is not None and self.active else None
+        with self._lock:
+            self._in_flight -= 1
+            if not self.active:
+                return
+            if peak is not None and self._overlaps != start[1]:
+                peak = None # another request ran meanwhile and shares the peak
+            stats = self._routes[route]
+            stats['requests'] += 1
+            stats['orm_loaded_total'] += request.orm_loaded
+            stats['orm_loaded_max'] = max(stats['orm_loaded_max'], request.orm_loaded)
+            stats['identity_map_max'] = max(stats['identity_map_max'], request.identity_map_peak)
+            if peak is None:
+                stats['overlapped'] += 1
+            else:
+                stats['measured'] += 1
+                stats['peak_total'] += peak
+                stats['peak_max'] = max(stats['peak_max'], peak)
+
+    def requests(self) -> list[dict]:
+        """Memory per route, largest peak allocation first"""
+        with self._lock:
+            rows = [{
+                'route': route,
+                'requests': stats['requests'],
+                'overlapped': stats['overlapped'],
+                'peak_alloc_kib_max': _kib(stats['peak_max']),
+                'peak_alloc_kib_mean': _kib(stats['peak_total'] / stats['measured']) if stats['measured'] else None,
+                'orm_loaded_max': stats['orm_loaded_max'],
+                'orm_loaded_mean': round(stats['orm_loaded_total'] / stats['requests'], 1),
+                'identity_map_max': stats['identity_map_max'],
+            } for route, stats in self._routes.items()]
+        return sorted(rows, key=lambda row: row['peak_alloc_kib_max'], reverse=True)
+
+memory_diagnostics = MemoryDiagnostics()
+
+class MemoryMiddleware:
+    """ASGI middleware measuring the memory of requests while the diagnostics are active"""
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] != 'http' or not memory_diagnostics.active:
+            return await self.app(scope, receive, send)
+        request, start = memory_diagnostics.begin_request()
+        reset = current_request_memory.set(request)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_request_memory.reset(reset)
+            route = scope.get('route')
+            # unmatched paths share one entry, so scanners can't grow the statistics
+            name = f"{scope['method']} {route.path if route is not None and hasattr(route, 'path') else '(unmatched)'}"
+            memory_diagnostics.end_request(name, request, start)
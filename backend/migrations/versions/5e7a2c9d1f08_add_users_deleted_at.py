@@ -0,0 +1,30 @@
+"""Add users.deleted_at
+
+Revision ID: 5e7a2c9d1f08
+Revises: d41b8e0c5a93
+Create Date: 2026-10-18 11:20:05.847329
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e7a2c9d1f08'
+down_revision: Union[str, Sequence[str], None] = 'd41b8e0c5a93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.add_column(sa.Column('deleted_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('deleted_at')
@@ -0,0 +1,32 @@
+"""Add user activity indexes
+
+Revision ID: 9c3e1f7a2b64
+Revises: 4a8b97be4f96
+Create Date: 2026-10-18 09:12:31.402117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c3e1f7a2b64'
+down_revision: Union[str, Sequence[str], None] = '4a8b97be4f96'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_posts_owner_id_created_at', 'posts', ['owner_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_comments_owner_id_created_at', 'comments', ['owner_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_likes_user_id_liked_at', 'likes', ['user_id', 'liked_at', 'post_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_likes_user_id_liked_at', table_name='likes')
+    op.drop_index('ix_comments_owner_id_created_at', table_name='comments')
+    op.drop_index('ix_posts_owner_id_created_at', table_name='posts')
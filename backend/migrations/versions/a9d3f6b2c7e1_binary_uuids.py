@@ -0,0 +1,69 @@
+"""Store UUIDs in 16 bytes on SQLite
+
+Revision ID: a9d3f6b2c7e1
+Revises: f2b7c4e9a3d5
+Create Date: 2026-10-19 09:41:52.118604
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9d3f6b2c7e1'
+down_revision: Union[str, Sequence[str], None] = 'f2b7c4e9a3d5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# the UUID columns, the values of every column referencing another table change together with it
+UUID_COLUMNS = {
+    'users': ['id'],
+    'posts': ['id', 'owner_id'],
+    'comments': ['id', 'post_id', 'owner_id', 'parent_id'],
+    'likes': ['user_id', 'post_id'],
+    'refresh_tokens': ['id', 'user_id'],
+    'notifications': ['id', 'recipient_id', 'post_id', 'actor_id'],
+    'jobs': ['id'],
+    'revocations': ['id', 'user_id', 'session_id'],
+    'attachments': ['id', 'post_id'],
+    'changes': ['entity_id', 'user_id'],
+}
+BATCH_SIZE = 1000
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Only the values change: SQLite keeps a blob as is whatever the declared type of the column,
+    # other databases already store UUIDs natively (see ids.BinaryUUID).
+    connection = op.get_bind()
+    if connection.dialect.name != 'sqlite':
+        return
+    # foreign keys are checked at commit, when both sides are converted
+    connection.exec_driver_sql('PRAGMA defer_foreign_keys = ON')
+    for table, columns in UUID_COLUMNS.items():
+        for column in columns:
+            # rows are found by rowid: some columns are not indexed
+            rows = connection.exec_driver_sql(
+                f"SELECT rowid, {column} FROM {table} WHERE typeof({column}) = 'text'"
+            ).all()
+            for start in range(0, len(rows), BATCH_SIZE):
+                connection.execute(
+                    sa.text(f'UPDATE {table} SET {column} = :value WHERE rowid = :row'),
+                    [{'row': row, 'value': bytes.fromhex(value.replace('-', ''))}
+                     for row, value in rows[start:start + BATCH_SIZE]],
+                )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    connection = op.get_bind()
+    if connection.dialect.name != 'sqlite':
+        return
+    connection.exec_driver_sql('PRAGMA defer_foreign_keys = ON')
+    for table, columns in UUID_COLUMNS.items():
+        for column in columns:
+            connection.exec_driver_sql(
+                f"UPDATE {table} SET {column} = lower(hex({column})) WHERE typeof({column}) = 'blob'"
+            )
@@ -0,0 +1,48 @@
+"""Add post_tags and post_mentions
+
+Revision ID: b3e8d1c6f492
+Revises: a9d3f6b2c7e1
+Create Date: 2026-10-19 13:26:40.318275
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3e8d1c6f492'
+down_revision: Union[str, Sequence[str], None] = 'a9d3f6b2c7e1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('post_tags',
+    sa.Column('post_id', sa.UUID(), nullable=False),
+    sa.Column('tag', sa.String(length=50), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['post_id'], ['posts.id'], ),
+    sa.PrimaryKeyConstraint('post_id', 'tag')
+    )
+    op.create_index('ix_post_tags_tag_created_at', 'post_tags', ['tag', 'created_at', 'post_id'], unique=False)
+    op.create_index(op.f('ix_post_tags_created_at'), 'post_tags', ['created_at'], unique=False)
+    op.create_table('post_mentions',
+    sa.Column('post_id', sa.UUID(), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['post_id'], ['posts.id'], ),
+    sa.PrimaryKeyConstraint('post_id', 'user_id')
+    )
+    op.create_index('ix_post_mentions_user_id_created_at', 'post_mentions', ['user_id', 'created_at', 'post_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_post_mentions_user_id_created_at', table_name='post_mentions')
+    op.drop_table('post_mentions')
+    op.drop_index(op.f('ix_post_tags_created_at'), table_name='post_tags')
+    op.drop_index('ix_post_tags_tag_created_at', table_name='post_tags')
+    op.drop_table('post_tags')
@@ -0,0 +1,61 @@
+"""Add comment threads
+
+Revision ID: b8f4d2a61c37
+Revises: 5e7a2c9d1f08
+Create Date: 2026-10-18 13:41:52.306718
+
+"""
+from typing import Sequence, Union
+from datetime import timezone
+import secrets
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8f4d2a61c37'
+down_revision: Union[str, Sequence[str], None] = '5e7a2c9d1f08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('comments') as batch_op:
+        batch_op.add_column(sa.Column('parent_id', sa.UUID(), nullable=True))
+        batch_op.add_column(sa.Column('path', sa.String(length=256), server_default='', nullable=False))
+        batch_op.add_column(sa.Column('depth', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('reply_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.create_foreign_key('fk_comments_parent_id_comments', 'comments', ['parent_id'], ['id'])
+
+    # Existing comments become top-level comments, with a path segment derived from created_at
+    # (same format as services.post_service.comment_path_segment)
+    comments = sa.table('comments',
+        sa.column('id', sa.UUID()),
+        sa.column('created_at', sa.DateTime(timezone=True)),
+        sa.column('path', sa.String()),
+    )
+    connection = op.get_bind()
+    for comment_id, created_at in connection.execute(sa.select(comments.c.id, comments.c.created_at)).all():
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        segment = f'{int(created_at.timestamp() * 1_000_000):013x}{secrets.randbelow(4096):03x}'
+        connection.execute(comments.update().where(comments.c.id == comment_id).values(path=segment))
+
+    with op.batch_alter_table('comments') as batch_op:
+        batch_op.alter_column('path', server_default=None)
+    op.create_index('ix_comments_post_id_path', 'comments', ['post_id', 'path'], unique=True)
+    op.create_index('ix_comments_post_id_depth_path', 'comments', ['post_id', 'depth', 'path'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_comments_post_id_depth_path', table_name='comments')
+    op.drop_index('ix_comments_post_id_path', table_name='comments')
+    with op.batch_alter_table('comments') as batch_op:
+        batch_op.drop_constraint('fk_comments_parent_id_comments', type_='foreignkey')
+        batch_op.drop_column('reply_count')
+        batch_op.drop_column('depth')
+        batch_op.drop_column('path')
+        batch_op.drop_column('parent_id')
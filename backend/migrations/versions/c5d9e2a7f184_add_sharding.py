@@ -0,0 +1,55 @@
+"""Add sharding
+
+Revision ID: c5d9e2a7f184
+Revises: a4c7e2d9f813
+Create Date: 2026-10-19 21:12:40.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5d9e2a7f184'
+down_revision: Union[str, Sequence[str], None] = 'a4c7e2d9f813'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# user ids of rows that live on the shard of their post, the user can be on another shard
+CROSS_SHARD_USER_KEYS = [('comments', 'owner_id'), ('likes', 'user_id'), ('notifications', 'actor_id')]
+# SQLite foreign keys are unnamed, batch mode names them by this convention when it recreates the table
+NAMING_CONVENTION = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+
+
+def _foreign_key_name(table: str, column: str) -> str:
+    if op.get_bind().dialect.name == 'sqlite':
+        return f'fk_{table}_{column}_users'
+    return f'{table}_{column}_fkey' # PostgreSQL default name
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('shard_buckets',
+    sa.Column('bucket', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('shard', sa.Integer(), nullable=False),
+    sa.Column('moving', sa.Boolean(), nullable=False),
+    sa.PrimaryKeyConstraint('bucket')
+    )
+    for table, column in CROSS_SHARD_USER_KEYS:
+        with op.batch_alter_table(table, naming_convention=NAMING_CONVENTION) as batch_op:
+            batch_op.drop_constraint(_foreign_key_name(table, column), type_='foreignkey')
+    # pages of all posts and users, merged across shards, are ordered by creation
+    op.create_index('ix_posts_created_at', 'posts', ['created_at', 'id'], unique=False)
+    op.create_index('ix_users_created_at', 'users', ['created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_users_created_at', table_name='users')
+    op.drop_index('ix_posts_created_at', table_name='posts')
+    for table, column in CROSS_SHARD_USER_KEYS:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.create_foreign_key(f'fk_{table}_{column}_users', 'users', [column], ['id'])
+    op.drop_table('shard_buckets')
@@ -0,0 +1,32 @@
+"""Add posts.views_count and posts.views_sketch
+
+Revision ID: c7f2a5e8d3b1
+Revises: b3e8d1c6f492
+Create Date: 2026-10-19 16:08:33.902417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7f2a5e8d3b1'
+down_revision: Union[str, Sequence[str], None] = 'b3e8d1c6f492'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('posts') as batch_op:
+        batch_op.add_column(sa.Column('views_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('views_sketch', sa.LargeBinary(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('posts') as batch_op:
+        batch_op.drop_column('views_sketch')
+        batch_op.drop_column('views_count')
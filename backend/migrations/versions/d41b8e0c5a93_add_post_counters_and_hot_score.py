@@ -0,0 +1,70 @@
+"""Add post counters and hot_score
+
+Revision ID: d41b8e0c5a93
+Revises: 9c3e1f7a2b64
+Create Date: 2026-10-18 10:03:47.118604
+
+"""
+from typing import Sequence, Union
+from datetime import datetime, timezone
+import math
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd41b8e0c5a93'
+down_revision: Union[str, Sequence[str], None] = '9c3e1f7a2b64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Snapshot of services.post_service.calculate_hot_score at the time of this migration
+HOT_SCORE_EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+HOT_SCORE_DECAY_SECONDS = 45000
+HOT_SCORE_COMMENT_WEIGHT = 2
+
+def calculate_hot_score(likes_count: int, comments_count: int, created_at: datetime) -> float:
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    engagement = max(likes_count + HOT_SCORE_COMMENT_WEIGHT * comments_count, 1)
+    age = (created_at - HOT_SCORE_EPOCH).total_seconds()
+    return round(math.log10(engagement) + age / HOT_SCORE_DECAY_SECONDS, 7)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('posts') as batch_op:
+        batch_op.add_column(sa.Column('likes_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('comments_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('hot_score', sa.Float(), server_default='0', nullable=False))
+    op.create_index(op.f('ix_posts_hot_score'), 'posts', ['hot_score'], unique=False)
+
+    # Backfill counters and scores for existing posts
+    posts = sa.table('posts',
+        sa.column('id', sa.UUID()),
+        sa.column('created_at', sa.DateTime(timezone=True)),
+        sa.column('likes_count', sa.Integer()),
+        sa.column('comments_count', sa.Integer()),
+        sa.column('hot_score', sa.Float()),
+    )
+    likes = sa.table('likes', sa.column('post_id', sa.UUID()))
+    comments = sa.table('comments', sa.column('post_id', sa.UUID()))
+    op.execute(posts.update().values(
+        likes_count=sa.select(sa.func.count()).where(likes.c.post_id == posts.c.id).scalar_subquery(),
+        comments_count=sa.select(sa.func.count()).where(comments.c.post_id == posts.c.id).scalar_subquery(),
+    ))
+    connection = op.get_bind()
+    rows = connection.execute(sa.select(posts.c.id, posts.c.likes_count, posts.c.comments_count, posts.c.created_at)).all()
+    for post_id, likes_count, comments_count, created_at in rows:
+        connection.execute(posts.update().where(posts.c.id == post_id)
+                           .values(hot_score=calculate_hot_score(likes_count, comments_count, created_at)))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_posts_hot_score'), table_name='posts')
+    with op.batch_alter_table('posts') as batch_op:
+        batch_op.drop_column('hot_score')
+        batch_op.drop_column('comments_count')
+        batch_op.drop_column('likes_count')
@@ -0,0 +1,30 @@
+"""Page notifications by created_at
+
+Revision ID: d8e4b1a7c2f6
+Revises: c7f2a5e8d3b1
+Create Date: 2026-10-19 19:42:17.330581
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8e4b1a7c2f6'
+down_revision: Union[str, Sequence[str], None] = 'c7f2a5e8d3b1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_notifications_recipient_id_created_at', 'notifications', ['recipient_id', 'created_at', 'id'], unique=False)
+    op.drop_index('ix_notifications_recipient_id_updated_at', table_name='notifications')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index('ix_notifications_recipient_id_updated_at', 'notifications', ['recipient_id', 'updated_at', 'id'], unique=False)
+    op.drop_index('ix_notifications_recipient_id_created_at', table_name='notifications')
@@ -0,0 +1,34 @@
+"""Add usernames
+
+Revision ID: e3a9c6f1b7d4
+Revises: d8e4b1a7c2f6
+Create Date: 2026-10-19 20:31:08.514927
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3a9c6f1b7d4'
+down_revision: Union[str, Sequence[str], None] = 'd8e4b1a7c2f6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('usernames',
+    sa.Column('username', sa.String(length=20), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.PrimaryKeyConstraint('username')
+    )
+    # usernames of the existing users of this database (all of them before sharding is enabled)
+    op.execute('INSERT INTO usernames (username, user_id) SELECT username, id FROM users')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('usernames')
@@ -0,0 +1,36 @@
+"""Add revocations
+
+Revision ID: e6a1d3f9b250
+Revises: 7d2e5b8c4a16
+Create Date: 2026-10-19 15:27:44.118650
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6a1d3f9b250'
+down_revision: Union[str, Sequence[str], None] = '7d2e5b8c4a16'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('revocations',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('session_id', sa.UUID(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_revocations_created_at'), 'revocations', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_revocations_created_at'), table_name='revocations')
+    op.drop_table('revocations')
@@ -0,0 +1,45 @@
+"""Add changes
+
+Revision ID: f2b7c4e9a3d5
+Revises: c5d9e2a7f184
+Create Date: 2026-10-19 23:02:17.540126
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b7c4e9a3d5'
+down_revision: Union[str, Sequence[str], None] = 'c5d9e2a7f184'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('changes',
+    sa.Column('seq', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), autoincrement=True, nullable=False),
+    sa.Column('txid', sa.BigInteger(), nullable=False),
+    sa.Column('entity', sa.String(length=20), nullable=False),
+    sa.Column('entity_id', sa.UUID(), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('op', sa.String(length=10), nullable=False),
+    sa.Column('data', sa.JSON(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('seq'),
+    sqlite_autoincrement=True
+    )
+    op.create_index('ix_changes_txid_seq', 'changes', ['txid', 'seq'], unique=False)
+    op.create_index('ix_changes_entity', 'changes', ['entity', 'entity_id', 'user_id', 'seq'], unique=False)
+    op.create_index(op.f('ix_changes_created_at'), 'changes', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_changes_created_at'), table_name='changes')
+    op.drop_index('ix_changes_entity', table_name='changes')
+    op.drop_index('ix_changes_txid_seq', table_name='changes')
+    op.drop_table('changes')
@@ -1,5 +1,6 @@
 from database import Base
-from sqlalchemy import String, UUID, Boolean, DateTime, ForeignKey, UniqueConstraint
+from ids import BinaryUUID, uuid7
+from sqlalchemy import String, Boolean, DateTime, ForeignKey, UniqueConstraint, Index, Integer, BigInteger, Float, Text, JSON, LargeBinary, text
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 import uuid
 from datetime import datetime, timezone
@@ -15,6 +16,15 @@ It defines the database schema for:
 - Comment
 - Like
 - RefreshToken
+- Notification
+- Job
+- Revocation
+- Attachment
+- ShardBucket
+- Username
+- Change
+- PostTag
+- PostMention
 
 Relationships:
 - User has many Posts, Comments, Likes, and RefreshTokens
@@ -22,6 +32,15 @@ Relationships:
 - Comment belongs to a User and a Post
 - Like links a User and a Post
 - RefreshToken belongs to a User and is unique per device
+- Notification belongs to a recipient User and refers to a Post
+- Attachment belongs to a Post
+- PostTag and PostMention belong to a Post, they index the #tags and @mentions of its content
+
+The user ids of comments, likes, notifications and mentions (owner_id, user_id, actor_id) are not foreign
+keys: with sharding (see sharding.py) these rows live on the shard of the post, the user can live
+on another one.
+
+Ids are time-ordered UUIDv7 (UUIDv8 carrying the bucket with sharding), stored in 16 bytes (see ids.py).
 
 These models are used for Alembic migrations, database interactions, and FastAPI endpoints.
 """
@@ -38,22 +57,30 @@ class User(Base):
         full_name (str | None): Optional full name.
         hashed_password (str): Hashed password.
         created_at (datetime): Timestamp for when the user was created.
+        deleted_at (datetime | None): Timestamp for when the user requested deletion. The user is inactive
+            and its data is purged in the background, after which the row itself is deleted.
         posts (list[Post]): Posts created by the user.
         comments (list[Comment]): Comments created by the user.
         likes (list[Like]): Likes made by the user.
         refresh_tokens (list[RefreshToken]): Active refresh tokens for the user.
     """
     __tablename__ = 'users'
-    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    __table_args__ = (
+        Index("ix_users_created_at", "created_at", "id"),
+    )
+    id: Mapped[uuid.UUID] = mapped_column(BinaryUUID, primary_key=True, default=uuid7)
     username: Mapped[str] = mapped_column(String(20), unique=True, index=True, nullable=False)
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
     full_name: Mapped[str | None] = mapped_column(String(255), nullable=True)
     hashed_password: Mapped[str] = mapped_column(String, nullable=False)
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, default=datetime.now(timezone.utc))
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+    deleted_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     
     posts: Mapped[list["Post"]] = relationship("Post", back_populates="owner", cascade="all, delete-orphan")
-    comments: Mapped[list["Comment"]] = relationship("Comment", back_populates="owner", cascade="all, delete-orphan")
-    likes: Mapped[list["Like"]] = relationship("Like", back_populates="user", cascade="all, delete-orphan")
+    comments: Mapped[list["Comment"]] = relationship("Comment", back_populates="owner", cascade="all, delete-orphan",
+                                                     primaryjoin="User.id == foreign(Comment.owner_id)")
+    likes: Mapped[list["Like"]] = relationship("Like", back_populates="user", cascade="all, delete-orphan",
+                                               primaryjoin="User.id == foreign(Like.user_id)")
     refresh_tokens: Mapped[list["RefreshToken"]] = relationship("RefreshToken", back_populates="user", cascade="all, delete-orphan")
 
 class Post(Base):
@@ -67,18 +94,32 @@ class Post(Base):
         created_at (datetime): Creation timestamp.
         updated_at (datetime | None): Timestamp of last update.
         owner_id (UUID): ID of the user who created the post.
+        likes_count (int): Number of likes, maintained on like/unlike.
+        comments_count (int): Number of comments, maintained on comment create/delete.
+        hot_score (float): Time-decayed ranking score used for trending, maintained together with the counters.
+        views_count (int): Estimated number of distinct viewers, the count of views_sketch.
+        views_sketch (bytes | None): Compressed HyperLogLog sketch of the viewers (see views.py), deferred.
         owner (User): Relationship to the user.
         comments (list[Comment]): Comments on this post.
         likes (list[Like]): Likes on this post.
     """
     __tablename__ = 'posts'
-    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    __table_args__ = (
+        Index("ix_posts_owner_id_created_at", "owner_id", "created_at", "id"),
+        Index("ix_posts_created_at", "created_at", "id"),
+    )
+    id: Mapped[uuid.UUID] = mapped_column(BinaryUUID, primary_key=True, default=uuid7)
     title: Mapped[str] = mapped_column(String(40), nullable=False, index=True)
     content: Mapped[str] = mapped_column(String(255), nullable=False)
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, default=datetime.now(timezone.utc))
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
     updated_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    likes_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default='0')
+    comments_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default='0')
+    hot_score: Mapped[float] = mapped_column(Float, nullable=False, default=0.0, server_default='0', index=True)
+    views_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default='0')
+    views_sketch: Mapped[bytes | None] = mapped_column(LargeBinary, nullable=True, deferred=True)
 
-    owner_id = mapped_column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
+    owner_id = mapped_column(BinaryUUID, ForeignKey('users.id'), nullable=False)
     owner: Mapped["User"] = relationship("User", back_populates="posts")
     comments: Mapped[list["Comment"]] = relationship("Comment", back_populates="post", cascade="all, delete-orphan")
     likes: Mapped[list["Like"]] = relationship("Like", back_populates="post", cascade="all, delete-orphan")
@@ -95,19 +136,34 @@ class Comment(Base):
         last_edited (datetime | None): Timestamp of when the comment last was edited.
         post_id (UUID): ID of the post commented on.
         owner_id (UUID): ID of the user who made the comment.
+        parent_id (UUID | None): ID of the comment this is a reply to, None for top-level comments.
+        path (str): Materialized path, the path of the parent followed by a fixed-width segment
+            that sorts chronologically. Ordering by path gives the thread in display order,
+            and a subtree is a range scan on (post_id, path).
+        depth (int): Nesting level, 0 for top-level comments.
+        reply_count (int): Number of direct replies.
         post (Post): Relationship to the post.
         owner (User): Relationship to the user.
     """
     __tablename__ = 'comments'
-    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    __table_args__ = (
+        Index("ix_comments_owner_id_created_at", "owner_id", "created_at", "id"),
+        Index("ix_comments_post_id_path", "post_id", "path", unique=True),
+        Index("ix_comments_post_id_depth_path", "post_id", "depth", "path"),
+    )
+    id: Mapped[uuid.UUID] = mapped_column(BinaryUUID, primary_key=True, default=uuid7)
     content: Mapped[str] = mapped_column(String(255), nullable=False)
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, default=datetime.now(timezone.utc))
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
     last_edited: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
-    post_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('posts.id'), nullable=False)
-    owner_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
+    post_id: Mapped[uuid.UUID] = mapped_column(BinaryUUID, ForeignKey('posts.id'), nullable=False)
+    owner_id: Mapped[uuid.UUID] = mapped_column(BinaryUUID, nullable=False)
+    parent_id: Mapped[uuid.UUID | None] = mapped_column(BinaryUUID, ForeignKey('comments.id', name='fk_comments_parent_id_comments'), nullable=True)
+    path: Mapped[str] = mapped_column(String(256), nullable=False)
+    depth: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default='0')
+    reply_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default='0')
 
     post: Mapped["Post"] = relationship("Post", back_populates="comments")
-    owner: Mapped["User"] = relationship("User", back_populates="comments")
+    owner: Mapped["User"] = relationship("User", back_populates="comments", primaryjoin="User.id == foreign(Comment.owner_id)")
 
 class Like(Base):
     """
@@ -121,12 +177,15 @@ class Like(Base):
         post (Post): Relationship to the post.
     """
     __tablename__ = 'likes'
+    __table_args__ = (
+        Index("ix_likes_user_id_liked_at", "user_id", "liked_at", "post_id"),
+    )
 
-    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
-    post_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("posts.id"), primary_key=True)
-    liked_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.now(timezone.utc))
+    user_id: Mapped[uuid.UUID] = mapped_column(BinaryUUID, primary_key=True)
+    post_id: Mapped[uuid.UUID] = mapped_column(BinaryUUID, ForeignKey("posts.id"), primary_key=True)
+    liked_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
 
-    user: Mapped["User"] = relationship("User", back_populates="likes")
+    user: Mapped["User"] = relationship("User", back_populates="likes", primaryjoin="User.id == foreign(Like.user_id)")
     post: Mapped["Post"] = relationship("Post", back_populates="likes")
 
 class RefreshToken(Base):
@@ -148,11 +207,238 @@ class RefreshToken(Base):
         UniqueConstraint("user_id", "device_name", name="uix_user_device"),
     )
 
-    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    id: Mapped[uuid.UUID] = mapped_column(BinaryUUID, primary_key=True, default=uuid7)
+    user_id: Mapped[uuid.UUID] = mapped_column(BinaryUUID, ForeignKey("users.id"), nullable=False)
     token: Mapped[str] = mapped_column(String, unique=True, nullable=False)
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.now(timezone.utc), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
     expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
     revoked: Mapped[bool] = mapped_column(Boolean, default=False)
     device_name: Mapped[str] = mapped_column(String(255), nullable=False)
-    user: Mapped["User"] = relationship("User", back_populates="refresh_tokens")
\ No newline at end of file
+    user: Mapped["User"] = relationship("User", back_populates="refresh_tokens")
+
+class Notification(Base):
+    """
+    Represents a notification about activity on a post of the recipient.
+
+    While unread, activity of the same type on the same post is coalesced into one row
+    ("37 people liked your post"), enforced by a partial unique index on unread rows.
+
+    Attributes:
+        id (UUID): Unique identifier for the notification.
+        recipient_id (UUID): ID of the user notified.
+        type (str): Kind of activity, 'like' or 'comment'.
+        post_id (UUID): ID of the post the activity happened on.
+        actor_id (UUID | None): ID of the user who caused the latest activity.
+        actor_count (int): Number of activities coalesced into this notification.
+        created_at (datetime): Timestamp of the first activity, notifications are listed newest first by it.
+        updated_at (datetime): Timestamp of the latest activity.
+        read_at (datetime | None): Timestamp for when the recipient marked the notification read.
+    """
+    __tablename__ = 'notifications'
+    __table_args__ = (
+        Index("ix_notifications_recipient_id_created_at", "recipient_id", "created_at", "id"),
+        Index("ix_notifications_unread", "recipient_id", "type", "post_id", unique=True,
+              sqlite_where=text("read_at IS NULL"), postgresql_where=text("read_at IS NULL")),
+    )
+
+    id: Mapped[uuid.UUID] = mapped_column(BinaryUUID, primary_key=True, default=uuid7)
+    recipient_id: Mapped[uuid.UUID] = mapped_column(BinaryUUID, ForeignKey("users.id"), nullable=False)
+    type: Mapped[str] = mapped_column(String(20), nullable=False)
+    post_id: Mapped[uuid.UUID] = mapped_column(BinaryUUID, ForeignKey("posts.id"), nullable=False)
+    actor_id: Mapped[uuid.UUID | None] = mapped_column(BinaryUUID, nullable=True)
+    actor_count: Mapped[int] = mapped_column(Integer, nullable=False, default=1)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+    read_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+class Job(Base):
+    """
+    Represents a background job in the durable job queue (see jobs.py).
+
+    Attributes:
+        id (UUID): Unique identifier for the job.
+        queue (str): Queue the job runs on, each queue has its own worker concurrency.
+        name (str): Name of the registered job handler.
+        payload (dict): JSON keyword arguments for the handler.
+        status (str): 'pending', 'running' or 'failed'. Jobs are deleted once they succeed.
+        attempts (int): Number of times the job was claimed.
+        max_attempts (int): Attempts before the job is marked failed.
+        run_at (datetime): Earliest time the job may run, pushed back between retries.
+        created_at (datetime): Timestamp for when the job was enqueued.
+        started_at (datetime | None): Timestamp of the latest claim. A running job is reclaimed
+            by another worker when it has not finished within the lease time.
+        last_error (str | None): Error of the latest failed attempt.
+    """
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        Index("ix_jobs_queue_status_run_at", "queue", "status", "run_at"),
+    )
+
+    id: Mapped[uuid.UUID] = mapped_column(BinaryUUID, primary_key=True, default=uuid7)
+    queue: Mapped[str] = mapped_column(String(50), nullable=False)
+    name: Mapped[str] = mapped_column(String(100), nullable=False)
+    payload: Mapped[dict] = mapped_column(JSON, nullable=False, default=dict)
+    status: Mapped[str] = mapped_column(String(20), nullable=False, default='pending')
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    max_attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=5)
+    run_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+    started_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
+
+class Revocation(Base):
+    """
+    Represents the revocation of access tokens issued before created_at (see revocations.py).
+    Rows are only needed for the lifetime of an access token and are deleted afterwards.
+
+    Attributes:
+        id (UUID): Unique identifier for the revocation.
+        user_id (UUID): ID of the user whose tokens are revoked. Not a foreign key, the row
+            has to outlive the purge of a deleted user.
+        session_id (UUID | None): ID of the refresh-token (device session) whose access tokens are
+            revoked. None revokes all access tokens of the user.
+        created_at (datetime): Timestamp of the revocation.
+    """
+    __tablename__ = 'revocations'
+
+    id: Mapped[uuid.UUID] = mapped_column(BinaryUUID, primary_key=True, default=uuid7)
+    user_id: Mapped[uuid.UUID] = mapped_column(BinaryUUID, nullable=False)
+    session_id: Mapped[uuid.UUID | None] = mapped_column(BinaryUUID, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, index=True, default=lambda: datetime.now(timezone.utc))
+
+class Attachment(Base):
+    """
+    Represents an image attached to a post. The file and its thumbnail are kept in the
+    configured storage (see storage.py) under keys derived from the id.
+
+    Attributes:
+        id (UUID): Unique identifier for the attachment.
+        post_id (UUID): ID of the post the image is attached to.
+        content_type (str): MIME type of the image, detected from its content.
+        size (int): Size of the image in bytes.
+        etag (str): SHA-256 hex digest of the image.
+        status (str): 'processing' until the thumbnail is made, then 'ready', or 'failed'
+            if the file could not be read as an image.
+        width (int | None): Width of the image in pixels, known once processed.
+        height (int | None): Height of the image in pixels, known once processed.
+        thumbnail_size (int | None): Size of the thumbnail in bytes.
+        thumbnail_etag (str | None): SHA-256 hex digest of the thumbnail.
+        created_at (datetime): Timestamp for when the image was uploaded.
+        post (Post): Relationship to the post.
+    """
+    __tablename__ = 'attachments'
+    __table_args__ = (
+        Index("ix_attachments_post_id_created_at", "post_id", "created_at"),
+    )
+
+    id: Mapped[uuid.UUID] = mapped_column(BinaryUUID, primary_key=True, default=uuid7)
+    post_id: Mapped[uuid.UUID] = mapped_column(BinaryUUID, ForeignKey("posts.id"), nullable=False)
+    content_type: Mapped[str] = mapped_column(String(50), nullable=False)
+    size: Mapped[int] = mapped_column(Integer, nullable=False)
+    etag: Mapped[str] = mapped_column(String(64), nullable=False)
+    status: Mapped[str] = mapped_column(String(20), nullable=False, default='processing')
+    width: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    height: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    thumbnail_size: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    thumbnail_etag: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    post: Mapped["Post"] = relationship("Post")
+
+class ShardBucket(Base):
+    """
+    Represents the assignment of a bucket of users to a shard (see sharding.py).
+    Only the table of shard 0 is used.
+
+    Attributes:
+        bucket (int): Bucket number, 0 to SHARD_BUCKETS - 1.
+        shard (int): Shard the rows of the bucket live on, an index into [database_url, *shard_urls].
+        moving (bool): Whether rebalance.py is moving the bucket, writes to it are refused meanwhile.
+    """
+    __tablename__ = 'shard_buckets'
+
+    bucket: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    shard: Mapped[int] = mapped_column(Integer, nullable=False)
+    moving: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+
+class Username(Base):
+    """
+    Represents the user holding a username (see services.user_service.claim_username). users.username is
+    only unique per database, with sharding this index on shard 0 keeps usernames unique across shards.
+    Only the table of shard 0 is used.
+
+    Attributes:
+        username (str): The username.
+        user_id (UUID): ID of the user holding it. Not a foreign key, the user can be on another shard.
+    """
+    __tablename__ = 'usernames'
+
+    username: Mapped[str] = mapped_column(String(20), primary_key=True)
+    user_id: Mapped[uuid.UUID] = mapped_column(BinaryUUID, nullable=False)
+
+class Change(Base):
+    """
+    Represents an entry of the change feed (see changes.py), written in the transaction of the change.
+
+    Attributes:
+        seq (int): Position in the feed of the shard, increasing and never reused.
+        txid (int): PostgreSQL transaction id of the change, 0 on other databases. Entries are read
+            in (txid, seq) order, see changes.py.
+        entity (str): 'user', 'post', 'comment' or 'like'.
+        entity_id (UUID): ID of the user, post or comment, the post for likes.
+        user_id (UUID): The user, the owner of the post or comment, the user who liked.
+        op (str): 'create', 'update' or 'delete'.
+        data (dict | None): The entity as the API returns it after the change, None for deletes.
+        created_at (datetime): Timestamp of the change.
+    """
+    __tablename__ = 'changes'
+    __table_args__ = (
+        Index("ix_changes_txid_seq", "txid", "seq"),
+        Index("ix_changes_entity", "entity", "entity_id", "user_id", "seq"),
+        {'sqlite_autoincrement': True},
+    )
+
+    seq: Mapped[int] = mapped_column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True, autoincrement=True)
+    txid: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    entity: Mapped[str] = mapped_column(String(20), nullable=False)
+    entity_id: Mapped[uuid.UUID] = mapped_column(BinaryUUID, nullable=False)
+    user_id: Mapped[uuid.UUID] = mapped_column(BinaryUUID, nullable=False)
+    op: Mapped[str] = mapped_column(String(10), nullable=False)
+    data: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, index=True, default=lambda: datetime.now(timezone.utc))
+
+class PostTag(Base):
+    """
+    Represents a #tag used in the content of a post (see tags.py).
+
+    Attributes:
+        post_id (UUID): ID of the post.
+        tag (str): The tag, without '#' and case-folded.
+        created_at (datetime): Timestamp of when the post was created, the order of the posts of a tag.
+    """
+    __tablename__ = 'post_tags'
+    __table_args__ = (
+        Index("ix_post_tags_tag_created_at", "tag", "created_at", "post_id"),
+    )
+
+    post_id: Mapped[uuid.UUID] = mapped_column(BinaryUUID, ForeignKey("posts.id"), primary_key=True)
+    tag: Mapped[str] = mapped_column(String(50), primary_key=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, index=True)
+
+class PostMention(Base):
+    """
+    Represents an @mention of a user in the content of a post (see tags.py).
+
+    Attributes:
+        post_id (UUID): ID of the post.
+        user_id (UUID): ID of the user mentioned.
+        created_at (datetime): Timestamp of when the post was created, the order of the mentions of a user.
+    """
+    __tablename__ = 'post_mentions'
+    __table_args__ = (
+        Index("ix_post_mentions_user_id_created_at", "user_id", "created_at", "post_id"),
+    )
+
+    post_id: Mapped[uuid.UUID] = mapped_column(BinaryUUID, ForeignKey("posts.id"), primary_key=True)
+    user_id: Mapped[uuid.UUID] = mapped_column(BinaryUUID, primary_key=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
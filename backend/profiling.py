@@ -0,0 +1,279 @@
+import asyncio
+import contextvars
+import secrets
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from types import FrameType
+from settings import get_settings, logger
+
+"""
+profiling.py
+
+On-demand profiling of single requests, for operators.
+
+A request sent with the header `X-Profile: <admin_token>` is run under a sampling profiler.
+The token is only accepted from the header, so it stays out of URLs (access logs, Referer
+headers). Requests without a valid token are served normally. At most one request per worker process is profiled at a time.
+
+While the request runs, a sampler thread takes the stack of every thread working for it
+every PROFILE_SAMPLE_INTERVAL seconds:
+    - the event loop thread while the request's task is running
+    - threadpool threads running the request's sync dependencies and endpoint, recognized
+      by the copied contextvars.Context of the threadpool call
+CPU time is read from the per-thread CPU clocks, DB time is recorded by the statement hooks
+in database.py (record_query).
+
+The result is kept in memory (last MAX_STORED_PROFILES), the response carries its id in the
+X-Profile-Id header. Fetch it from GET /admin/profiles/{id} on the same worker process:
+    - wall, CPU and DB time of the request
+    - time split by the innermost application function (services/routers) on the stack
+    - time split by component (bcrypt, pydantic, sqlalchemy, logging, ...)
+    - the sampled call tree
+"""
+
+PROFILE_SAMPLE_INTERVAL = 0.001
+MAX_STORED_PROFILES = 20
+CALL_TREE_MIN_SHARE = 0.01
+APP_MODULE_PREFIXES = ('services.', 'routers.', 'jobs', 'main')
+APP_PACKAGES = {'services', 'routers', 'jobs', 'main', 'models', 'schemas', 'database', 'dependencies', 'cache', 'broker', 'invalidation', 'settings'}
+COMPONENTS = {
+    'passlib': 'bcrypt', 'bcrypt': 'bcrypt',
+    'pydantic': 'pydantic', 'pydantic_core': 'pydantic',
+    'sqlalchemy': 'sqlalchemy', 'psycopg2': 'sqlalchemy', 'sqlite3': 'sqlalchemy',
+    'logging': 'logging', 'logger': 'logging',
+    'jwt': 'jwt',
+    'fastapi': 'framework', 'starlette': 'framework', 'anyio': 'framework', 'asyncio': 'framework',
+    'concurrent': 'framework', 'threading': 'framework', 'uvicorn': 'framework',
+}
+
+current_profile: contextvars.ContextVar["RequestProfile | None"] = contextvars.ContextVar('current_profile', default=None)
+
+class RequestProfile:
+    """Samples and timings collected for one request"""
+    def __init__(self, method: str, path: str) -> None:
+        self.id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.status: int | None = None
+        self.task: asyncio.Task | None = None
+        self.loop_thread = threading.get_ident()
+        self.wall = 0.0
+        self.samples = 0
+        self.function_time: dict[str, list[float]] = defaultdict(lambda: [0.0, 0.0]) # wall, cpu
+        self.component_time: dict[str, float] = defaultdict(float)
+        self.db_time: dict[str, list[float]] = defaultdict(lambda: [0.0, 0]) # seconds, queries
+        self.call_tree: dict = {'name': 'request', 'seconds': 0.0, 'children': {}}
+        self._lock = threading.Lock()
+
+    def record_query(self, caller: str | None, duration: float) -> None:
+        with self._lock:
+            entry = self.db_time[caller or 'unknown']
+            entry[0] += duration
+            entry[1] += 1
+
+    def add_sample(self, frames: list[FrameType], seconds: float, cpu_seconds: float) -> None:
+        """Adds one stack (outermost frame first) weighted by the time since the previous sample"""
+        names = [_frame_name(frame) for frame in frames]
+        app_function = next((name for name in reversed(names) if name.startswith(APP_MODULE_PREFIXES)), 'framework')
+        leaf_module = frames[-1].f_globals.get('__name__', '') if frames else ''
+        package = leaf_module.split('.')[0]
+        component = COMPONENTS.get(package, 'app' if package in APP_PACKAGES else 'other')
+        with self._lock:
+            self.samples += 1
+            timing = self.function_time[app_function]
+            timing[0] += seconds
+            timing[1] += cpu_seconds
+            self.component_time[component] += seconds
+            node = self.call_tree
+            node['seconds'] += seconds
+            for name in names:
+                node = node['children'].setdefault(name, {'name': name, 'seconds': 0.0, 'children': {}})
+                node['seconds'] += seconds
+
+    def report(self) -> dict:
+        with self._lock:
+            cpu = sum(cpu for _, cpu in self.function_time.values())
+            db = sum(seconds for seconds, _ in self.db_time.values())
+            functions = set(self.function_time) | set(self.db_time)
+            return {
+                'id': self.id,
+                'method': self.method,
+                'path': self.path,
+                'status': self.status,
+                'wall_ms': _ms(self.wall),
+                'cpu_ms': _ms(cpu),
+                'db_ms': _ms(db),
+                'samples': self.samples,
+                'sample_interval_ms': PROFILE_SAMPLE_INTERVAL * 1000,
+                'by_function': sorted((
+                    {'function': function,
+                     'wall_ms': _ms(self.function_time[function][0]) if function in self.function_time else 0.0,
+                     'cpu_ms': _ms(self.function_time[function][1]) if function in self.function_time else 0.0,
+                     'db_ms': _ms(self.db_time[function][0]) if function in self.db_time else 0.0,
+                     'queries': self.db_time[function][1] if function in self.db_time else 0}
+                    for function in functions), key=lambda row: row['wall_ms'], reverse=True),
+                'by_component': {component: _ms(seconds) for component, seconds in
+                                 sorted(self.component_time.items(), key=lambda item: item[1], reverse=True)},
+                'call_tree': _prune(self.call_tree, self.call_tree['seconds'] * CALL_TREE_MIN_SHARE),
+            }
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 2)
+
+def _frame_name(frame: FrameType) -> str:
+    return f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_name}"
+
+def _prune(node: dict, min_seconds: float) -> dict:
+    """Call tree without nodes below min_seconds, children as lists"""
+    return {
+        'name': node['name'],
+        'ms': _ms(node['seconds']),
+        'children': [_prune(child, min_seconds) for child in
+                     sorted(node['children'].values(), key=lambda child: child['seconds'], reverse=True)
+                     if child['seconds'] >= min_seconds],
+    }
+
+def _task_context(task: asyncio.Task) -> contextvars.Context | None:
+    get_context = getattr(task, 'get_context', None) # Python 3.12+
+    return get_context() if get_context else None
+
+def _stack(frame: FrameType) -> list[FrameType]:
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+def _runs_for(profile: RequestProfile, thread_id: int, frames: list[FrameType], loop: asyncio.AbstractEventLoop) -> list[FrameType] | None:
+    """The part of a thread's stack working for the profiled request, None if the thread works on something else"""
+    if thread_id == profile.loop_thread:
+        task = asyncio.current_task(loop)
+        if task is None:
+            return None
+        context = _task_context(task)
+        return frames if task is profile.task or (context is not None and context.get(current_profile) is profile) else None
+    # threadpool threads run each call with context.run(func), the copied context is a local of the caller frame
+    for index, frame in enumerate(frames):
+        context = frame.f_locals.get('context')
+        if isinstance(context, contextvars.Context):
+            return frames[index + 1:] if context.get(current_profile) is profile else None
+    return None
+
+class Sampler(threading.Thread):
+    """Samples the threads working for one request until stopped"""
+    def __init__(self, profile: RequestProfile, loop: asyncio.AbstractEventLoop) -> None:
+        super().__init__(name='request-profiler', daemon=True)
+        self.profile = profile
+        self.loop = loop
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        own_thread = threading.get_ident()
+        last = time.perf_counter()
+        last_cpu: dict[int, float] = {}
+        while not self.stopped.wait(PROFILE_SAMPLE_INTERVAL):
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                frames = _runs_for(self.profile, thread_id, _stack(frame), self.loop)
+                if not frames:
+                    last_cpu.pop(thread_id, None)
+                    continue
+                cpu = _thread_cpu_time(thread_id)
+                cpu_seconds = cpu - last_cpu[thread_id] if thread_id in last_cpu and cpu is not None else 0.0
+                if cpu is not None:
+                    last_cpu[thread_id] = cpu
+                self.profile.add_sample(frames, elapsed, max(cpu_seconds, 0.0))
+
+def _thread_cpu_time(thread_id: int) -> float | None:
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(thread_id))
+    except (AttributeError, OSError):
+        return None
+
+class ProfileStore:
+    """The most recent request profiles of this worker process"""
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._profiles: OrderedDict[str, dict] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, report: dict) -> None:
+        with self._lock:
+            self._profiles[report['id']] = report
+            while len(self._profiles) > self.maxsize:
+                self._profiles.popitem(last=False)
+
+    def get(self, profile_id: str) -> dict | None:
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def list(self) -> list[dict]:
+        with self._lock:
+            return [{key: report[key] for key in ('id', 'method', 'path', 'status', 'wall_ms', 'cpu_ms', 'db_ms')}
+                    for report in reversed(self._profiles.values())]
+
+profile_store = ProfileStore(MAX_STORED_PROFILES)
+_profiling_lock = threading.Lock()
+
+def _requested_token(scope) -> str | None:
+    for name, value in scope['headers']:
+        if name == b'x-profile':
+            return value.decode('latin-1')
+    return None
+
+class ProfilingMiddleware:
+    """ASGI middleware running requests that ask for it with a valid admin token under the profiler"""
+    def __init__(self, app) -> None:
+        self.app = app
+        self.admin_token = get_settings().admin_token
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        token = _requested_token(scope)
+        if token is None:
+            return await self.app(scope, receive, send)
+        if not self.admin_token or not secrets.compare_digest(token, self.admin_token):
+            logger.warning('Profiling requested with an invalid token', extra={'path': scope['path']})
+            return await self.app(scope, receive, send)
+        if not _profiling_lock.acquire(blocking=False):
+            logger.warning('Profiling skipped, another request is being profiled', extra={'path': scope['path']})
+            return await self.app(scope, receive, send)
+        try:
+            await self._profile(scope, receive, send)
+        finally:
+            _profiling_lock.release()
+
+    async def _profile(self, scope, receive, send) -> None:
+        profile = RequestProfile(scope['method'], scope['path'])
+        profile.task = asyncio.current_task()
+        reset = current_profile.set(profile)
+        sampler = Sampler(profile, asyncio.get_running_loop())
+        started = time.perf_counter()
+
+        async def send_with_profile_headers(message) -> None:
+            if message['type'] == 'http.response.start':
+                profile.status = message['status']
+                headers = list(message.get('headers', []))
+                headers.append((b'x-profile-id', profile.id.encode()))
+                message = {**message, 'headers': headers}
+            await send(message)
+
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_headers)
+        finally:
+            sampler.stopped.set()
+            sampler.join()
+            profile.wall = time.perf_counter() - started
+            current_profile.reset(reset)
+            report = profile.report()
+            profile_store.add(report)
+            logger.info('Request profiled', extra={key: report[key] for key in ('id', 'method', 'path', 'status', 'wall_ms', 'cpu_ms', 'db_ms', 'samples')})
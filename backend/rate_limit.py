@@ -0,0 +1,38 @@
+from fastapi import Request
+from limits import parse
+from slowapi import Limiter
+from slowapi.errors import RateLimitExceeded
+from slowapi.util import get_remote_address
+from slowapi.wrappers import Limit
+from settings import get_settings
+
+"""
+rate_limit.py
+
+Rate limiting of the API (slowapi).
+
+- limiter: every request costs one hit of the default limit per client address, checked by
+  the SlowAPIMiddleware added in main.py
+- charge_bulk_items: the bulk write endpoints (POST /posts/bulk, /likes/bulk, /comments/bulk)
+  additionally cost one hit of the bulk_rate_limit setting per item, charged after the request
+  body is validated, so a client can't write more items per minute in batches than it could
+  one at a time
+"""
+
+settings = get_settings()
+
+limiter = Limiter(key_func=get_remote_address, strategy="moving-window", default_limits=["10/minute"])
+
+BULK_ITEMS_LIMIT = Limit(parse(settings.bulk_rate_limit), key_func=get_remote_address, scope='bulk_items',
+                         per_method=False, methods=None, error_message=None, exempt_when=None, cost=1,
+                         override_defaults=False)
+
+def charge_bulk_items(request: Request, items: int) -> None:
+    """Charges items hits of the bulk item limit to the client of request, raises RateLimitExceeded (429) when exceeded"""
+    if not limiter.enabled:
+        return
+    args = [BULK_ITEMS_LIMIT.key_func(request), BULK_ITEMS_LIMIT.scope]
+    # read by the RateLimitExceeded handler (and for the rate limit headers), as for limits checked by slowapi
+    request.state.view_rate_limit = (BULK_ITEMS_LIMIT.limit, args)
+    if not limiter.limiter.hit(BULK_ITEMS_LIMIT.limit, *args, cost=items):
+        raise RateLimitExceeded(BULK_ITEMS_LIMIT)
@@ -0,0 +1,191 @@
+import argparse
+import time
+from collections import Counter
+from uuid import UUID
+from sqlalchemy import Connection, delete, insert, select, tuple_, update
+from database import shard_engines
+from models.models import Attachment, Comment, Like, Notification, Post, PostMention, PostTag, RefreshToken, ShardBucket, User
+from settings import get_settings, logger
+from sharding import PRIMARY_SHARD, SHARD_BUCKETS, SHARDS, user_bucket
+
+"""
+rebalance.py
+
+Moves buckets of users (see sharding.py) between shards. Run it from the backend directory
+with the same DATABASE_URL and SHARD_URLS as the server, while the server keeps running.
+
+Moving a bucket:
+    1. mark it moving in shard_buckets, every server process refuses writes to it (503) once it
+       reloaded the map, so wait SETTLE_INTERVALS refresh intervals
+    2. copy its rows to the new shard in one transaction: users, refresh_tokens, posts,
+       comments (parents first), likes, attachments, notifications, post_tags and post_mentions
+       of the bucket
+    3. assign it to the new shard and clear moving, wait again until every process reads from there
+    4. delete the rows from the old shard (replies first)
+A move interrupted before step 3 leaves the bucket on its old shard and marked moving, run
+the same move again: rows left on the new shard by the interrupted copy are deleted first.
+
+Rows of a bucket are found through its users, so the users table of the source shard is
+scanned once per batch. Jobs, revocations and the change feed are not bucketed and stay where they are.
+
+Usage:
+    python rebalance.py status
+    python rebalance.py move --bucket 17 18 --to 2
+    python rebalance.py move --user 1b4e28ba-2fa1-11d2-883f-0016d3cca427 --to 2   # moves the whole bucket of the user
+    python rebalance.py rebalance --dry-run       # spread the buckets evenly over all shards
+"""
+
+settings = get_settings()
+SETTLE_INTERVALS = 2
+CHUNK_SIZE = 500
+
+def _chunks(values: list) -> list[list]:
+    return [values[start:start + CHUNK_SIZE] for start in range(0, len(values), CHUNK_SIZE)]
+
+def _settle() -> None:
+    """Waits until every server process reloaded the shard map"""
+    time.sleep(SETTLE_INTERVALS * settings.shard_map_refresh_seconds + 0.5)
+
+def _assignment(connection: Connection) -> dict[int, tuple[int, bool]]:
+    rows = connection.execute(select(ShardBucket.bucket, ShardBucket.shard, ShardBucket.moving)).all()
+    if len(rows) != SHARD_BUCKETS:
+        raise SystemExit('shard_buckets is not seeded, start the server with SHARD_URLS set first')
+    return {bucket: (shard, moving) for bucket, shard, moving in rows}
+
+def _bucket_rows(connection: Connection, buckets: set[int]) -> list[tuple]:
+    """(table, rows) of the buckets on the shard of connection, in insert order"""
+    user_ids = [user_id for user_id in connection.execute(select(User.id)).scalars() if user_bucket(user_id) in buckets]
+    rows = []
+    def collect(table, column, ids: list) -> list[dict]:
+        collected = []
+        for chunk in _chunks(ids):
+            collected.extend(dict(row._mapping) for row in connection.execute(select(table).where(column.in_(chunk))))
+        rows.append((table, collected))
+        return collected
+    collect(User.__table__, User.id, user_ids)
+    collect(RefreshToken.__table__, RefreshToken.user_id, user_ids)
+    post_ids = [post['id'] for post in collect(Post.__table__, Post.owner_id, user_ids)]
+    comments = collect(Comment.__table__, Comment.post_id, post_ids)
+    comments.sort(key=lambda comment: comment['depth']) # parents before their replies
+    collect(Like.__table__, Like.post_id, post_ids)
+    collect(Attachment.__table__, Attachment.post_id, post_ids)
+    collect(Notification.__table__, Notification.recipient_id, user_ids)
+    collect(PostTag.__table__, PostTag.post_id, post_ids)
+    collect(PostMention.__table__, PostMention.post_id, post_ids)
+    return rows
+
+def _delete_rows(connection: Connection, rows: list[tuple]) -> None:
+    """Deletes rows collected by _bucket_rows, in reverse insert order"""
+    for table, table_rows in reversed(rows):
+        if table.name == 'comments':
+            table_rows = sorted(table_rows, key=lambda comment: comment['depth'], reverse=True) # replies first
+        key = list(table.primary_key.columns)
+        for chunk in _chunks(table_rows):
+            if len(key) > 1: # likes, post_tags, post_mentions
+                criteria = tuple_(*key).in_([tuple(row[column.name] for column in key) for row in chunk])
+            else:
+                criteria = key[0].in_([row[key[0].name] for row in chunk])
+            connection.execute(delete(table).where(criteria))
+
+def move_buckets(buckets: list[int], target: int) -> None:
+    """Moves buckets to the shard target, following the protocol in the module docstring"""
+    if not 0 <= target < SHARDS:
+        raise SystemExit(f'no shard {target}, shards are 0..{SHARDS - 1}')
+    primary = shard_engines[PRIMARY_SHARD][0]
+    with primary.connect() as connection:
+        assignment = _assignment(connection)
+    by_source: dict[int, set[int]] = {}
+    for bucket in buckets:
+        if assignment[bucket][0] != target:
+            by_source.setdefault(assignment[bucket][0], set()).add(bucket)
+    if not by_source:
+        print('nothing to move')
+        return
+
+    moving = [bucket for source_buckets in by_source.values() for bucket in source_buckets]
+    with primary.begin() as connection:
+        connection.execute(update(ShardBucket).where(ShardBucket.bucket.in_(moving)).values(moving=True))
+    logger.info('Buckets marked moving', extra={'buckets': len(moving), 'target': target})
+    _settle()
+
+    copied = {}
+    for source, source_buckets in by_source.items():
+        with shard_engines[source][0].connect() as connection:
+            copied[source] = _bucket_rows(connection, source_buckets)
+        with shard_engines[target][0].begin() as connection:
+            _delete_rows(connection, copied[source]) # leftovers of an interrupted move
+            for table, table_rows in copied[source]:
+                for start in range(0, len(table_rows), CHUNK_SIZE):
+                    connection.execute(insert(table), table_rows[start:start + CHUNK_SIZE])
+        print(f'copied {sum(len(table_rows) for _, table_rows in copied[source])} rows of {len(source_buckets)} buckets from shard {source} to {target}')
+
+    with primary.begin() as connection:
+        connection.execute(update(ShardBucket).where(ShardBucket.bucket.in_(moving)).values(shard=target, moving=False))
+    logger.info('Buckets assigned', extra={'buckets': len(moving), 'target': target})
+    _settle()
+
+    for source, rows in copied.items():
+        with shard_engines[source][0].begin() as connection:
+            _delete_rows(connection, rows)
+    logger.info('Buckets moved', extra={'buckets': len(moving), 'target': target,
+                                        'rows': sum(len(table_rows) for rows in copied.values() for _, table_rows in rows)})
+    print(f'moved {len(moving)} buckets to shard {target}')
+
+def plan_rebalance() -> list[tuple[int, int]]:
+    """(bucket, target) moves spreading the buckets evenly over all shards, moving as few as possible"""
+    with shard_engines[PRIMARY_SHARD][0].connect() as connection:
+        assignment = _assignment(connection)
+    owned: dict[int, list[int]] = {shard: [] for shard in range(SHARDS)}
+    for bucket, (shard, _) in sorted(assignment.items()):
+        owned[shard].append(bucket)
+    quota = [SHARD_BUCKETS // SHARDS + (shard < SHARD_BUCKETS % SHARDS) for shard in range(SHARDS)]
+    surplus = [bucket for shard in range(SHARDS) for bucket in owned[shard][quota[shard]:]]
+    moves = []
+    for shard in range(SHARDS):
+        for _ in range(quota[shard] - len(owned[shard])):
+            moves.append((surplus.pop(), shard))
+    return moves
+
+def print_status() -> None:
+    with shard_engines[PRIMARY_SHARD][0].connect() as connection:
+        assignment = _assignment(connection)
+    buckets = Counter(shard for shard, _ in assignment.values())
+    moving = Counter(shard for shard, is_moving in assignment.values() if is_moving)
+    for shard, (writer, _) in enumerate(shard_engines):
+        with writer.connect() as connection:
+            users = len(connection.execute(select(User.id)).all())
+        print(f'shard {shard}: {buckets[shard]} buckets ({moving[shard]} moving), {users} users  {writer.url.render_as_string()}')
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Move buckets of users between shards')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('status', help='buckets and users per shard')
+    move = commands.add_parser('move', help='move buckets to a shard')
+    source = move.add_mutually_exclusive_group(required=True)
+    source.add_argument('--bucket', type=int, nargs='+', choices=range(SHARD_BUCKETS), metavar='BUCKET')
+    source.add_argument('--user', type=UUID, nargs='+', help='move the buckets of these users')
+    move.add_argument('--to', type=int, required=True, help='target shard')
+    rebalance = commands.add_parser('rebalance', help='spread the buckets evenly over all shards')
+    rebalance.add_argument('--dry-run', action='store_true', help='only print the moves')
+    rebalance.add_argument('--batch', type=int, default=16, help='buckets moved together (default 16)')
+    args = parser.parse_args()
+
+    if SHARDS == 1:
+        raise SystemExit('sharding is not enabled, set SHARD_URLS')
+    if args.command == 'status':
+        print_status()
+    elif args.command == 'move':
+        move_buckets(args.bucket or [user_bucket(user_id) for user_id in args.user], args.to)
+    else:
+        moves = plan_rebalance()
+        by_target: dict[int, list[int]] = {}
+        for bucket, target in moves:
+            by_target.setdefault(target, []).append(bucket)
+        for target, buckets in by_target.items():
+            print(f'{len(buckets)} buckets to shard {target}')
+            if not args.dry_run:
+                for start in range(0, len(buckets), args.batch):
+                    move_buckets(buckets[start:start + args.batch], target)
+
+if __name__ == '__main__':
+    main()
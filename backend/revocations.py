@@ -0,0 +1,161 @@
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+from sqlalchemy import delete, event, select
+from sqlalchemy.orm import Session
+from cache import BloomFilter
+from database import ReadSessionLocal
+from models.models import Revocation
+from settings import get_settings, logger
+
+"""
+revocations.py
+
+Denylist of revoked access tokens, for authentication without a database query (stateless_auth).
+
+In stateless mode access tokens carry the claims of the user they were issued to, so a request
+can be authenticated from the token alone. What the token cannot know is whether it was revoked
+after it was issued. Revocations are recorded in the revocations table:
+    - user revocations (session_id None) when a user is deactivated or deleted
+    - session revocations when a device session logs out (session_id = refresh-token id)
+An access token is revoked if it was issued at or before a revocation of its user or session.
+
+Only revocations younger than the access token lifetime matter, older rows are deleted when a
+new revocation is written. Every worker process keeps the remaining rows in memory:
+    - a BloomFilter of the revoked users and sessions, which answers the common case (not
+      revoked) without touching the exact data
+    - the exact revocation times, to confirm hits of the filter
+The list is reloaded every revocation_refresh_seconds, revocations committed by this process
+are applied immediately. A revocation from another worker process therefore takes effect
+there after at most revocation_refresh_seconds. If the list could not be refreshed for
+REVOCATION_STALE_AFTER intervals, is_fresh() is False and callers have to fall back to the
+database.
+
+JWT iat has a resolution of seconds, so a token issued in the same second as the revocation
+of its session, but after it, is revoked too.
+
+Usage:
+    revoke(session, user_id)               # in the transaction deactivating the user
+    revoke(session, user_id, session_id)   # in the transaction revoking a refresh-token
+    revocation_list.is_revoked(user_id, session_id, issued_at)
+    await revocation_list.start() / await revocation_list.stop() from the FastAPI lifespan.
+"""
+
+REVOCATION_STALE_AFTER = 3
+REVOCATION_BLOOM_ERROR_RATE = 0.01
+REVOCATION_BLOOM_MIN_CAPACITY = 1024
+CLOCK_SKEW_SECONDS = 60
+
+settings = get_settings()
+REVOCATION_WINDOW = timedelta(minutes=settings.access_token_expire_minutes, seconds=CLOCK_SKEW_SECONDS)
+
+def _key(user_id: UUID, session_id: UUID | None) -> bytes:
+    return b'u' + user_id.bytes if session_id is None else b's' + session_id.bytes
+
+def _as_utc(value: datetime) -> datetime:
+    """SQLite returns naive datetimes (stored as UTC)"""
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+def revoke(session: Session, user_id: UUID, session_id: UUID | None = None) -> None:
+    """
+    Adds a revocation of the access tokens of a user (of one device session if session_id is given)
+    to the callers transaction. It is applied in this process when the caller commits.
+    """
+    now = datetime.now(timezone.utc)
+    session.add(Revocation(user_id=user_id, session_id=session_id, created_at=now))
+    session.execute(delete(Revocation).where(Revocation.created_at < now - REVOCATION_WINDOW))
+    session.info.setdefault('revocations', []).append((_key(user_id, session_id), now.timestamp()))
+    logger.debug('Access tokens revoked', extra={'user_id': user_id, 'session_id': session_id})
+
+@event.listens_for(Session, 'after_commit')
+def _apply_revocations_after_commit(session: Session) -> None:
+    for key, revoked_at in session.info.pop('revocations', ()):
+        revocation_list.add(key, revoked_at)
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_revocations_after_rollback(session: Session) -> None:
+    session.info.pop('revocations', None)
+
+class RevocationList:
+    """In-memory copy of the recent revocations, refreshed periodically"""
+    def __init__(self, refresh_seconds: float) -> None:
+        self.refresh_seconds = refresh_seconds
+        self._bloom = BloomFilter(REVOCATION_BLOOM_MIN_CAPACITY, REVOCATION_BLOOM_ERROR_RATE)
+        self._revoked_at: dict[bytes, float] = {}
+        self._local: dict[bytes, float] = {} # committed here, possibly missed by a concurrent refresh
+        self._refreshed_at: float | None = None
+        self._lock = threading.Lock()
+        self._task: asyncio.Task | None = None
+
+    def refresh(self) -> None:
+        """Reloads the revocations of the last access token lifetime"""
+        started = time.monotonic()
+        cutoff = datetime.now(timezone.utc) - REVOCATION_WINDOW
+        with ReadSessionLocal() as session:
+            rows = session.execute(
+                select(Revocation.user_id, Revocation.session_id, Revocation.created_at)
+                .where(Revocation.created_at >= cutoff)
+            ).all()
+        revoked_at: dict[bytes, float] = {}
+        for user_id, session_id, created_at in rows:
+            key = _key(user_id, session_id)
+            revoked_at[key] = max(revoked_at.get(key, 0.0), _as_utc(created_at).timestamp())
+        with self._lock:
+            self._local = {key: at for key, at in self._local.items() if at >= cutoff.timestamp()}
+            for key, at in self._local.items():
+                revoked_at[key] = max(revoked_at.get(key, 0.0), at)
+            bloom = BloomFilter(max(2 * len(revoked_at), REVOCATION_BLOOM_MIN_CAPACITY), REVOCATION_BLOOM_ERROR_RATE)
+            for key in revoked_at:
+                bloom.add(key)
+            self._bloom, self._revoked_at, self._refreshed_at = bloom, revoked_at, started
+        logger.debug('Revocation list refreshed', extra={'revocations': len(revoked_at)})
+
+    def add(self, key: bytes, revoked_at: float) -> None:
+        with self._lock:
+            self._local[key] = revoked_at
+            self._revoked_at[key] = max(self._revoked_at.get(key, 0.0), revoked_at)
+            self._bloom.add(key)
+
+    def is_fresh(self) -> bool:
+        """Whether the list was refreshed within REVOCATION_STALE_AFTER refresh intervals"""
+        refreshed_at = self._refreshed_at
+        return refreshed_at is not None and time.monotonic() - refreshed_at < REVOCATION_STALE_AFTER * self.refresh_seconds
+
+    def is_revoked(self, user_id: UUID, session_id: UUID | None, issued_at: float) -> bool:
+        """Whether an access token of user_id (and device session_id) issued at issued_at was revoked"""
+        keys = [_key(user_id, None)] if session_id is None else [_key(user_id, None), _key(user_id, session_id)]
+        for key in keys:
+            if key in self._bloom:
+                revoked_at = self._revoked_at.get(key)
+                if revoked_at is not None and issued_at <= revoked_at:
+                    return True
+        return False
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        try:
+            await asyncio.to_thread(self.refresh)
+        except Exception:
+            logger.exception('Loading the revocation list failed')
+        self._task = asyncio.create_task(self._run())
+        logger.info('Revocation list started', extra={'refresh_seconds': self.refresh_seconds})
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        self._task = None
+        logger.info('Revocation list stopped')
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception:
+                logger.exception('Refreshing the revocation list failed')
+
+revocation_list = RevocationList(settings.revocation_refresh_seconds)
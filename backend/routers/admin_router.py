@@ -0,0 +1,134 @@
+from fastapi import APIRouter, Depends, Query
+from typing import Annotated, Literal
+from uuid import UUID
+from dependencies import SessionDep, ReadSessionDep
+from schemas.job_schemas import JobPublic
+import services.job_service
+import services.profile_service
+import services.memory_service
+from services.memory_service import GroupBy
+from memory import MAX_FRAMES
+from services.authentication_service import verify_admin_token
+
+"""
+admin_router.py
+
+Defines the /admin/* API endpoints, for operators.
+Every endpoint requires the X-Admin-Token header to match the admin_token setting.
+
+Endpoints:
+- GET   /admin/jobs/metrics -> Get depth and latency metrics of the background job queues
+- GET   /admin/jobs -> Get a list of background jobs, optionally by queue and status
+- POST  /admin/jobs/{job_id}/retry -> Retry a failed background job
+- GET   /admin/profiles -> Get a summary of the requests profiled by the worker process
+- GET   /admin/profiles/{profile_id} -> Get the profile of a request (see profiling.py)
+- GET   /admin/memory -> Get RSS and traced memory of the worker process and its memory snapshots (see memory.py)
+- POST  /admin/memory/start -> Start tracing allocations (tracemalloc) and the memory of requests
+- POST  /admin/memory/stop -> Stop tracing allocations, drops the snapshots
+- POST  /admin/memory/snapshots -> Take a memory snapshot
+- GET   /admin/memory/snapshots/{snapshot_id} -> Get the top allocation sites of a snapshot
+- GET   /admin/memory/snapshots/{snapshot_id}/diff -> Get the allocation sites that grew since another snapshot
+- GET   /admin/memory/requests -> Get ORM objects loaded, identity map size and peak allocation of requests per route
+"""
+
+router = APIRouter(prefix='/admin', tags=['admin'], dependencies=[Depends(verify_admin_token)])
+
+@router.get('/jobs/metrics')
+def get_job_metrics(session: ReadSessionDep) -> dict:
+    """
+    Get queue depth (pending, running, failed), the age of the oldest due job, and the processed counts
+    and wait/run latencies of the worker process that handled the request.
+    """
+    metrics = services.job_service.get_job_metrics(session)
+    return metrics
+
+@router.get('/jobs', response_model=list[JobPublic])
+def get_jobs(session: ReadSessionDep, queue: str | None = None,
+             status: Literal['pending', 'running', 'failed'] | None = None,
+             offset: int = 0, limit: Annotated[int, Query(le=100)] = 100):
+    """
+    Get a paginated list of background jobs, oldest first.
+    """
+    jobs = services.job_service.get_jobs(session, queue, status, offset, limit)
+    return jobs
+
+@router.post('/jobs/{job_id}/retry', response_model=JobPublic)
+def retry_job(job_id: UUID, session: SessionDep):
+    """
+    Retry a failed background job.
+    """
+    job = services.job_service.retry_job(job_id, session)
+    return job
+
+@router.get('/profiles')
+def get_profiles() -> list[dict]:
+    """
+    Get a summary of the most recent profiled requests of the worker process that handled the request, latest first.
+    """
+    profiles = services.profile_service.get_profiles()
+    return profiles
+
+@router.get('/profiles/{profile_id}')
+def get_profile(profile_id: str) -> dict:
+    """
+    Get the profile of a request: wall, CPU and DB time, time by service function and component, and the call tree.
+    """
+    profile = services.profile_service.get_profile(profile_id)
+    return profile
+
+@router.get('/memory')
+def get_memory_status() -> dict:
+    """
+    Get RSS and traced memory of the worker process that handled the request, whether tracing is active, and its snapshots.
+    """
+    memory = services.memory_service.get_memory_status()
+    return memory
+
+@router.post('/memory/start')
+def start_memory_tracing(frames: Annotated[int, Query(ge=1, le=MAX_FRAMES)] = 10) -> dict:
+    """
+    Start tracing allocations with tracemalloc, keeping up to frames frames per allocation. Slows the worker process down.
+    """
+    memory = services.memory_service.start_memory_tracing(frames)
+    return memory
+
+@router.post('/memory/stop')
+def stop_memory_tracing() -> dict:
+    """
+    Stop tracing allocations, dropping the snapshots and the request statistics.
+    """
+    memory = services.memory_service.stop_memory_tracing()
+    return memory
+
+@router.post('/memory/snapshots')
+def take_memory_snapshot(group_by: GroupBy = 'lineno', limit: Annotated[int, Query(le=100)] = 20) -> dict:
+    """
+    Take a snapshot of the traced allocations, returns its id and top allocation sites.
+    """
+    snapshot = services.memory_service.take_memory_snapshot(group_by, limit)
+    return snapshot
+
+@router.get('/memory/snapshots/{snapshot_id}')
+def get_memory_snapshot(snapshot_id: str, group_by: GroupBy = 'lineno', limit: Annotated[int, Query(le=100)] = 20) -> list[dict]:
+    """
+    Get the largest allocation sites of a snapshot, by line, file or traceback.
+    """
+    top = services.memory_service.get_memory_snapshot(snapshot_id, group_by, limit)
+    return top
+
+@router.get('/memory/snapshots/{snapshot_id}/diff')
+def diff_memory_snapshots(snapshot_id: str, base: str, group_by: GroupBy = 'lineno',
+                          limit: Annotated[int, Query(le=100)] = 20) -> list[dict]:
+    """
+    Get the allocation sites that grew most from the base snapshot to this one.
+    """
+    diff = services.memory_service.diff_memory_snapshots(snapshot_id, base, group_by, limit)
+    return diff
+
+@router.get('/memory/requests')
+def get_request_memory() -> list[dict]:
+    """
+    Get the ORM objects loaded, the largest identity map and the peak allocation of the requests per route, since tracing started.
+    """
+    requests = services.memory_service.get_request_memory()
+    return requests
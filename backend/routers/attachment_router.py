@@ -0,0 +1,55 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+from uuid import UUID
+from schemas.attachment_schemas import AttachmentPublic
+import services.attachment_service
+from dependencies import SessionDep, ReadSessionDep
+from services.authentication_service import CurrentUser
+
+"""
+attachment_router.py
+
+Defines the /attachments/* API endpoints.
+Attachments are uploaded and listed under /posts/{post_id}/attachments.
+
+Images and thumbnails are streamed with ETag/Last-Modified (conditional requests get 304)
+and single byte range support (Range, If-Range).
+
+Endpoints:
+- GET   /attachments/{attachment_id} -> Get the image of an attachment
+- GET   /attachments/{attachment_id}/thumbnail -> Get the thumbnail of an attachment, once processed
+- GET   /attachments/{attachment_id}/info -> Get a single attachment
+- DELETE    /attachments/{attachment_id} -> Delete an attachment (requires authentication)
+"""
+
+router = APIRouter(prefix='/attachments', tags=['attachments'])
+
+@router.get('/{attachment_id}', response_class=StreamingResponse)
+def get_attachment_file(attachment_id: UUID, request: Request, session: ReadSessionDep):
+    """
+    Get the image of a specific attachment.
+    """
+    return services.attachment_service.attachment_response(attachment_id, False, request, session)
+
+@router.get('/{attachment_id}/thumbnail', response_class=StreamingResponse)
+def get_attachment_thumbnail(attachment_id: UUID, request: Request, session: ReadSessionDep):
+    """
+    Get the thumbnail of a specific attachment, available once its status is 'ready'.
+    """
+    return services.attachment_service.attachment_response(attachment_id, True, request, session)
+
+@router.get('/{attachment_id}/info', response_model=AttachmentPublic)
+def get_attachment(attachment_id: UUID, session: ReadSessionDep):
+    """
+    Get a specific attachment by ID.
+    """
+    attachment = services.attachment_service.get_attachment(attachment_id, session)
+    return attachment
+
+@router.delete('/{attachment_id}')
+def delete_attachment(attachment_id: UUID, session: SessionDep, current_user: CurrentUser) -> dict:
+    """
+    Delete an attachment of a post owned by the authenticated user.
+    """
+    services.attachment_service.delete_attachment(attachment_id, current_user.id, session)
+    return {'Ok': True}
@@ -0,0 +1,50 @@
+from fastapi import APIRouter, Header, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import Annotated
+from schemas.change_schemas import ChangeCursor, ChangePage
+import services.change_service
+from dependencies import ReadSessionDep
+from services.pagination import MAX_PAGE_SIZE
+
+"""
+change_router.py
+
+Defines the /changes/* API endpoints, the change feed of users, posts, comments and likes (see changes.py).
+
+Endpoints:
+- GET   /changes/ -> Get a page of changes after a cursor
+- GET   /changes/head -> Get the cursor of the current end of the feed
+- GET   /changes/stream -> Stream the changes after a cursor, and new ones as they happen (Server-Sent Events)
+"""
+
+router = APIRouter(prefix='/changes', tags=['changes'])
+
+@router.get('/', response_model=ChangePage)
+def read_changes(session: ReadSessionDep, since: str | None = None,
+                 limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = MAX_PAGE_SIZE):
+    """
+    Get a page of changes (creates, updates and deletes of users, posts, comments and likes) after the cursor since,
+    from the start of the retained feed without. Pass next_cursor as since to continue, also when the page is empty.
+    410 means the cursor expired: download everything again, starting from /changes/head.
+    """
+    page = services.change_service.get_changes(session, since, limit)
+    return page
+
+@router.get('/head', response_model=ChangeCursor)
+def read_changes_head(session: ReadSessionDep):
+    """
+    Get the cursor of the current end of the feed. Take it before downloading everything, then sync from it.
+    """
+    cursor = services.change_service.get_head_cursor(session)
+    return {'cursor': cursor}
+
+@router.get('/stream', response_class=StreamingResponse)
+def stream_changes(request: Request, since: str | None = None,
+                   last_event_id: Annotated[str | None, Header()] = None):
+    """
+    Stream the changes after the cursor since, then new changes as they happen, as Server-Sent Events.
+    The id of every event is the cursor after it, reconnects resume from the Last-Event-ID header.
+    """
+    positions = services.change_service.decode_change_cursor(last_event_id or since)
+    return StreamingResponse(services.change_service.stream_changes(request, positions), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache'})
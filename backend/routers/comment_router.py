@@ -1,9 +1,14 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Query, Request
+from typing import Annotated
 from uuid import UUID
-from dependencies import SessionDep
-from schemas.comment_schemas import CommentPublic, CommentUpdate
+from dependencies import SessionDep, ReadSessionDep
+from schemas.comment_schemas import CommentPublic, CommentUpdate, CommentCreate, CommentBulkCreate, CommentThread
+from schemas.bulk_schemas import BulkResult
+import services.post_service
+from services.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 import services.comment_service
 from services.authentication_service import CurrentUser
+from rate_limit import charge_bulk_items
 
 """
 comments_router.py
@@ -11,23 +16,55 @@ comments_router.py
 Defines the /comments/* API endpoints.
 
 Endpoints:
+- POST  /comments/bulk -> Create many top-level comments, on any posts, in one transaction (requires authentication)
 - GET   /comments/{comment_id} -> Get a single comment
+- GET   /comments/{comment_id}/replies -> Get a page of replies to a comment, including nested replies
+- POST  /comments/{comment_id}/replies -> Reply to a comment (requires authentication)
 - PUT   /comments/{comment_id} -> Update a comment (requires authentication)
 - DELETE    /comments/{comment_id} -> Delete a comment (requires authentication)
 """
 
 router = APIRouter(prefix='/comments', tags=['comments'])
 
+@router.post('/bulk', response_model=BulkResult)
+def create_comments_bulk(comments: CommentBulkCreate, request: Request, session: SessionDep, current_user: CurrentUser):
+    """
+    Create many top-level comments in one transaction.
+    Each comment counts against the bulk rate limit.
+    """
+    charge_bulk_items(request, len(comments.items))
+    result = services.post_service.create_comments_bulk(comments.items, current_user.id, session)
+    return result
+
 @router.get('/{comment_id}', response_model=CommentPublic)
-async def get_comment(comment_id: UUID, session: SessionDep):
+def get_comment(comment_id: UUID, session: ReadSessionDep):
     """
     Get a specific comment by ID.
     """
     comment = services.comment_service.get_comment(comment_id, session)
     return comment
 
+@router.get('/{comment_id}/replies', response_model=CommentThread)
+def get_comment_replies(comment_id: UUID, session: ReadSessionDep, cursor: str | None = None,
+                        limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+                        max_depth: Annotated[int, Query(ge=0, le=services.post_service.MAX_COMMENT_DEPTH)] = services.post_service.MAX_COMMENT_DEPTH):
+    """
+    Get a page of direct replies to a comment (oldest first), each followed by its replies up to max_depth levels below.
+    Pass next_cursor of the response as cursor to get the next page.
+    """
+    replies = services.comment_service.get_comment_replies(comment_id, session, cursor, limit, max_depth)
+    return replies
+
+@router.post('/{comment_id}/replies', response_model=CommentPublic)
+def reply_to_comment(comment_id: UUID, comment: CommentCreate, session: SessionDep, current_user: CurrentUser):
+    """
+    Reply to a comment.
+    """
+    reply = services.comment_service.create_reply(comment_id, comment, current_user.id, session)
+    return reply
+
 @router.put('/{comment_id}', response_model=CommentPublic)
-async def update_comment(comment_id: UUID, comment: CommentUpdate, session: SessionDep, current_user: CurrentUser):
+def update_comment(comment_id: UUID, comment: CommentUpdate, session: SessionDep, current_user: CurrentUser):
     """
     Update a comment owned by the authenticated user.
     """
@@ -35,7 +72,7 @@ async def update_comment(comment_id: UUID, comment: CommentUpdate, session: Sess
     return updated_comment
 
 @router.delete('/{comment_id}')
-async def delete_comment(comment_id: UUID, session: SessionDep, current_user: CurrentUser) -> dict:
+def delete_comment(comment_id: UUID, session: SessionDep, current_user: CurrentUser) -> dict:
     """
     Delete a comment owned by the authenticated user.
     """
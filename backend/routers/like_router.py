@@ -0,0 +1,29 @@
+from fastapi import APIRouter, Request
+from schemas.likes_schemas import LikeBulkCreate
+from schemas.bulk_schemas import BulkResult
+import services.post_service
+from dependencies import SessionDep
+from services.authentication_service import CurrentUser
+from rate_limit import charge_bulk_items
+
+"""
+like_router.py
+
+Defines the /likes/* API endpoints.
+Likes of a single post are under /posts/{post_id}/like.
+
+Endpoints:
+- POST  /likes/bulk -> Like many posts in one transaction (requires authentication)
+"""
+
+router = APIRouter(prefix='/likes', tags=['likes'])
+
+@router.post('/bulk', response_model=BulkResult)
+def like_posts_bulk(likes: LikeBulkCreate, request: Request, session: SessionDep, current_user: CurrentUser):
+    """
+    Like many posts as the authenticated user in one transaction.
+    Each like counts against the bulk rate limit.
+    """
+    charge_bulk_items(request, len(likes.items))
+    result = services.post_service.like_posts_bulk([like.post_id for like in likes.items], current_user.id, session)
+    return result
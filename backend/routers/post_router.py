@@ -1,12 +1,19 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Header, Query, Request
+from fastapi.responses import StreamingResponse
 from typing import Annotated
 from uuid import UUID
-from schemas.post_schemas import PostUpdate, PostCreate, PostPublic, PostWithComments, PostWithLikes
+from schemas.post_schemas import PostUpdate, PostCreate, PostBulkCreate, PostPublic, PostWithComments, PostWithLikes
+from schemas.bulk_schemas import BulkResult
+from schemas.attachment_schemas import AttachmentPublic
 from schemas.likes_schemas import LikePublic
-from schemas.comment_schemas import CommentPublic, CommentCreate
+from schemas.comment_schemas import CommentPublic, CommentCreate, CommentThread
 import services.post_service
-from dependencies import SessionDep
-from services.authentication_service import CurrentUser
+import services.attachment_service
+from dependencies import SessionDep, ReadSessionDep
+from services.authentication_service import CurrentUser, OptionalViewer
+from broker import stream_sse
+from services.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from rate_limit import charge_bulk_items
 
 """
 post_router.py
@@ -15,13 +22,19 @@ Defines the /posts/* API endpoints.
 
 Endpoints:
 - POST  /posts/ -> Create a post (requires authentication)
+- POST  /posts/bulk -> Create many posts in one transaction (requires authentication)
 - GET   /posts/ -> Get a list of posts
+- GET   /posts/trending -> Get a list of trending posts, ranked by recent likes and comments
 - GET   /posts/{post_id} -> Get a single post
 - DELETE    /posts/{post_id} -> Delete a post (requires authentication)
 - PUT   /posts/{post_id} -> Update a post (requires authentication)
 - GET   /posts/{post_id}/comments -> Get a single post including comments
+- GET   /posts/{post_id}/comments/thread -> Get a page of top-level comments of a post, including replies
 - GET   /posts/{post_id}/likes -> Get a single post including likes
+- GET   /posts/{post_id}/events -> Stream likes, comments and updates of a post (Server-Sent Events)
 - POST  /posts/{post_id}/comments -> Create a comment to post (requires authentication)
+- POST  /posts/{post_id}/attachments -> Upload an image attached to a post, sent as raw request body (requires authentication)
+- GET   /posts/{post_id}/attachments -> Get the attachments of a post
 - POST  /posts/{post_id}/like -> Like a post (requires authentication)
 - DELETE    /posts/{post_id}/like -> Delete a like to post (requires authentication)
 """
@@ -30,7 +43,7 @@ router = APIRouter(prefix='/posts', tags=['posts'])
 
 
 @router.post('/', response_model=PostPublic)
-async def create_post(post: PostCreate, session: SessionDep, current_user: CurrentUser):
+def create_post(post: PostCreate, session: SessionDep, current_user: CurrentUser):
     """
     Create a new post owned by the authenticated user.
     """
@@ -38,26 +51,52 @@ async def create_post(post: PostCreate, session: SessionDep, current_user: Curre
     return post
 
 
+@router.post('/bulk', response_model=BulkResult)
+def create_posts_bulk(posts: PostBulkCreate, request: Request, session: SessionDep, current_user: CurrentUser):
+    """
+    Create many posts owned by the authenticated user in one transaction.
+    Each post counts against the bulk rate limit.
+    """
+    charge_bulk_items(request, len(posts.items))
+    result = services.post_service.create_posts_bulk(posts.items, current_user.id, session)
+    return result
+
+
 @router.get('/', response_model=list[PostPublic])
-async def get_posts(session: SessionDep, offset: int = 0, limit: Annotated[int, Query(le=100)] = 100):
+def get_posts(session: ReadSessionDep, viewer: OptionalViewer, offset: int = 0, limit: Annotated[int, Query(le=100)] = 100):
     """
     Get a paginated list of posts.
+    With an Authorization Header, liked_by_me tells whether the authenticated user liked each post.
+    """
+    posts = services.post_service.get_posts(session, offset, limit, viewer.id if viewer else None)
+    return posts
+
+
+@router.get('/trending', response_model=list[PostPublic])
+def get_trending_posts(session: ReadSessionDep, viewer: OptionalViewer, offset: int = 0, limit: Annotated[int, Query(le=100)] = 20):
+    """
+    Get a paginated list of posts ranked by a time-decayed score of likes and comments.
+    With an Authorization Header, liked_by_me tells whether the authenticated user liked each post.
     """
-    posts = services.post_service.get_posts(session, offset, limit)
+    posts = services.post_service.get_trending_posts(session, offset, limit, viewer.id if viewer else None)
     return posts
 
 
 @router.get('/{post_id}', response_model=PostPublic)
-async def get_post_by_id(post_id: UUID, session: SessionDep):
+def get_post_by_id(post_id: UUID, request: Request, session: ReadSessionDep, viewer: OptionalViewer):
     """
-    Get a specific post by ID.
+    Get a specific post by ID, and count the view.
+    With an Authorization Header, liked_by_me tells whether the authenticated user liked the post.
+    views_count estimates the distinct viewers (users, or addresses of anonymous clients), updated periodically.
     """
     post = services.post_service.get_post(post_id, session)
+    services.post_service.fill_liked_by_me([post], viewer.id if viewer else None, session)
+    services.post_service.record_post_view(post_id, viewer.id if viewer else None, request)
     return post
 
 
 @router.delete('/{post_id}')
-async def delete_post(post_id: UUID, session: SessionDep, current_user: CurrentUser) -> dict:
+def delete_post(post_id: UUID, session: SessionDep, current_user: CurrentUser) -> dict:
     """
     Delete a post owned by the authenticated user.
     """
@@ -66,7 +105,7 @@ async def delete_post(post_id: UUID, session: SessionDep, current_user: CurrentU
 
 
 @router.put('/{post_id}', response_model=PostPublic)
-async def update_post(post_id: UUID, post: PostUpdate, session: SessionDep, current_user: CurrentUser):
+def update_post(post_id: UUID, post: PostUpdate, session: SessionDep, current_user: CurrentUser):
     """
     Update a post owned by the authenticated user.
     """
@@ -75,7 +114,7 @@ async def update_post(post_id: UUID, post: PostUpdate, session: SessionDep, curr
 
 
 @router.get('/{post_id}/comments', response_model=PostWithComments, tags=['comments'])
-async def read_posts_comments(post_id: UUID, session: SessionDep):
+def read_posts_comments(post_id: UUID, session: ReadSessionDep):
     """
     Get a specific post including comments by ID.
     """
@@ -83,8 +122,21 @@ async def read_posts_comments(post_id: UUID, session: SessionDep):
     return post_with_comments
 
 
+@router.get('/{post_id}/comments/thread', response_model=CommentThread, tags=['comments'])
+def read_comment_thread(post_id: UUID, session: ReadSessionDep, cursor: str | None = None,
+                        limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+                        max_depth: Annotated[int, Query(ge=0, le=services.post_service.MAX_COMMENT_DEPTH)] = services.post_service.MAX_COMMENT_DEPTH):
+    """
+    Get a page of top-level comments of a post (oldest first), each followed by its replies up to max_depth levels below.
+    Pass next_cursor of the response as cursor to get the next page.
+    """
+    services.post_service.get_post(post_id, session)
+    thread = services.post_service.get_comment_thread(post_id, session, cursor, limit, max_depth)
+    return thread
+
+
 @router.get('/{post_id}/likes', response_model=PostWithLikes, tags=['likes'])
-async def read_posts_likes(post_id: UUID, session: SessionDep):
+def read_posts_likes(post_id: UUID, session: ReadSessionDep):
     """
     Get a specific post including likes by ID.
     """
@@ -92,16 +144,49 @@ async def read_posts_likes(post_id: UUID, session: SessionDep):
     return post_with_likes
 
 
+@router.get('/{post_id}/events', response_class=StreamingResponse)
+def stream_post_events(post_id: UUID, request: Request, session: ReadSessionDep):
+    """
+    Stream activity (likes, comments, updates) on a specific post as Server-Sent Events.
+    """
+    services.post_service.get_post(post_id, session)
+    # release the DB connection, the stream may stay open for a long time
+    session.close()
+    return StreamingResponse(stream_sse(request, f'post:{post_id}'), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache'})
+
+
 @router.post('/{post_id}/comments', response_model=CommentPublic, tags=['comments'])
-async def create_comment_to_post(post_id: UUID, comment: CommentCreate, session: SessionDep, current_user: CurrentUser):
+def create_comment_to_post(post_id: UUID, comment: CommentCreate, session: SessionDep, current_user: CurrentUser):
     """
     Create a comment to a specific post.
     """
     created_comment = services.post_service.create_comment(post_id, comment, current_user.id, session)
     return created_comment
 
+@router.post('/{post_id}/attachments', response_model=AttachmentPublic, status_code=201, tags=['attachments'])
+async def upload_attachment(post_id: UUID, request: Request, session: SessionDep, current_user: CurrentUser,
+                            content_type: Annotated[str | None, Header()] = None,
+                            content_length: Annotated[int | None, Header()] = None):
+    """
+    Attach an image (JPEG, PNG, GIF or WebP) to a post owned by the authenticated user.
+    The image is the raw request body, with its Content-Type. The thumbnail is rendered in the background.
+    """
+    attachment = await services.attachment_service.upload_attachment(post_id, content_type, content_length, request.stream(),
+                                                                     current_user.id, session)
+    return attachment
+
+@router.get('/{post_id}/attachments', response_model=list[AttachmentPublic], tags=['attachments'])
+def get_post_attachments(post_id: UUID, session: ReadSessionDep):
+    """
+    Get the attachments of a specific post, oldest first.
+    """
+    services.post_service.get_post(post_id, session)
+    attachments = services.attachment_service.get_post_attachments(post_id, session)
+    return attachments
+
 @router.post('/{post_id}/like', response_model=LikePublic, tags=['likes'])
-async def like_post(post_id: UUID, session: SessionDep, current_user: CurrentUser):
+def like_post(post_id: UUID, session: SessionDep, current_user: CurrentUser):
     """
     Like a specific post.
     """
@@ -109,7 +194,7 @@ async def like_post(post_id: UUID, session: SessionDep, current_user: CurrentUse
     return liked_post
 
 @router.delete('/{post_id}/like', tags=['likes'])
-async def delete_like(post_id: UUID, session: SessionDep, current_user: CurrentUser) -> dict:
+def delete_like(post_id: UUID, session: SessionDep, current_user: CurrentUser) -> dict:
     """
     Delete like to a specific post.
     """
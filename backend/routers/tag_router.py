@@ -0,0 +1,39 @@
+from fastapi import APIRouter, Path, Query
+from typing import Annotated
+from schemas.tag_schemas import TagCount, TagWithPosts
+import services.tag_service
+from dependencies import ReadSessionDep
+from services.authentication_service import OptionalViewer
+from services.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from tags import TOP_TAGS_LIMIT
+
+"""
+tag_router.py
+
+Defines the /tags/* API endpoints, the #tags used in posts (see tags.py).
+
+Endpoints:
+- GET   /tags/top -> Get the most used tags of recent posts
+- GET   /tags/{tag}/posts -> Get a tag including a page of posts using it
+"""
+
+router = APIRouter(prefix='/tags', tags=['tags'])
+
+@router.get('/top', response_model=list[TagCount])
+def read_top_tags(limit: Annotated[int, Query(ge=1, le=TOP_TAGS_LIMIT)] = 20):
+    """
+    Get the most used tags of recent posts and their number of posts, refreshed periodically.
+    """
+    tags = services.tag_service.get_top_tags(limit)
+    return tags
+
+@router.get('/{tag}/posts', response_model=TagWithPosts)
+def read_tag_posts(tag: Annotated[str, Path(max_length=51)], session: ReadSessionDep, viewer: OptionalViewer,
+                   cursor: str | None = None, limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE):
+    """
+    Get a page of the posts using a tag (with or without '#', case-insensitive), newest first.
+    Pass next_cursor from the response as cursor to get the next page.
+    With an Authorization Header, liked_by_me tells whether the authenticated user liked each post.
+    """
+    page = services.tag_service.get_tag_posts_page(tag, session, cursor, limit, viewer.id if viewer else None)
+    return page
@@ -1,10 +1,16 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
 from typing import Annotated
 from schemas.user_schemas import UserPublic, UserRegister, UserUpdate, UserWithPosts, UserWithComments, UserWithLike
 from uuid import UUID
+from schemas.notification_schemas import NotificationPage
 import services.user_service
-from dependencies import SessionDep
-from services.authentication_service import CurrentUser
+import services.notification_service
+from services.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from dependencies import SessionDep, ReadSessionDep
+from services.authentication_service import CurrentUser, OptionalViewer
+from broker import stream_sse
 
 """
 user_router.py
@@ -17,15 +23,20 @@ Endpoints:
 - GET   /users/me -> Get information about authenticated user (requires authentication)
 - DELETE    /users/me -> Delete authenticated user(requires authentication)
 - PUT   /users/me -> Update authenticated user information (requires authentication)
+- GET   /users/me/export -> Stream an NDJSON export of authenticated user's posts, comments and likes (requires authentication)
+- GET   /users/me/events -> Stream activity on authenticated user's posts as Server-Sent Events (requires authentication)
+- GET   /users/me/notifications -> Get a page of authenticated user's notifications and the unread count (requires authentication)
+- POST  /users/me/notifications/read -> Mark all of authenticated user's notifications as read (requires authentication)
 - GET   /users/{user_id} -> Get a single user
-- GET   /users/{user_id}/posts -> Get a single user including posts made
-- GET   /users/{user_id}/comments -> Get a single user including comments made
-- GET   /users/{user_id}/likes -> Get a single user including liked posts
+- GET   /users/{user_id}/posts -> Get a single user including a page of posts made
+- GET   /users/{user_id}/comments -> Get a single user including a page of comments made
+- GET   /users/{user_id}/likes -> Get a single user including a page of liked posts
+- GET   /users/{user_id}/mentions -> Get a single user including a page of posts mentioning the user
 """
 router = APIRouter(prefix='/users', tags=['users'])
 
 @router.post('/', response_model=UserPublic)
-async def create_user(user: UserRegister, session: SessionDep):
+def create_user(user: UserRegister, session: SessionDep):
     """
     Create a new user
     """
@@ -33,7 +44,7 @@ async def create_user(user: UserRegister, session: SessionDep):
     return db_user
 
 @router.get('/', response_model=list[UserPublic])
-async def read_users(session: SessionDep, offset: int = 0, limit: Annotated[int, Query(le=100)] = 100):
+def read_users(session: ReadSessionDep, offset: int = 0, limit: Annotated[int, Query(le=100)] = 100):
     """
     Get a paginated list of users.
     """
@@ -41,30 +52,82 @@ async def read_users(session: SessionDep, offset: int = 0, limit: Annotated[int,
     return users
 
 @router.get('/me', response_model=UserPublic)
-async def read_user_me(current_user: CurrentUser):
+def read_user_me(session: ReadSessionDep, current_user: CurrentUser):
     """
     Get authenticated user information
     """
-    return current_user
+    user = services.user_service.read_user(current_user.id, session)
+    return user
 
 @router.delete('/me')
-async def delete_me(session: SessionDep, current_user: CurrentUser) -> dict:
+def delete_me(session: SessionDep, current_user: CurrentUser) -> dict:
     """
-    Delete authenticated user
+    Delete authenticated user.
+    The user is deactivated immediately, posts, comments and likes are removed by a background job.
     """
     services.user_service.delete_user(current_user.id, session)
     return {'Ok': True}
 
 @router.put('/me', response_model=UserPublic)
-async def update_user(user: UserUpdate, session: SessionDep, current_user: CurrentUser):
+def update_user(user: UserUpdate, session: SessionDep, current_user: CurrentUser):
     """
     Update authenticated user information
     """
     updated_user = services.user_service.update_user(current_user.id, user, session)
     return updated_user
 
+@router.get('/me/export', response_class=StreamingResponse)
+async def export_me(request: Request, current_user: CurrentUser):
+    """
+    Stream an export of authenticated user's posts, comments and likes as NDJSON (one JSON object per line)
+    """
+    export = services.user_service.export_user_data(current_user.id)
+
+    async def stream():
+        # DB reads are blocking, so pull each batch in the threadpool.
+        # Stop reading as soon as the client goes away, closing the server-side cursor.
+        try:
+            async for chunk in iterate_in_threadpool(export):
+                if await request.is_disconnected():
+                    break
+                yield chunk
+        finally:
+            export.close()
+
+    headers = {'Content-Disposition': f'attachment; filename="export-{current_user.id}.ndjson"'}
+    return StreamingResponse(stream(), media_type='application/x-ndjson', headers=headers)
+
+@router.get('/me/events', response_class=StreamingResponse)
+def stream_my_events(request: Request, session: ReadSessionDep, current_user: CurrentUser):
+    """
+    Stream activity (likes, comments) on authenticated user's posts as Server-Sent Events
+    """
+    topic = f'user:{current_user.id}'
+    # release the DB connection, the stream may stay open for a long time
+    session.close()
+    return StreamingResponse(stream_sse(request, topic), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache'})
+
+@router.get('/me/notifications', response_model=NotificationPage)
+def read_my_notifications(session: ReadSessionDep, current_user: CurrentUser, cursor: str | None = None,
+                          limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE):
+    """
+    Get a page of notifications about likes and comments on authenticated user's posts, newest first.
+    Pass next_cursor from the response as cursor to get the next page.
+    """
+    notifications = services.notification_service.get_notifications_page(current_user.id, session, cursor, limit)
+    return notifications
+
+@router.post('/me/notifications/read')
+def mark_my_notifications_read(session: SessionDep, current_user: CurrentUser) -> dict:
+    """
+    Mark all notifications of authenticated user as read
+    """
+    marked = services.notification_service.mark_notifications_read(current_user.id, session)
+    return {'Ok': True, 'marked': marked}
+
 @router.get('/{user_id}', response_model=UserPublic)
-async def read_user(user_id: UUID, session: SessionDep):
+def read_user(user_id: UUID, session: ReadSessionDep):
     """
     Get user information by ID
     """
@@ -72,25 +135,43 @@ async def read_user(user_id: UUID, session: SessionDep):
     return user
 
 @router.get('/{user_id}/posts', response_model=UserWithPosts)
-async def read_user_posts(user_id: UUID, session: SessionDep):
+def read_user_posts(user_id: UUID, session: ReadSessionDep, viewer: OptionalViewer, cursor: str | None = None,
+                          limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE):
+    """
+    Get user information including a page of posts by ID.
+    Pass next_cursor from the response as cursor to get the next page.
+    With an Authorization Header, liked_by_me tells whether the authenticated user liked each post.
     """
-    Get user information including posts by ID
+    user = services.user_service.read_user_posts_page(user_id, session, cursor, limit, viewer.id if viewer else None)
+    return user
+
+@router.get('/{user_id}/mentions', response_model=UserWithPosts)
+def read_user_mentions(user_id: UUID, session: ReadSessionDep, viewer: OptionalViewer, cursor: str | None = None,
+                       limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE):
+    """
+    Get user information including a page of the posts mentioning the user (@username), newest first.
+    Pass next_cursor from the response as cursor to get the next page.
+    With an Authorization Header, liked_by_me tells whether the authenticated user liked each post.
     """
-    user = services.user_service.read_user_including_counts(user_id, session)
+    user = services.user_service.read_user_mentions_page(user_id, session, cursor, limit, viewer.id if viewer else None)
     return user
 
 @router.get('/{user_id}/comments', response_model=UserWithComments)
-async def read_user_comments(user_id: UUID, session: SessionDep):
+def read_user_comments(user_id: UUID, session: ReadSessionDep, cursor: str | None = None,
+                             limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE):
     """
-    Get user information including comments by ID
+    Get user information including a page of comments by ID.
+    Pass next_cursor from the response as cursor to get the next page.
     """
-    user = services.user_service.read_user(user_id, session)
+    user = services.user_service.read_user_comments_page(user_id, session, cursor, limit)
     return user
 
 @router.get('/{user_id}/likes', response_model=UserWithLike)
-async def read_user_likes(user_id: UUID, session: SessionDep):
+def read_user_likes(user_id: UUID, session: ReadSessionDep, cursor: str | None = None,
+                          limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE):
     """
-    Get user information including likes by ID
+    Get user information including a page of likes by ID.
+    Pass next_cursor from the response as cursor to get the next page.
     """
-    user = services.user_service.read_user(user_id, session)
+    user = services.user_service.read_user_likes_page(user_id, session, cursor, limit)
     return user
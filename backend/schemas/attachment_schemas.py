@@ -0,0 +1,26 @@
+from pydantic import BaseModel
+from datetime import datetime
+from uuid import UUID
+
+"""
+attachment_schemas.py
+
+Defines the Pydantic models (schemas) for attachments.
+
+These schemas are used for response serialization. Uploads are sent as the raw request body.
+"""
+
+class AttachmentPublic(BaseModel):
+    """
+    Public representation of an attachment, returned in API responses.
+    The image is served at /attachments/{id}, its thumbnail at /attachments/{id}/thumbnail once status is 'ready'.
+    """
+    model_config = {'from_attributes': True}
+    id: UUID
+    post_id: UUID
+    content_type: str
+    size: int
+    status: str
+    width: int | None = None
+    height: int | None = None
+    created_at: datetime
@@ -0,0 +1,27 @@
+from pydantic import BaseModel
+from typing import Literal
+from uuid import UUID
+
+"""
+bulk_schemas.py
+
+Defines the Pydantic models (schemas) shared by the bulk write endpoints
+(POST /posts/bulk, /likes/bulk, /comments/bulk).
+
+These schemas are used for request validation and response serialization.
+"""
+
+BULK_MAX_ITEMS = 100
+
+class BulkItemResult(BaseModel):
+    """Outcome of one item of a bulk request, index is its position in the request."""
+    index: int
+    status: Literal['created', 'failed']
+    id: UUID | None = None
+    detail: str | None = None
+
+class BulkResult(BaseModel):
+    """Per-item outcomes of a bulk request, in request order. The created items were written in one transaction."""
+    created: int
+    failed: int
+    results: list[BulkItemResult]
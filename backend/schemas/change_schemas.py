@@ -0,0 +1,32 @@
+from pydantic import BaseModel
+from datetime import datetime
+from typing import Any
+from uuid import UUID
+
+"""
+change_schemas.py
+
+Defines the Pydantic models (schemas) for the change feed.
+
+These schemas are used for response serialization.
+"""
+
+class ChangePublic(BaseModel):
+    """Public representation of a change feed entry, returned in API responses."""
+    model_config = {'from_attributes': True}
+    entity: str
+    entity_id: UUID
+    user_id: UUID
+    op: str
+    data: dict[str, Any] | None = None
+    created_at: datetime
+
+class ChangePage(BaseModel):
+    """A page of changes, oldest first. Pass next_cursor as since to get the changes after them."""
+    changes: list[ChangePublic]
+    next_cursor: str
+    has_more: bool
+
+class ChangeCursor(BaseModel):
+    """Cursor of the current end of the change feed."""
+    cursor: str
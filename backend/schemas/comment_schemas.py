@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
 from uuid import UUID
+from schemas.bulk_schemas import BULK_MAX_ITEMS
 
 """
 comment_schemas.py
@@ -19,6 +20,15 @@ class CommentCreate(CommentBase):
     """Schema for creating a new comment."""
     pass
 
+class CommentBulkItem(CommentBase):
+    """Schema for one top-level comment of a bulk request."""
+    post_id: UUID
+
+class CommentBulkCreate(BaseModel):
+    """Schema for creating many top-level comments, on any posts, in one request."""
+    model_config = {'extra': 'forbid'}
+    items: list[CommentBulkItem] = Field(min_length=1, max_length=BULK_MAX_ITEMS)
+
 class CommentPublic(CommentBase):
     """Public representation of a comment, returned in API responses."""
     id: UUID
@@ -26,7 +36,15 @@ class CommentPublic(CommentBase):
     post_id: UUID
     created_at: datetime
     last_edited: datetime | None = None
+    parent_id: UUID | None = None
+    depth: int = 0
+    reply_count: int = 0
 
 class CommentUpdate(CommentBase):
     """Schema for updating a existing comment."""
-    pass
\ No newline at end of file
+    pass
+
+class CommentThread(BaseModel):
+    """A page of a comment thread in display order, each reply follows the comment it replies to."""
+    comments: list[CommentPublic]
+    next_cursor: str | None = None
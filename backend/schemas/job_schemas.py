@@ -0,0 +1,26 @@
+from pydantic import BaseModel
+from datetime import datetime
+from uuid import UUID
+
+"""
+job_schemas.py
+
+Defines the Pydantic models (schemas) for background jobs.
+
+These schemas are used for response serialization.
+"""
+
+class JobPublic(BaseModel):
+    """Representation of a background job, returned by the admin API."""
+    model_config = {'from_attributes': True}
+    id: UUID
+    queue: str
+    name: str
+    payload: dict
+    status: str
+    attempts: int
+    max_attempts: int
+    run_at: datetime
+    created_at: datetime
+    started_at: datetime | None = None
+    last_error: str | None = None
@@ -1,6 +1,7 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
 from uuid import UUID
+from schemas.bulk_schemas import BULK_MAX_ITEMS
 
 """
 likes_schemas.py
@@ -16,4 +17,14 @@ class LikeBase(BaseModel):
 
 class LikePublic(LikeBase):
     """Public representation of a like, returned in API responses."""
-    liked_at: datetime
\ No newline at end of file
+    liked_at: datetime
+
+class LikeCreate(BaseModel):
+    """Schema for liking a post as the authenticated user."""
+    model_config = {'extra': 'forbid'}
+    post_id: UUID
+
+class LikeBulkCreate(BaseModel):
+    """Schema for liking many posts in one request."""
+    model_config = {'extra': 'forbid'}
+    items: list[LikeCreate] = Field(min_length=1, max_length=BULK_MAX_ITEMS)
@@ -0,0 +1,29 @@
+from pydantic import BaseModel
+from datetime import datetime
+from uuid import UUID
+
+"""
+notification_schemas.py
+
+Defines the Pydantic models (schemas) for notifications.
+
+These schemas are used for response serialization.
+"""
+
+class NotificationPublic(BaseModel):
+    """Public representation of a notification, returned in API responses."""
+    model_config = {'from_attributes': True}
+    id: UUID
+    type: str
+    post_id: UUID
+    actor_id: UUID | None = None
+    actor_count: int
+    created_at: datetime
+    updated_at: datetime
+    read_at: datetime | None = None
+
+class NotificationPage(BaseModel):
+    """A page of notifications (newest first) and the number of unread notifications."""
+    notifications: list[NotificationPublic]
+    unread_count: int
+    next_cursor: str | None = None
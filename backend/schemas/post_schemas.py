@@ -2,6 +2,7 @@ from pydantic import BaseModel, Field
 from datetime import datetime
 from uuid import UUID
 from schemas.comment_schemas import CommentPublic
+from schemas.bulk_schemas import BULK_MAX_ITEMS
 
 """
 post_schemas.py
@@ -20,6 +21,11 @@ class PostCreate(PostBase):
     """Schema for creating a new post."""
     pass
 
+class PostBulkCreate(BaseModel):
+    """Schema for creating many posts in one request."""
+    model_config = {'extra': 'forbid'}
+    items: list[PostCreate] = Field(min_length=1, max_length=BULK_MAX_ITEMS)
+
 class PostPublic(PostBase):
     """Public representation of a post, returned in API responses."""
     id: UUID
@@ -28,6 +34,8 @@ class PostPublic(PostBase):
     updated_at: datetime | None = None
     likes_count: int = 0
     comments_count: int = 0
+    views_count: int = 0
+    liked_by_me: bool | None = None
     
 class PostWithComments(PostPublic):
     """Public representation of a post including comments, returned in API responses."""
@@ -0,0 +1,21 @@
+from pydantic import BaseModel
+from schemas.post_schemas import PostPublic
+
+"""
+tag_schemas.py
+
+Defines the Pydantic models (schemas) for tags.
+
+These schemas are used for response serialization.
+"""
+
+class TagCount(BaseModel):
+    """A tag and the number of recent posts using it, returned in API responses."""
+    tag: str
+    posts: int
+
+class TagWithPosts(BaseModel):
+    """A tag including a page of posts using it (newest first), returned in API responses."""
+    tag: str
+    posts: list[PostPublic]
+    next_cursor: str | None = None
@@ -25,16 +25,19 @@ class UserPublic(UserBase):
     created_at: datetime
 
 class UserWithPosts(UserPublic):
-    """Public representation of a user including posts made, returned in API responses."""
+    """Public representation of a user including a page of posts made, returned in API responses."""
     posts: list[PostPublic]
+    next_cursor: str | None = None
 
 class UserWithComments(UserPublic):
-    """Public representation of a user including comments made, returned in API responses."""
+    """Public representation of a user including a page of comments made, returned in API responses."""
     comments: list[CommentPublic]
+    next_cursor: str | None = None
 
 class UserWithLike(UserPublic):
-    """Public representation of a user including liked posts, returned in API responses."""
+    """Public representation of a user including a page of liked posts, returned in API responses."""
     likes: list[LikePublic]
+    next_cursor: str | None = None
 
 class UserRegister(UserBase):
     """Schema for creating a new user"""
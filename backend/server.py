@@ -0,0 +1,95 @@
+import os
+import sys
+from gunicorn.app.base import BaseApplication
+from gunicorn.arbiter import Arbiter
+from uvicorn.server import Server
+from uvicorn_worker import UvicornWorker
+from settings import get_settings
+from broker import broker
+
+"""
+server.py
+
+Production launcher for the FastAPI application.
+
+Runs gunicorn as process manager with uvicorn workers:
+- One worker process per CPU core by default (WEB_CONCURRENCY to override)
+- uvloop event loop and httptools HTTP parser
+- The application is preloaded in the master process before forking,
+  so import errors fail fast and workers share the imported code copy-on-write
+- No file watcher / auto-reload
+- Graceful drain on SIGTERM: stop accepting connections, end long-lived event streams,
+  give in-flight requests GRACEFUL_TIMEOUT seconds to finish, then run lifespan shutdown
+
+Usage:
+    python server.py
+
+For development use `python main.py` (single process with auto-reload).
+"""
+
+settings = get_settings()
+
+class DrainingServer(Server):
+    """uvicorn Server that ends open event streams as soon as shutdown starts"""
+    async def shutdown(self, sockets=None) -> None:
+        # Server-Sent Events streams never finish on their own and would hold up
+        # the drain until the graceful timeout, so close them first.
+        await broker.stop()
+        await super().shutdown(sockets)
+
+class ProductionWorker(UvicornWorker):
+    """gunicorn worker running the app on uvloop + httptools with a bounded graceful shutdown"""
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools", "proxy_headers": True}
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        # leave time for the lifespan shutdown before gunicorn kills the worker
+        self.config.timeout_graceful_shutdown = max(self.cfg.graceful_timeout - 5, 1)
+
+    async def _serve(self) -> None:
+        self.config.app = self.wsgi
+        server = DrainingServer(config=self.config)
+        self._install_sigquit_handler()
+        await server.serve(sockets=self.sockets)
+        if not server.started:
+            sys.exit(Arbiter.WORKER_BOOT_ERROR)
+
+class ProductionServer(BaseApplication):
+    """Embeds gunicorn, so the launcher is configured from Settings instead of a config file"""
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self) -> None:
+        for key, value in self.options.items():
+            self.cfg.set(key, value) # type: ignore
+
+    def load(self):
+        from main import app
+        return app
+
+def post_fork(server, worker) -> None:
+    """Each worker needs its own DB connections, pooled connections must not be shared across processes"""
+    from database import shard_engines
+    for engines in shard_engines:
+        for pool_engine in set(engines):
+            pool_engine.dispose(close=False)
+
+def get_options() -> dict:
+    """gunicorn options derived from Settings"""
+    workers = settings.web_concurrency or os.cpu_count() or 1
+    return {
+        'bind': f'{settings.host}:{settings.port}',
+        'workers': workers,
+        'worker_class': ProductionWorker,
+        'preload_app': True,
+        'post_fork': post_fork,
+        'graceful_timeout': settings.graceful_timeout,
+        'keepalive': settings.keepalive,
+        'max_requests': settings.max_requests,
+        'max_requests_jitter': settings.max_requests // 10,
+        'accesslog': None,
+    }
+
+if __name__ == '__main__':
+    ProductionServer(get_options()).run()
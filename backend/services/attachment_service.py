@@ -0,0 +1,203 @@
+from collections.abc import AsyncIterator
+from datetime import datetime, timezone
+from uuid import UUID
+from fastapi import HTTPException, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, update, delete
+from models.models import Attachment, Post
+from dependencies import SessionDep
+from database import SessionLocal
+from settings import get_settings, logger
+from jobs import job, enqueue
+from sharding import new_id
+from storage import UploadTooLarge, get_storage, object_response, save_stream
+from thumbnails import THUMBNAIL_CONTENT_TYPE, thumbnail_pool
+
+"""
+attachment_service.py
+
+Handles image attachments of posts, including:
+- Streaming an upload to the storage (storage.py) and recording it
+- Rendering the thumbnail in the background ('make_thumbnail' job on the 'media' queue,
+  rendered in the thumbnail process pool, see thumbnails.py)
+- Get the attachments of a post, serve an image or its thumbnail with range and
+  conditional request support
+- Delete attachments, the stored files are removed by a background job after the commit
+
+Uploads are the raw request body with an image Content-Type (not multipart), so the body is
+never spooled to a temporary file: it goes from the socket to the storage chunk by chunk.
+The type is checked twice, the declared Content-Type before reading the body and the
+magic number of the first bytes after.
+
+This module integrates with:
+- SQLAlchemy ORM models (Attachment, Post)
+"""
+
+settings = get_settings()
+MAX_UPLOAD_BYTES = settings.max_upload_mb * 1024 * 1024
+IMAGE_CONTENT_TYPES = {'image/jpeg', 'image/png', 'image/gif', 'image/webp'}
+
+def detect_image_type(head: bytes) -> str | None:
+    """Content type of an image from its first bytes, None for other files"""
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+def original_key(attachment_id: UUID) -> str:
+    return f'attachments/{attachment_id}'
+
+def thumbnail_key(attachment_id: UUID) -> str:
+    return f'attachments/{attachment_id}.thumbnail'
+
+def get_own_post(post_id: UUID, owner_id: UUID, session: SessionDep) -> Post:
+    """Get a post based on ID, if owner_id matches the user that created the post"""
+    post = session.get(Post, post_id)
+    if not post:
+        logger.warning("post was not found", extra={'post_id': post_id})
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Post does not exist')
+    if post.owner_id != owner_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Cannot attach to a post that is not yours')
+    return post
+
+async def upload_attachment(post_id: UUID, content_type: str | None, content_length: int | None,
+                            chunks: AsyncIterator[bytes], owner_id: UUID, session: SessionDep) -> Attachment:
+    """
+    Streams an uploaded image to the storage and attaches it to a post owned by owner_id.
+    The thumbnail is rendered by a background job, until then the attachment has status 'processing'.
+    """
+    logger.debug('Uploading attachment', extra={'post_id': post_id, 'user_id': owner_id, 'content_type': content_type, 'content_length': content_length})
+    if (content_type or '').split(';')[0].strip().lower() not in IMAGE_CONTENT_TYPES:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                            detail=f'Content-Type must be one of {", ".join(sorted(IMAGE_CONTENT_TYPES))}')
+    if content_length is not None and content_length > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=status.HTTP_413_CONTENT_TOO_LARGE, detail=f'larger than {settings.max_upload_mb} MB')
+    await run_in_threadpool(get_own_post, post_id, owner_id, session)
+    # release the DB connection, the upload may take long
+    await run_in_threadpool(session.close)
+
+    attachment_id = new_id(owner_id) # in the bucket of the post, owner_id owns it
+    try:
+        stored = await save_stream(get_storage(), original_key(attachment_id), chunks, MAX_UPLOAD_BYTES)
+    except UploadTooLarge:
+        logger.warning('Upload too large', extra={'post_id': post_id, 'user_id': owner_id})
+        raise HTTPException(status_code=status.HTTP_413_CONTENT_TOO_LARGE, detail=f'larger than {settings.max_upload_mb} MB')
+    attachment = await run_in_threadpool(create_attachment, attachment_id, post_id, stored.size, stored.etag,
+                                         detect_image_type(stored.head), owner_id, session)
+    return attachment
+
+def create_attachment(attachment_id: UUID, post_id: UUID, size: int, etag: str, content_type: str | None,
+                      owner_id: UUID, session: SessionDep) -> Attachment:
+    """
+    Records a stored upload and enqueues its thumbnail in the same transaction. The upload is removed
+    if it is rejected or the transaction fails (e.g. BucketMoving while the post's bucket is rebalanced).
+    """
+    try:
+        if content_type is None:
+            logger.warning('Uploaded file is not an image', extra={'post_id': post_id, 'user_id': owner_id})
+            raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail='file is not a supported image')
+        get_own_post(post_id, owner_id, session) # the post may have been deleted during the upload
+        attachment = Attachment(id=attachment_id, post_id=post_id, content_type=content_type, size=size, etag=etag,
+                                status='processing', created_at=datetime.now(timezone.utc))
+        session.add(attachment)
+        enqueue(session, 'make_thumbnail', {'attachment_id': str(attachment_id)})
+        session.commit()
+    except Exception:
+        get_storage().delete(original_key(attachment_id))
+        raise
+    session.refresh(attachment)
+    logger.info('Attachment uploaded', extra={'attachment_id': attachment_id, 'post_id': post_id, 'size': size})
+    return attachment
+
+def make_thumbnail(attachment_id: UUID) -> None:
+    """Renders the thumbnail of an attachment and marks it 'ready', or 'failed' if it is not a readable image"""
+    with SessionLocal() as session:
+        attachment = session.get(Attachment, attachment_id)
+        if not attachment or attachment.status != 'processing':
+            return
+    thumbnail = thumbnail_pool.render(original_key(attachment_id), thumbnail_key(attachment_id))
+    if thumbnail is None:
+        values = {'status': 'failed'}
+    else:
+        values = {'status': 'ready', 'width': thumbnail.width, 'height': thumbnail.height,
+                  'thumbnail_size': thumbnail.size, 'thumbnail_etag': thumbnail.etag}
+    with SessionLocal() as session:
+        result = session.execute(
+            update(Attachment).where(Attachment.id == attachment_id, Attachment.status == 'processing').values(**values)
+        )
+        session.commit()
+    if result.rowcount == 0 and thumbnail is not None: # deleted while rendering
+        get_storage().delete(thumbnail_key(attachment_id))
+    logger.info('Attachment processed', extra={'attachment_id': attachment_id, 'status': values['status']})
+
+@job('make_thumbnail', queue='media')
+def make_thumbnail_job(attachment_id: str) -> None:
+    """Background job running make_thumbnail"""
+    make_thumbnail(UUID(attachment_id))
+
+def get_attachment(attachment_id: UUID, session: SessionDep) -> Attachment:
+    """Get an attachment based on ID"""
+    attachment = session.get(Attachment, attachment_id)
+    if not attachment:
+        logger.warning('attachment not found', extra={'attachment_id': attachment_id})
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='attachment not found')
+    return attachment
+
+def get_post_attachments(post_id: UUID, session: SessionDep) -> list[Attachment]:
+    """Get the attachments of a post, oldest first"""
+    stmt = select(Attachment).where(Attachment.post_id == post_id).order_by(Attachment.created_at, Attachment.id)
+    return list(session.execute(stmt).scalars().all())
+
+def attachment_response(attachment_id: UUID, thumbnail: bool, request: Request, session: SessionDep) -> Response:
+    """Streams the image of an attachment, or its thumbnail, answering range and conditional requests"""
+    attachment = get_attachment(attachment_id, session)
+    # release the DB connection before streaming
+    session.close()
+    if not thumbnail:
+        return object_response(request, get_storage(), original_key(attachment.id), size=attachment.size,
+                               etag=attachment.etag, content_type=attachment.content_type,
+                               last_modified=attachment.created_at)
+    if attachment.status != 'ready':
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail='thumbnail not ready' if attachment.status == 'processing' else 'no thumbnail, not a readable image')
+    return object_response(request, get_storage(), thumbnail_key(attachment.id), size=attachment.thumbnail_size,
+                           etag=attachment.thumbnail_etag, content_type=THUMBNAIL_CONTENT_TYPE,
+                           last_modified=attachment.created_at)
+
+def delete_attachments(attachment_ids: list[UUID], session: SessionDep) -> None:
+    """
+    Deletes attachments in the callers transaction. Does not commit.
+    Their files are removed by a background job enqueued in the same transaction.
+    """
+    if not attachment_ids:
+        return
+    session.execute(delete(Attachment).where(Attachment.id.in_(attachment_ids)))
+    enqueue(session, 'delete_attachment_files', {'attachment_ids': [str(attachment_id) for attachment_id in attachment_ids]})
+
+def delete_post_attachments(post_ids: list[UUID], session: SessionDep) -> None:
+    """Deletes the attachments of posts in the callers transaction, see delete_attachments"""
+    attachment_ids = session.execute(select(Attachment.id).where(Attachment.post_id.in_(post_ids))).scalars().all()
+    delete_attachments(list(attachment_ids), session)
+
+def delete_attachment(attachment_id: UUID, owner_id: UUID, session: SessionDep) -> None:
+    """Delete an attachment, if owner_id matches the user that created the post"""
+    logger.debug('Deleting attachment request', extra={'attachment_id': attachment_id, 'user_id': owner_id})
+    attachment = get_attachment(attachment_id, session)
+    if attachment.post.owner_id != owner_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Cannot delete an attachment that is not yours')
+    delete_attachments([attachment_id], session)
+    session.commit()
+    logger.info('Attachment deleted', extra={'attachment_id': attachment_id, 'user_id': owner_id})
+
+@job('delete_attachment_files')
+def delete_attachment_files_job(attachment_ids: list[str]) -> None:
+    """Background job removing the stored files of deleted attachments"""
+    storage = get_storage()
+    for attachment_id in attachment_ids:
+        storage.delete(original_key(UUID(attachment_id)))
+        storage.delete(thumbnail_key(UUID(attachment_id)))
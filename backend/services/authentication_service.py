@@ -7,13 +7,15 @@ import jwt
 from uuid import UUID
 from models.models import User, RefreshToken
 from typing import Annotated
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel
 from settings import get_settings
-from dependencies import SessionDep
+from dependencies import SessionDep, ReadSessionDep
 import secrets
 from settings import logger
+from revocations import revocation_list, revoke
+from tracing import span
 
 """
 authentication_service.py
@@ -22,7 +24,10 @@ Handles all authentication-related logic, including:
 - Password hashing and verification
 - JWT access token creation and validation
 - Refresh token issuance, verification, rotation, and revocation
-- Current user dependencies for FastAPI routes
+- Current user dependencies for FastAPI routes, including an optional viewer for public routes
+- Stateless authentication (stateless_auth setting): access tokens carry the user claims and are
+  checked against the in-memory revocation list (revocations.py) instead of the database
+- Admin token verification for the /admin/* endpoints
 
 
 This module integrates with:
@@ -39,7 +44,9 @@ jwt_settings = get_settings()
 SECRET_KEY = jwt_settings.jwt_secret_key
 ALGORITHM = jwt_settings.jwt_algorithm
 ACCESS_TOKEN_EXPIRE_MINUTES = jwt_settings.access_token_expire_minutes
+ADMIN_TOKEN = jwt_settings.admin_token
 REFRESH_TOKEN_EXPIRE_DAYS = jwt_settings.refresh_token_expire_days
+STATELESS_AUTH = jwt_settings.stateless_auth
 
 class Token(BaseModel):
     """Token schema used for returning access_token and refresh_token in API responses."""
@@ -62,6 +69,8 @@ class TokenData(BaseModel):
 
 # Setup oauth2 schema and bcrypt
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token", refreshUrl="auth/refresh")
+# same scheme for endpoints that also serve anonymous requests, does not fail without Authorization Header
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token", refreshUrl="auth/refresh", auto_error=False)
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 def get_user(session: SessionDep, username: str) -> User | None:
@@ -69,9 +78,19 @@ def get_user(session: SessionDep, username: str) -> User | None:
     logger.debug('Getting user from DB', extra={'username': username})
     stmt = select(User).where(User.username == username)
     user = session.execute(stmt).scalar_one_or_none()
-    logger.info('Retrieved user by username', extra={'user': user.__dict__})
+    logger.info('Retrieved user by username', extra={'username': username, 'found': user is not None})
     return user
 
+def access_token_claims(user: User, session_id: UUID) -> dict:
+    """
+    Claims of an access token for a device session (refresh-token id) of user.
+    In stateless_auth mode they include the user fields needed to authenticate without the database.
+    """
+    claims = {'sub': str(user.id), 'sid': str(session_id)}
+    if STATELESS_AUTH:
+        claims.update({'username': user.username, 'active': user.is_active})
+    return claims
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None) -> str:
     """Creates a JWT token based on data dict, sets expires date and issued at"""
     logger.debug('Creating short-lived JWT', extra={'data': data, 'expires_delta': expires_delta})
@@ -121,6 +140,9 @@ def create_refresh_token(user_id: UUID, device_name: str, session: SessionDep) -
     logger.info('Created long-lived refresh-token', extra={'user_id': user_id})
     return db_token
 
+def _aware(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value # SQLite returns naive datetimes (stored as UTC)
+
 def verify_refresh_token(refresh_token: str, session: SessionDep) -> RefreshToken:
     """Validate refresh_token and return the corresponding RefreshToken object if valid."""
     logger.debug('Verifying refresh-token')
@@ -128,7 +150,7 @@ def verify_refresh_token(refresh_token: str, session: SessionDep) -> RefreshToke
     db_token = session.execute(stsm).scalar_one_or_none()
     
     # checks if token exist, is revoked or expired.
-    if not db_token or db_token.revoked or db_token.expires_at < datetime.now(timezone.utc):
+    if not db_token or db_token.revoked or _aware(db_token.expires_at) < datetime.now(timezone.utc):
         logger.warning('Invalid or expired refresh token')
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired refresh token")
     
@@ -142,13 +164,14 @@ def revoke_refresh_token(refresh_token: str, session: SessionDep) -> None:
     if not db_token:
         logger.warning('Invalid refresh token')
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid refresh token')
-    # sets the user+device to be revoked
+    # sets the user+device to be revoked, together with the access tokens issued for it
     db_token.revoked = True
+    revoke(session, db_token.user_id, db_token.id)
     logger.info('Refresh-token revoked')
     session.commit()
 
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], session: SessionDep) -> User:
+def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], session: ReadSessionDep) -> User:
     """Get current user using the Oauth2 scheme (Authorization Header)"""
     logger.debug('Get current user from Authorization Header')
     credentials_exception = HTTPException(
@@ -167,32 +190,67 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], sessio
         token_data = TokenData(user_id=user_id)
     except InvalidTokenError:
         raise credentials_exception
-    
+
+    if STATELESS_AUTH and 'username' in payload and revocation_list.is_fresh():
+        return user_from_claims(payload, credentials_exception)
+
     # Get user based on user_id received from jwt payload
     user = session.get(User, UUID(token_data.user_id))
     if user is None:
         raise credentials_exception
     return user
 
+def user_from_claims(payload: dict, credentials_exception: HTTPException) -> User:
+    """User (not attached to a session) built from the claims of a stateless access token, unless the token was revoked"""
+    try:
+        user_id = UUID(payload['sub'])
+        session_id = UUID(payload['sid']) if payload.get('sid') else None
+    except ValueError:
+        raise credentials_exception
+    if revocation_list.is_revoked(user_id, session_id, payload['iat']):
+        logger.info('Revoked access token used', extra={'user_id': user_id})
+        raise credentials_exception
+    return User(id=user_id, username=payload['username'], is_active=payload.get('active', False))
+
+def get_optional_viewer(token: Annotated[str | None, Depends(optional_oauth2_scheme)], session: ReadSessionDep) -> User | None:
+    """
+    Get the user viewing an endpoint that is also public, None for anonymous requests.
+    A token that is sent must be valid, and the user active.
+    """
+    if token is None:
+        return None
+    user = get_current_user(token, session)
+    if not user.is_active:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Inactive user')
+    return user
+
 async def get_current_active_user(current_user: Annotated[UserPublic, Depends(get_current_user)]) -> UserPublic:
     """Get current user from get_current_user and checks if the user is active"""
     if not current_user.is_active:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Inactive user')
     return current_user
 
+def verify_admin_token(x_admin_token: Annotated[str | None, Header()] = None) -> None:
+    """Guards the /admin/* endpoints, the X-Admin-Token header has to match the admin_token setting"""
+    if not ADMIN_TOKEN or x_admin_token is None or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        logger.warning('Admin endpoint access denied', extra={'token_sent': x_admin_token is not None})
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Invalid admin token')
+
 def hash_password(password: str) -> str:
     """Hash a password using bcrypt"""
-    return pwd_context.hash(password)
+    with span('bcrypt.hash'):
+        return pwd_context.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify plain_password is equal to hashed_password"""
-    return pwd_context.verify(plain_password, hashed_password)
+    with span('bcrypt.verify'):
+        return pwd_context.verify(plain_password, hashed_password)
 
 def authenticate_user(username: str, plain_password: str, session: SessionDep):
     """Checks if user exist in database and the plain_password matches stored password"""
     logger.debug('Authenticating user', extra={'username': username})
     user = get_user(session, username)
-    if not user:
+    if not user or user.deleted_at is not None:
         logger.info('User login attempt failed. user not found', extra={'username': username})
         return False
     if not verify_password(plain_password, user.hashed_password):
@@ -201,4 +259,5 @@ def authenticate_user(username: str, plain_password: str, session: SessionDep):
     logger.info('User authenticated successfully', extra={'username': username})
     return user
 
-CurrentUser = Annotated[User, Depends(get_current_active_user)]
\ No newline at end of file
+CurrentUser = Annotated[User, Depends(get_current_active_user)]
+OptionalViewer = Annotated[User | None, Depends(get_optional_viewer)]
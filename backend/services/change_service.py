@@ -0,0 +1,129 @@
+import asyncio
+import base64
+import heapq
+import json
+from collections.abc import AsyncIterator
+from datetime import datetime, timezone
+from itertools import islice
+from fastapi import HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, tuple_
+from models.models import Change
+from schemas.change_schemas import ChangePublic
+from dependencies import SessionDep
+from database import ReadSessionLocal
+from settings import logger
+from broker import SSE_HEARTBEAT_SECONDS
+from changes import CHANGES_RETENTION, POSTGRESQL, visible_txid_bound
+from sharding import shard_ids
+
+"""
+change_service.py
+
+Handles reading the change feed (see changes.py), including:
+- Get a page of changes after a cursor
+- Get the cursor of the current end of the feed, to sync from after a full download
+- Stream the changes after a cursor as Server-Sent Events
+
+A cursor holds the position (txid, seq) reached on every shard and the time it was issued.
+Cursors older than the retention are refused with 410, the consumer has to download everything
+again. Cursors are opaque to clients: url-safe base64 encoded JSON.
+
+This module integrates with:
+- SQLAlchemy ORM models (Change)
+"""
+
+CHANGES_POLL_SECONDS = 1.0
+START = (-1, 0) # before every entry, txid is 0 or more
+
+def encode_change_cursor(positions: list[tuple[int, int]]) -> str:
+    """Encodes the positions reached on every shard into an opaque cursor string"""
+    raw = json.dumps([datetime.now(timezone.utc).isoformat(), positions]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_change_cursor(cursor: str | None) -> list[tuple[int, int]]:
+    """
+    Decodes a cursor created by encode_change_cursor (the start of the feed for None).
+    Raises 400 if the cursor is malformed, 410 if it expired or the number of shards changed.
+    """
+    if cursor is None:
+        return [START] * len(shard_ids())
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        issued_at, positions = json.loads(base64.urlsafe_b64decode(padded))
+        issued_at = datetime.fromisoformat(issued_at)
+        positions = [(int(txid), int(seq)) for txid, seq in positions]
+    except (ValueError, TypeError):
+        logger.warning('Invalid change cursor', extra={'cursor': cursor})
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid cursor')
+    if issued_at < datetime.now(timezone.utc) - CHANGES_RETENTION or len(positions) != len(shard_ids()):
+        logger.info('Expired change cursor', extra={'issued_at': issued_at})
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail='Cursor expired, download everything again')
+    return positions
+
+def _visible(stmt):
+    return stmt.where(Change.txid < visible_txid_bound()) if POSTGRESQL else stmt
+
+def _changes_after(session: SessionDep, positions: list[tuple[int, int]], limit: int) -> list[tuple[int, Change]]:
+    """
+    The first limit changes after positions as (shard index, change). Every shard returns its
+    next limit entries, they are merged by creation time.
+    """
+    pages = []
+    for index, shard_id in enumerate(shard_ids()):
+        stmt = (
+            _visible(select(Change).where(tuple_(Change.txid, Change.seq) > tuple_(*positions[index])))
+            .order_by(Change.txid, Change.seq)
+            .limit(limit)
+        )
+        changes = session.execute(stmt, bind_arguments={'shard_id': shard_id}).scalars().all()
+        pages.append([(index, change) for change in changes])
+    return list(islice(heapq.merge(*pages, key=lambda item: item[1].created_at), limit))
+
+def get_changes(session: SessionDep, since: str | None, limit: int) -> dict:
+    """Get a page of the changes after the cursor since (from the start of the feed without)"""
+    positions = decode_change_cursor(since)
+    logger.debug('Getting changes', extra={'positions': positions, 'limit': limit})
+    changes = _changes_after(session, positions, limit)
+    for index, change in changes:
+        positions[index] = (change.txid, change.seq)
+    logger.info('Retrieved changes', extra={'count': len(changes)})
+    return {'changes': [change for _, change in changes], 'next_cursor': encode_change_cursor(positions),
+            'has_more': len(changes) == limit}
+
+def get_head_cursor(session: SessionDep) -> str:
+    """Cursor of the current end of the feed: take it before downloading everything, then sync from it"""
+    positions = []
+    for shard_id in shard_ids():
+        stmt = _visible(select(Change.txid, Change.seq)).order_by(Change.txid.desc(), Change.seq.desc()).limit(1)
+        last = session.execute(stmt, bind_arguments={'shard_id': shard_id}).first()
+        positions.append(tuple(last) if last else START)
+    return encode_change_cursor(positions)
+
+def _read_changes(positions: list[tuple[int, int]], limit: int) -> list[tuple[int, Change]]:
+    with ReadSessionLocal() as session:
+        return _changes_after(session, positions, limit)
+
+async def stream_changes(request: Request, positions: list[tuple[int, int]], batch: int = 100) -> AsyncIterator[str]:
+    """
+    Yields the changes after positions, and then the new ones as they are committed (polled every
+    CHANGES_POLL_SECONDS), formatted as Server-Sent Events. The id of every event is the cursor
+    after it, so a reconnecting EventSource resumes with Last-Event-ID.
+    """
+    yield ': connected\n\n'
+    idle = 0.0
+    while not await request.is_disconnected():
+        changes = await run_in_threadpool(_read_changes, positions, batch)
+        for index, change in changes:
+            positions[index] = (change.txid, change.seq)
+            data = ChangePublic.model_validate(change).model_dump_json()
+            yield f'id: {encode_change_cursor(positions)}\nevent: change\ndata: {data}\n\n'
+        if len(changes) == batch:
+            continue
+        if changes:
+            idle = 0.0
+        elif idle >= SSE_HEARTBEAT_SECONDS:
+            idle = 0.0
+            yield ': keep-alive\n\n'
+        await asyncio.sleep(CHANGES_POLL_SECONDS)
+        idle += CHANGES_POLL_SECONDS
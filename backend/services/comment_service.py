@@ -1,18 +1,24 @@
+from sqlalchemy import update, delete
 from models.models import Comment
 from uuid import UUID
 from fastapi import HTTPException, status
 from datetime import datetime, timezone
-from schemas.comment_schemas import CommentUpdate
+from schemas.comment_schemas import CommentCreate, CommentUpdate, CommentPublic
 from dependencies import SessionDep
 from settings import logger
+from changes import record_change
+from .post_service import adjust_post_counters, comment_subtree, create_comment, get_comment_thread
 
 """
 comment_service.py
 
 Handles comments-related logic, including:
 - Get a comment object based on ID
+- Reply to a comment
+- Get the replies to a comment, paginated by direct reply
 - Update a comment object based on ID
-- Delete a comment object based on ID
+- Delete a comment object based on ID, including all replies to it
+- Recording updates and deletes in the change feed (changes.py)
 
 
 This module integrates with:
@@ -43,6 +49,7 @@ def update_comment(comment_id: UUID, comment: CommentUpdate, session: SessionDep
     db_comment.last_edited = datetime.now(timezone.utc)
 
     session.add(db_comment)
+    record_change(session, 'comment', comment_id, owner_id, 'update', CommentPublic.model_validate(db_comment))
     session.commit()
     session.refresh(db_comment)
     logger.info('Comment was updated', extra={'comment_id': comment_id, 'comment': db_comment.__dict__})
@@ -59,6 +66,37 @@ def delete_comment(comment_id: UUID, owner_id: UUID, session: SessionDep) -> Non
     if db_comment.owner_id != owner_id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='cannot delete comment with a different user')
     
-    session.delete(db_comment)
+    delete_comment_subtree(db_comment, session)
     session.commit()
-    logger.info('Comment was deleted successfully', extra={'comment_id': comment_id, 'user_id': owner_id})
\ No newline at end of file
+    logger.info('Comment was deleted successfully', extra={'comment_id': comment_id, 'user_id': owner_id})
+
+def delete_comment_subtree(comment: Comment, session: SessionDep) -> int:
+    """
+    Deletes a comment and all replies to it with one range DELETE, and adjusts comments_count of
+    the post and reply_count of the parent comment. Does not commit.
+    comment only needs id, post_id, parent_id, owner_id and path, so a selected row can be passed as well.
+    The delete is recorded in the change feed, the replies are implied.
+    Returns the number of comments deleted.
+    """
+    removed = session.execute(
+        delete(Comment)
+        .where(Comment.post_id == comment.post_id, comment_subtree(comment.path))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if removed:
+        adjust_post_counters(comment.post_id, session, comments=-removed)
+        if comment.parent_id is not None:
+            session.execute(update(Comment).where(Comment.id == comment.parent_id).values(reply_count=Comment.reply_count - 1))
+        record_change(session, 'comment', comment.id, comment.owner_id, 'delete')
+    logger.debug('Deleted comment subtree', extra={'comment_id': comment.id, 'removed': removed})
+    return removed
+
+def create_reply(comment_id: UUID, comment: CommentCreate, owner_id: UUID, session: SessionDep) -> Comment:
+    """Creates a reply to an existing comment"""
+    parent = get_comment(comment_id, session)
+    return create_comment(parent.post_id, comment, owner_id, session, parent_id=parent.id)
+
+def get_comment_replies(comment_id: UUID, session: SessionDep, cursor: str | None, limit: int, max_depth: int) -> dict:
+    """Get a page of the replies to a comment, including their replies up to max_depth levels below them"""
+    parent = get_comment(comment_id, session)
+    return get_comment_thread(parent.post_id, session, cursor, limit, max_depth, parent=parent)
@@ -0,0 +1,82 @@
+from datetime import datetime, timezone
+from uuid import UUID
+from fastapi import HTTPException, status
+from sqlalchemy import select, func
+from models.models import Job
+from dependencies import SessionDep
+from settings import logger
+from jobs import JOB_QUEUES, job_runner
+from sharding import merge_shards
+
+"""
+job_service.py
+
+Handles inspection and management of background jobs (see jobs.py), including:
+- Metrics per queue: depth by status, age of the oldest due job, and the processed counts
+  and latencies of this worker process
+- Get a paginated list of jobs, optionally by queue and status
+- Retry a failed job
+
+
+This module integrates with:
+- SQLAlchemy ORM models (Job)
+"""
+
+def get_job_metrics(session: SessionDep) -> dict:
+    """Get queue depth and latency metrics of every job queue"""
+    logger.debug('Getting job metrics')
+    now = datetime.now(timezone.utc)
+    # jobs are on every shard, the rows of each shard are combined
+    counts: dict[tuple[str, str], int] = {}
+    for job_queue, job_status, count in session.execute(
+        select(Job.queue, Job.status, func.count()).group_by(Job.queue, Job.status)
+    ).all():
+        counts[job_queue, job_status] = counts.get((job_queue, job_status), 0) + count
+    oldest_due: dict[str, datetime] = {}
+    for job_queue, oldest in session.execute(
+        select(Job.queue, func.min(Job.run_at)).where(Job.status == 'pending', Job.run_at <= now).group_by(Job.queue)
+    ).all():
+        if oldest.tzinfo is None: # SQLite returns naive datetimes (stored as UTC)
+            oldest = oldest.replace(tzinfo=timezone.utc)
+        oldest_due[job_queue] = min(oldest, oldest_due.get(job_queue, oldest))
+    metrics = {}
+    for queue, config in JOB_QUEUES.items():
+        depth = {job_status: count for (job_queue, job_status), count in counts.items() if job_queue == queue}
+        oldest = oldest_due.get(queue)
+        metrics[queue] = {
+            'concurrency': config.concurrency,
+            'pending': depth.get('pending', 0),
+            'running': depth.get('running', 0),
+            'failed': depth.get('failed', 0),
+            'oldest_due_seconds': round((now - oldest).total_seconds(), 3) if oldest else 0.0,
+            'worker': job_runner.metrics[queue].as_dict(),
+        }
+    return {'worker_id': job_runner.worker_id, 'queues': metrics}
+
+def get_jobs(session: SessionDep, queue: str | None, job_status: str | None, offset: int, limit: int) -> list[Job]:
+    """Get a paginated list of jobs, oldest first"""
+    logger.debug('Getting jobs', extra={'queue': queue, 'status': job_status, 'offset': offset, 'limit': limit})
+    stmt = select(Job)
+    if queue is not None:
+        stmt = stmt.where(Job.queue == queue)
+    if job_status is not None:
+        stmt = stmt.where(Job.status == job_status)
+    stmt = stmt.order_by(Job.created_at, Job.id)
+    return merge_shards(session, stmt, lambda db_job: (db_job.created_at, db_job.id), limit, offset, scalars=True)
+
+def retry_job(job_id: UUID, session: SessionDep) -> Job:
+    """Schedules a failed job to run again, with a fresh number of attempts"""
+    logger.debug('Retrying job', extra={'job_id': job_id})
+    db_job = session.get(Job, job_id)
+    if not db_job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='job not found')
+    if db_job.status != 'failed':
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='only failed jobs can be retried')
+    db_job.status = 'pending'
+    db_job.attempts = 0
+    db_job.run_at = datetime.now(timezone.utc)
+    session.commit()
+    session.refresh(db_job)
+    job_runner.wake(db_job.queue)
+    logger.info('Job scheduled for retry', extra={'job_id': job_id, 'job': db_job.name})
+    return db_job
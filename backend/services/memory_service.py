@@ -0,0 +1,57 @@
+from typing import Literal
+from fastapi import HTTPException, status
+from settings import logger
+from memory import memory_diagnostics
+
+"""
+memory_service.py
+
+Handles the memory diagnostics of this worker process (see memory.py), including:
+- Start and stop tracing allocations with tracemalloc
+- Take snapshots of the traced allocations, list their top allocation sites and diff them
+- Get the memory used by the requests per route (ORM objects loaded, identity map size, peak allocation)
+"""
+
+GroupBy = Literal['lineno', 'filename', 'traceback']
+
+def get_memory_status() -> dict:
+    """Get RSS and traced memory of the process, whether tracing is active, and the stored snapshots"""
+    logger.debug('Getting memory status')
+    return memory_diagnostics.status()
+
+def start_memory_tracing(frames: int) -> dict:
+    """Start tracing allocations with up to frames frames per allocation, does nothing if already tracing"""
+    return memory_diagnostics.start(frames)
+
+def stop_memory_tracing() -> dict:
+    """Stop tracing allocations, drops the snapshots and request statistics"""
+    return memory_diagnostics.stop()
+
+def take_memory_snapshot(group_by: GroupBy, limit: int) -> dict:
+    """Take a snapshot, raises 409 if not tracing"""
+    snapshot_id = memory_diagnostics.take_snapshot()
+    if snapshot_id is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Memory tracing is not started')
+    logger.info('Memory snapshot taken', extra={'snapshot_id': snapshot_id})
+    return {'id': snapshot_id, 'top': memory_diagnostics.top(snapshot_id, group_by, limit)}
+
+def get_memory_snapshot(snapshot_id: str, group_by: GroupBy, limit: int) -> list[dict]:
+    """Get the largest allocation sites of a snapshot, raises 404 if it is unknown to this worker process"""
+    logger.debug('Getting memory snapshot', extra={'snapshot_id': snapshot_id})
+    top = memory_diagnostics.top(snapshot_id, group_by, limit)
+    if top is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Snapshot not found')
+    return top
+
+def diff_memory_snapshots(snapshot_id: str, base_id: str, group_by: GroupBy, limit: int) -> list[dict]:
+    """Get the allocation sites that grew most since the base snapshot, raises 404 if a snapshot is unknown"""
+    logger.debug('Diffing memory snapshots', extra={'snapshot_id': snapshot_id, 'base_id': base_id})
+    diff = memory_diagnostics.diff(base_id, snapshot_id, group_by, limit)
+    if diff is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Snapshot not found')
+    return diff
+
+def get_request_memory() -> list[dict]:
+    """Get the memory used by the requests per route since tracing started, largest peak allocation first"""
+    logger.debug('Getting request memory')
+    return memory_diagnostics.requests()
@@ -0,0 +1,157 @@
+from datetime import datetime, timezone
+from typing import NamedTuple
+from uuid import UUID
+from sqlalchemy import select, update, insert, func, tuple_, bindparam
+from sqlalchemy.exc import IntegrityError
+from models.models import Notification, Post
+from dependencies import SessionDep
+from database import SessionLocal
+from settings import logger
+from jobs import job, enqueue
+from sharding import new_id, split_by_shard
+from .pagination import after_cursor, next_cursor
+
+"""
+notification_service.py
+
+Handles notifications about activity on a user's posts, including:
+- Enqueueing a notification job from the request path (like_post, create_comment)
+- Writing notification jobs in batches from the 'notifications' job queue
+- Get a cursor-paginated page of notifications with the unread count
+- Mark all notifications of a user as read
+
+Coalescing:
+    While a notification is unread, further activity of the same type on the same post
+    is merged into it: actor_count is increased and actor_id/updated_at point to the
+    latest activity. A viral post therefore produces one row per recipient and type
+    ("37 people liked your post"), not one per like.
+
+Notification events are durable jobs (see jobs.py) enqueued in the transaction of the like or
+comment. The 'notifications' queue claims them in batches, which are grouped by
+(recipient, type, post) and written in one transaction (per shard of the recipients, when sharded). Jobs are delivered at least once,
+so after a crash between the write and the job completion a count can be too high.
+
+This module integrates with:
+- SQLAlchemy ORM models (Notification, Post)
+"""
+
+class NotificationEvent(NamedTuple):
+    """A single activity to notify the recipient about"""
+    recipient_id: UUID
+    type: str
+    post_id: UUID
+    actor_id: UUID
+    occurred_at: datetime
+
+def write_notifications(events: list[NotificationEvent]) -> None:
+    """
+    Writes a batch of events, coalesced per (recipient, type, post) into the unread notification
+    of that key, or a new notification if there is none. Events on deleted posts are dropped.
+    """
+    groups: dict[tuple[UUID, str, UUID], list[NotificationEvent]] = {}
+    for event in events:
+        groups.setdefault((event.recipient_id, event.type, event.post_id), []).append(event)
+
+    for attempt in range(2):
+        with SessionLocal() as session:
+            existing_posts = set(session.execute(
+                select(Post.id).where(Post.id.in_({post_id for _, _, post_id in groups}))
+            ).scalars().all())
+            groups = {key: group for key, group in groups.items() if key[2] in existing_posts}
+            if not groups:
+                return
+            unread = {
+                (recipient_id, type_, post_id): notification_id
+                for recipient_id, type_, post_id, notification_id in session.execute(
+                    select(Notification.recipient_id, Notification.type, Notification.post_id, Notification.id)
+                    .where(Notification.read_at.is_(None),
+                           tuple_(Notification.recipient_id, Notification.type, Notification.post_id).in_(list(groups)))
+                ).all()
+            }
+            updates, inserts = [], []
+            for key, group in groups.items():
+                latest = max(group, key=lambda event: event.occurred_at)
+                recipient_id, type_, post_id = key
+                if key in unread:
+                    updates.append({'notification_id': unread[key], 'recipient': recipient_id, 'count': len(group),
+                                    'actor_id': latest.actor_id, 'updated_at': latest.occurred_at})
+                else:
+                    inserts.append({'id': new_id(recipient_id), 'recipient_id': recipient_id, 'type': type_, 'post_id': post_id,
+                                    'actor_id': latest.actor_id, 'actor_count': len(group),
+                                    'created_at': min(event.occurred_at for event in group),
+                                    'updated_at': latest.occurred_at})
+            for shard_id, shard_updates in split_by_shard(updates, lambda row: row['recipient']).items():
+                session.connection(bind_arguments={'shard_id': shard_id}).execute(
+                    update(Notification.__table__)
+                    .where(Notification.id == bindparam('notification_id'))
+                    .values(actor_count=Notification.actor_count + bindparam('count'),
+                            actor_id=bindparam('actor_id'), updated_at=bindparam('updated_at')),
+                    shard_updates,
+                )
+            for shard_id, shard_inserts in split_by_shard(inserts, lambda row: row['recipient_id']).items():
+                session.execute(insert(Notification.__table__), shard_inserts, bind_arguments={'shard_id': shard_id})
+            try:
+                session.commit()
+            except IntegrityError:
+                # another worker process inserted the unread notification of a key first, merge into it
+                session.rollback()
+                if attempt:
+                    raise
+                continue
+            logger.info('Notifications written', extra={'events': len(events), 'updated': len(updates), 'inserted': len(inserts)})
+            return
+
+@job('write_notifications', queue='notifications', batch=True)
+def write_notifications_job(payloads: list[dict]) -> None:
+    """Background job writing the notification events claimed together in one batch"""
+    write_notifications([
+        NotificationEvent(UUID(payload['recipient_id']), payload['type'], UUID(payload['post_id']),
+                          UUID(payload['actor_id']), datetime.fromisoformat(payload['occurred_at']))
+        for payload in payloads
+    ])
+
+def notify(session: SessionDep, recipient_id: UUID, type_: str, post_id: UUID, actor_id: UUID) -> None:
+    """
+    Enqueues a notification for recipient_id about activity of actor_id on post_id in the callers
+    transaction. Not sent for own activity.
+    """
+    if recipient_id == actor_id:
+        return
+    enqueue(session, 'write_notifications', {
+        'recipient_id': str(recipient_id), 'type': type_, 'post_id': str(post_id),
+        'actor_id': str(actor_id), 'occurred_at': datetime.now(timezone.utc).isoformat(),
+    })
+
+def get_notifications_page(user_id: UUID, session: SessionDep, cursor: str | None, limit: int) -> dict:
+    """
+    Get a page of notifications of a user (newest first) and the number of unread notifications.
+    Pages are keyed on created_at: coalescing activity changes updated_at, which would move a
+    notification between pages while the client pages through them.
+    """
+    logger.debug('Getting notifications page for user', extra={'user_id': user_id, 'cursor': cursor, 'limit': limit})
+    stmt = select(Notification).where(Notification.recipient_id == user_id)
+    criteria = after_cursor(Notification.created_at, Notification.id, cursor)
+    if criteria is not None:
+        stmt = stmt.where(criteria)
+    stmt = stmt.order_by(Notification.created_at.desc(), Notification.id.desc()).limit(limit)
+    notifications = list(session.execute(stmt).scalars().all())
+    unread_count = session.execute(
+        select(func.count()).select_from(Notification)
+        .where(Notification.recipient_id == user_id, Notification.read_at.is_(None))
+    ).scalar_one()
+    logger.info('Retrieved notifications page for user', extra={'user_id': user_id, 'count': len(notifications), 'unread_count': unread_count})
+    return {'notifications': notifications, 'unread_count': unread_count,
+            'next_cursor': next_cursor(notifications, limit, 'created_at', 'id')}
+
+def mark_notifications_read(user_id: UUID, session: SessionDep) -> int:
+    """Marks all unread notifications of a user as read, returns how many were marked"""
+    logger.debug('Marking notifications read', extra={'user_id': user_id})
+    marked = session.execute(
+        update(Notification)
+        .where(Notification.recipient_id == user_id, Notification.read_at.is_(None))
+        .values(read_at=datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    session.commit()
+    logger.info('Notifications marked read', extra={'user_id': user_id, 'marked': marked})
+    return marked
@@ -0,0 +1,54 @@
+import base64
+import json
+from datetime import datetime
+from uuid import UUID
+from fastapi import HTTPException, status
+from sqlalchemy import and_, or_
+from settings import logger
+
+"""
+pagination.py
+
+Helpers for cursor (keyset) pagination.
+
+A cursor encodes the ordering key (timestamp, id) of the last row on a page.
+The next page continues strictly after that key, so every page is served by
+an index range scan instead of an OFFSET that grows with the page number.
+
+Cursors are opaque to clients: url-safe base64 encoded JSON.
+"""
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+def encode_cursor(timestamp: datetime, row_id: UUID) -> str:
+    """Encodes the ordering key of a row into an opaque cursor string"""
+    raw = json.dumps([timestamp.isoformat(), str(row_id)]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> tuple[datetime, UUID]:
+    """Decodes a cursor created by encode_cursor, raises 400 if the cursor is malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(timestamp), UUID(row_id)
+    except (ValueError, TypeError):
+        logger.warning('Invalid pagination cursor', extra={'cursor': cursor})
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid cursor')
+
+def after_cursor(timestamp_column, id_column, cursor: str | None):
+    """
+    Returns the WHERE criteria for rows after the cursor in (timestamp DESC, id DESC) order,
+    or None when no cursor is given (first page).
+    """
+    if cursor is None:
+        return None
+    timestamp, row_id = decode_cursor(cursor)
+    return or_(timestamp_column < timestamp, and_(timestamp_column == timestamp, id_column < row_id))
+
+def next_cursor(rows: list, limit: int, timestamp_attr: str, id_attr: str) -> str | None:
+    """Returns the cursor for the page after rows, or None if rows was the last page"""
+    if len(rows) < limit:
+        return None
+    last = rows[-1]
+    return encode_cursor(getattr(last, timestamp_attr), getattr(last, id_attr))
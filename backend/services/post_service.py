@@ -1,38 +1,159 @@
-from sqlalchemy import func, select
-from models.models import Post, User, Comment, Like
-from schemas.post_schemas import PostCreate, PostUpdate
+import math
+import re
+import secrets
+from sqlalchemy import select, update, delete, insert, bindparam
+from models.models import Post, User, Comment, Like, Notification
+from schemas.post_schemas import PostCreate, PostUpdate, PostPublic
+from schemas.comment_schemas import CommentBulkItem, CommentPublic
+from schemas.likes_schemas import LikePublic
 from uuid import UUID
-from fastapi import HTTPException, status
-from datetime import datetime, timezone
+from fastapi import HTTPException, Request, status
+from slowapi.util import get_remote_address
+from datetime import datetime, timedelta, timezone
 from schemas.comment_schemas import CommentCreate
 from dependencies import SessionDep
 from settings import logger
+from broker import broker
+from cache import TTLCache
+from invalidation import invalidation_bus
+from sharding import merge_shards, new_id, split_by_shard
+from changes import record_change
+from tags import index_posts, unindex_posts
+from views import view_counter
+from .notification_service import notify
+from .attachment_service import delete_post_attachments
 """
 post_service.py
 
 Handles posts-related logic, including:
 - Creating a post
+- Bulk writes: creating many posts or top-level comments, or liking many posts, in one transaction
 - Get a post object based on ID
-- Get a list of posts
+- Get a list of posts, newest first
+- Get a list of trending posts, ranked by hot_score
+  (both merged across shards when sharded, see sharding.py)
 - Update a post object based on ID
 - Delete a post object based on ID
-- Create a comment to specific post
+- Create a comment to specific post, or a reply to a comment
+- Get the comment thread of a post, paginated by top-level comment
 - Like a specific post
 - Remove like to specific post
+- Maintaining likes_count, comments_count and hot_score of a post
+- Filling the viewer specific liked_by_me flag for a page of posts
+- Publishing post activity events (likes, comments, updates) to the event broker
+- Enqueueing notifications to the post owner about likes and comments
+- Recording every change of posts, comments and likes in the change feed (changes.py)
+- Indexing the #tags and @mentions of posts (tags.py)
+- Counting the distinct viewers of posts (views.py)
 
 
 This module integrates with:
 - SQLAlchemy ORM models (Post, User, Comment, Like)
 """
 
-def get_likes_and_comments_count(post_id: UUID, session: SessionDep) -> tuple[int, int]:
+# hot_score = log10(engagement) + age term. The age term only grows for newer posts, so a post
+# needs 10x the engagement of a post HOT_SCORE_DECAY_SECONDS older to rank above it.
+# Because the decay is relative, the stored score never has to be recomputed as time passes,
+# only when the engagement of the post changes.
+HOT_SCORE_EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+HOT_SCORE_DECAY_SECONDS = 45000
+HOT_SCORE_COMMENT_WEIGHT = 2
 
-    logger.debug('Getting likes and comments count', extra={'post_id': post_id})
-    likes_count = session.execute(select(func.count(Like.user_id)).where(Like.post_id == post_id)).scalar_one()
-    comments_count = session.execute(select(func.count(Comment.id)).where(Comment.post_id == post_id)).scalar_one()
-    logger.info('Retrieved likes and comment count', extra={'likes_count': likes_count, 'comments_count': comments_count})
+# Comment paths are a concatenation of fixed-width segments, one per level: 13 hex digits of the
+# creation time in microseconds followed by 3 random hex digits to keep siblings created in the
+# same microsecond apart. Paths therefore sort in thread order (parents before their replies,
+# siblings oldest first), and the subtree of a comment is the range [path, path + 'g').
+COMMENT_PATH_SEGMENT_LENGTH = 16
+MAX_COMMENT_DEPTH = 256 // COMMENT_PATH_SEGMENT_LENGTH - 1
+COMMENT_PATH_PATTERN = re.compile(f'(?:[0-9a-f]{{{COMMENT_PATH_SEGMENT_LENGTH}}})+')
+
+def comment_path_segment(created_at: datetime) -> str:
+    """Path segment of a comment created at created_at"""
+    micros = int(created_at.timestamp() * 1_000_000)
+    return f'{micros:013x}{secrets.randbelow(4096):03x}'
+
+def comment_subtree(path: str):
+    """Criteria matching a comment and all its replies, a range scan on the (post_id, path) index"""
+    return (Comment.path >= path) & (Comment.path < path + 'g')
+
+# Per-user set of liked posts created after a horizon (about RECENT_LIKES_WINDOW ago), so the
+# liked_by_me flags of recent posts - most list pages - are answered without a query.
+# Older posts on a page are looked up with one IN query. Likes/unlikes through this process update
+# the cached set and evict it in the other worker processes through the invalidation bus.
+RECENT_LIKES_WINDOW = timedelta(days=7)
+RECENT_LIKES_MAX = 1000
+recent_likes_cache = TTLCache(maxsize=10_000, ttl=60)
+invalidation_bus.register('recent_likes', recent_likes_cache, key_type=UUID)
+
+def calculate_hot_score(likes_count: int, comments_count: int, created_at: datetime) -> float:
+    """Calculates the time-decayed trending score of a post"""
+    if created_at.tzinfo is None: # SQLite returns naive datetimes (stored as UTC)
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    engagement = max(likes_count + HOT_SCORE_COMMENT_WEIGHT * comments_count, 1)
+    age = (created_at - HOT_SCORE_EPOCH).total_seconds()
+    return round(math.log10(engagement) + age / HOT_SCORE_DECAY_SECONDS, 7)
+
+def adjust_post_counters(post_id: UUID, session: SessionDep, likes: int = 0, comments: int = 0) -> tuple[int, int] | None:
+    """
+    Atomically adjusts likes_count/comments_count of a post and recomputes its hot_score.
+    Does not commit, so the change is part of the callers transaction.
+    Returns the new (likes_count, comments_count), or None if the post does not exist.
+    """
+    logger.debug('Adjusting post counters', extra={'post_id': post_id, 'likes': likes, 'comments': comments})
+    stmt = (
+        update(Post)
+        .where(Post.id == post_id)
+        .values(likes_count=Post.likes_count + likes, comments_count=Post.comments_count + comments)
+        .returning(Post.likes_count, Post.comments_count, Post.created_at)
+    )
+    counters = session.execute(stmt).one_or_none()
+    if counters is None:
+        return None
+    likes_count, comments_count, created_at = counters
+    hot_score = calculate_hot_score(likes_count, comments_count, created_at)
+    session.execute(update(Post).where(Post.id == post_id).values(hot_score=hot_score))
     return likes_count, comments_count
 
+def bulk_adjust_post_counters(session: SessionDep, likes: dict[UUID, int] | None = None,
+                              comments: dict[UUID, int] | None = None) -> dict[UUID, tuple[int, int]]:
+    """
+    Adjusts likes_count/comments_count of many posts (post_id -> delta) and recomputes their hot_score.
+    Posts sharing the same delta are updated with a single UPDATE ... WHERE id IN statement.
+    Does not commit, so the change is part of the callers transaction.
+    Returns the new (likes_count, comments_count) of each existing post.
+    """
+    likes = likes or {}
+    comments = comments or {}
+    post_ids = set(likes) | set(comments)
+    if not post_ids:
+        return {}
+    logger.debug('Adjusting counters of many posts', extra={'posts': len(post_ids)})
+    by_delta: dict[tuple[int, int], list[UUID]] = {}
+    for post_id in post_ids:
+        by_delta.setdefault((likes.get(post_id, 0), comments.get(post_id, 0)), []).append(post_id)
+    for (likes_delta, comments_delta), ids in by_delta.items():
+        session.execute(
+            update(Post)
+            .where(Post.id.in_(ids))
+            .values(likes_count=Post.likes_count + likes_delta, comments_count=Post.comments_count + comments_delta)
+            .execution_options(synchronize_session=False)
+        )
+    counters = session.execute(
+        select(Post.id, Post.owner_id, Post.likes_count, Post.comments_count, Post.created_at).where(Post.id.in_(post_ids))
+    ).all()
+    for shard_id, shard_counters in split_by_shard(counters, lambda row: row.owner_id).items():
+        session.execute(update(Post.__table__).where(Post.id == bindparam('post_id')).values(hot_score=bindparam('score')), [
+            {'post_id': post_id, 'score': calculate_hot_score(likes_count, comments_count, created_at)}
+            for post_id, _, likes_count, comments_count, created_at in shard_counters
+        ], bind_arguments={'shard_id': shard_id})
+    return {post_id: (likes_count, comments_count) for post_id, _, likes_count, comments_count, _ in counters}
+
+def publish_post_event(post_id: UUID, owner_id: UUID, event_type: str, **fields) -> None:
+    """Publishes an activity event to subscribers of the post and to subscribers of the post owner"""
+    event = {'type': event_type, 'post_id': str(post_id), **fields}
+    broker.publish(f'post:{post_id}', event)
+    broker.publish(f'user:{owner_id}', event)
+
 def create_post_object(post: PostCreate, owner_id: UUID, session: SessionDep) -> Post:
     """Creates a new post object"""
     logger.debug('Creating a new post', extra={'fields': list(post.model_dump().keys()), 'values': list(post.model_dump().values()),'user_id': owner_id})
@@ -41,17 +162,56 @@ def create_post_object(post: PostCreate, owner_id: UUID, session: SessionDep) ->
         logger.warning("User was not found", extra={'user_id': owner_id})
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='user does not exist')
     
-    db_post = Post(**post.model_dump(), owner_id=owner_id)
+    created_at = datetime.now(timezone.utc)
+    db_post = Post(**post.model_dump(), owner_id=owner_id, created_at=created_at,
+                   hot_score=calculate_hot_score(0, 0, created_at))
     session.add(db_post)
+    session.flush()
+    index_posts(session, [{'id': db_post.id, 'owner_id': owner_id, 'content': db_post.content, 'created_at': created_at}])
+    record_change(session, 'post', db_post.id, owner_id, 'create', PostPublic.model_validate(db_post))
     session.commit()
     session.refresh(db_post)
     logger.info('Created a new post', extra={'fields': list(post.model_dump().keys()), 'values': list(post.model_dump().values()),'user_id': owner_id, 'post_id': db_post.id})
     return db_post
 
+def _bulk_result(results: list[dict]) -> dict:
+    """BulkResult of the per-item results of a bulk request"""
+    created = sum(result['status'] == 'created' for result in results)
+    return {'created': created, 'failed': len(results) - created, 'results': results}
+
+def create_posts_bulk(posts: list[PostCreate], owner_id: UUID, session: SessionDep) -> dict:
+    """
+    Creates many posts with one multi-row INSERT in one transaction.
+    created_at of consecutive posts is one microsecond apart, so they list in request order.
+    """
+    logger.debug('Creating posts in bulk', extra={'count': len(posts), 'user_id': owner_id})
+    user_exist = session.get(User, owner_id)
+    if not user_exist:
+        logger.warning("User was not found", extra={'user_id': owner_id})
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='user does not exist')
+
+    now = datetime.now(timezone.utc)
+    rows = []
+    for index, post in enumerate(posts):
+        created_at = now + timedelta(microseconds=index)
+        rows.append({**post.model_dump(), 'id': new_id(owner_id), 'owner_id': owner_id, 'created_at': created_at,
+                     'hot_score': calculate_hot_score(0, 0, created_at)})
+        record_change(session, 'post', rows[-1]['id'], owner_id, 'create',
+                      PostPublic(**post.model_dump(), id=rows[-1]['id'], owner_id=owner_id, created_at=created_at))
+    for shard_id, shard_rows in split_by_shard(rows, lambda row: row['owner_id']).items():
+        session.execute(insert(Post.__table__), shard_rows, bind_arguments={'shard_id': shard_id})
+    index_posts(session, rows)
+    session.commit()
+    post_ids = [row['id'] for row in rows]
+    logger.info('Created posts in bulk', extra={'count': len(post_ids), 'user_id': owner_id})
+    return _bulk_result([{'index': index, 'status': 'created', 'id': post_id} for index, post_id in enumerate(post_ids)])
+
 def get_post_with_liked_by(post_id, session: SessionDep) -> Post:
     post = get_post(post_id, session)
-    liked_by = [like.user.username for like in post.likes]
-    post.liked_by = liked_by
+    user_ids = [like.user_id for like in post.likes]
+    # the users can live on other shards than the likes, so they are not joined
+    usernames = dict(session.execute(select(User.id, User.username).where(User.id.in_(user_ids))).all()) if user_ids else {}
+    post.liked_by = [usernames[user_id] for user_id in user_ids if user_id in usernames]
     return post
 
 def get_post(post_id: UUID, session: SessionDep) -> Post:
@@ -62,22 +222,36 @@ def get_post(post_id: UUID, session: SessionDep) -> Post:
         logger.warning("post was not found", extra={'post_id': post_id})
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Post not found')
     
-    likes_count, comments_count = get_likes_and_comments_count(post.id, session)
-    post.likes_count = likes_count
-    post.comments_count = comments_count
     logger.info('Post retrieved', extra={'post': post.__dict__, 'post_id': post_id})
     return post
 
-def get_posts(session: SessionDep, offset: int, limit: int) -> list[Post]:
-    """Get a paginated list of post"""
+def record_post_view(post_id: UUID, viewer_id: UUID | None, request: Request) -> None:
+    """Counts a view of a post by the authenticated user, or by the client address for anonymous viewers"""
+    viewer = b'u' + viewer_id.bytes if viewer_id is not None else b'a' + get_remote_address(request).encode()
+    view_counter.record(post_id, viewer)
+
+def get_posts(session: SessionDep, offset: int, limit: int, viewer_id: UUID | None = None) -> list[Post]:
+    """Get a paginated list of posts, newest first, with liked_by_me filled for viewer_id"""
     logger.debug('Getting posts from DB', extra={'offset': offset, 'limit': limit})
-    posts = session.execute(select(Post).offset(offset).limit(limit)).scalars().all()
-    for post in posts:
-        likes_count, comments_count = get_likes_and_comments_count(post.id, session)
-        post.likes_count = likes_count
-        post.comments_count = comments_count
+    stmt = select(Post).order_by(Post.created_at.desc(), Post.id.desc())
+    posts = merge_shards(session, stmt, lambda post: (post.created_at, post.id), limit, offset, descending=True, scalars=True)
     logger.info('Retrieved posts from DB', extra={'count': len(posts)})
-    return list(posts)
+    return fill_liked_by_me(list(posts), viewer_id, session)
+
+def get_trending_posts(session: SessionDep, offset: int, limit: int, viewer_id: UUID | None = None) -> list[Post]:
+    """Get a paginated list of posts ordered by hot_score, served from the hot_score index, with liked_by_me filled for viewer_id"""
+    logger.debug('Getting trending posts from DB', extra={'offset': offset, 'limit': limit})
+    stmt = select(Post).order_by(Post.hot_score.desc(), Post.id.desc())
+    posts = merge_shards(session, stmt, lambda post: (post.hot_score, post.id), limit, offset, descending=True, scalars=True)
+    logger.info('Retrieved trending posts from DB', extra={'count': len(posts)})
+    return fill_liked_by_me(list(posts), viewer_id, session)
+
+def get_posts_by_ids(post_ids: list[UUID], session: SessionDep, viewer_id: UUID | None = None) -> list[Post]:
+    """Get posts in the order of post_ids (missing ones are left out), with liked_by_me filled for viewer_id"""
+    if not post_ids:
+        return []
+    posts = {post.id: post for post in session.execute(select(Post).where(Post.id.in_(post_ids))).scalars()}
+    return fill_liked_by_me([posts[post_id] for post_id in post_ids if post_id in posts], viewer_id, session)
 
 def delete_post(post_id: UUID, owner_id: UUID, session: SessionDep) -> None:
     """Delete a post if the owner_id matches the user that created the post"""
@@ -90,8 +264,16 @@ def delete_post(post_id: UUID, owner_id: UUID, session: SessionDep) -> None:
     if post.owner_id != owner_id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Cannot delete a post that is not yours')
     
-    session.delete(post)
+    # bulk deletes, replies reference their parent comment so the ORM cascade cannot be used
+    session.execute(delete(Like).where(Like.post_id == post_id))
+    session.execute(delete(Comment).where(Comment.post_id == post_id))
+    session.execute(delete(Notification).where(Notification.post_id == post_id))
+    delete_post_attachments([post_id], session)
+    unindex_posts(session, [post_id])
+    session.execute(delete(Post).where(Post.id == post_id))
+    record_change(session, 'post', post_id, owner_id, 'delete')
     session.commit()
+    publish_post_event(post_id, owner_id, 'post_deleted')
     logger.info('Post deleted', extra={'post_id': post_id, 'user_id': owner_id})
 
 def update_post(post_id: UUID, post: PostUpdate, owner_id: UUID, session: SessionDep) -> Post:
@@ -112,19 +294,22 @@ def update_post(post_id: UUID, post: PostUpdate, owner_id: UUID, session: Sessio
     setattr(db_post, 'updated_at', datetime.now(timezone.utc))
 
     session.add(db_post)
+    if 'content' in updated_data:
+        unindex_posts(session, [post_id])
+        index_posts(session, [{'id': post_id, 'owner_id': owner_id, 'content': db_post.content, 'created_at': db_post.created_at}])
+    record_change(session, 'post', post_id, owner_id, 'update', PostPublic.model_validate(db_post))
     session.commit()
     session.refresh(db_post)
 
-    likes_count, comments_count = get_likes_and_comments_count(db_post.id, session)
-    db_post.likes_count = likes_count
-    db_post.comments_count = comments_count
+    publish_post_event(post_id, owner_id, 'post_updated', title=db_post.title, content=db_post.content)
     logger.info('Updated post with new values', extra={'post_id': post_id, 'user_id': owner_id, 'post': db_post.__dict__})
     return db_post
 
-def create_comment(post_id: UUID, comment: CommentCreate, owner_id: UUID, session: SessionDep) -> Comment:
-    """Creates a new comment object to a specific post"""
+def create_comment(post_id: UUID, comment: CommentCreate, owner_id: UUID, session: SessionDep,
+                   parent_id: UUID | None = None) -> Comment:
+    """Creates a new comment object to a specific post, or a reply to the comment parent_id"""
 
-    logger.debug('Creating comments for post', extra={'post_id': post_id, 'user_id': owner_id, 'fields': list(comment.model_dump().keys()), 'values': list(comment.model_dump().values())})
+    logger.debug('Creating comments for post', extra={'post_id': post_id, 'user_id': owner_id, 'parent_id': parent_id, 'fields': list(comment.model_dump().keys()), 'values': list(comment.model_dump().values())})
     post = session.get(Post, post_id)
     if not post:
         logger.warning("post was not found", extra={'post_id': post_id})
@@ -135,15 +320,119 @@ def create_comment(post_id: UUID, comment: CommentCreate, owner_id: UUID, sessio
         logger.warning("user was not found", extra={'user_id': owner_id})
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='user not found')
     
-    db_comment = Comment(**comment.model_dump())
-    db_comment.owner_id = owner_id
-    db_comment.post_id = post_id
+    created_at = datetime.now(timezone.utc)
+    path, depth = comment_path_segment(created_at), 0
+    if parent_id is not None:
+        parent = session.get(Comment, parent_id)
+        if not parent or parent.post_id != post_id:
+            logger.warning("parent comment was not found", extra={'post_id': post_id, 'parent_id': parent_id})
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='comment not found')
+        if parent.depth >= MAX_COMMENT_DEPTH:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='maximum reply depth reached')
+        path, depth = parent.path + path, parent.depth + 1
+        session.execute(update(Comment).where(Comment.id == parent_id).values(reply_count=Comment.reply_count + 1))
+
+    db_comment = Comment(**comment.model_dump(), owner_id=owner_id, post_id=post_id, parent_id=parent_id,
+                         path=path, depth=depth, created_at=created_at)
     session.add(db_comment)
+    post_owner_id = post.owner_id
+    _, comments_count = adjust_post_counters(post_id, session, comments=1)
+    notify(session, post_owner_id, 'comment', post_id, owner_id)
+    session.flush()
+    record_change(session, 'comment', db_comment.id, owner_id, 'create', CommentPublic.model_validate(db_comment))
     session.commit()
     session.refresh(db_comment)
+    publish_post_event(post_id, post_owner_id, 'comment', comment_id=str(db_comment.id), user_id=str(owner_id),
+                       parent_id=str(parent_id) if parent_id else None, content=db_comment.content,
+                       comments_count=comments_count)
     logger.info('Created comment for post', extra={'post_id': post_id, 'user_id': owner_id, 'comment': db_comment.__dict__})
     return db_comment
 
+def create_comments_bulk(comments: list[CommentBulkItem], owner_id: UUID, session: SessionDep) -> dict:
+    """
+    Creates many top-level comments, on any posts, with one multi-row INSERT per shard in one transaction.
+    Comments on posts that don't exist fail individually, the others are created.
+    """
+    logger.debug('Creating comments in bulk', extra={'count': len(comments), 'user_id': owner_id})
+    user = session.get(User, owner_id)
+    if not user:
+        logger.warning("user was not found", extra={'user_id': owner_id})
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='user not found')
+
+    post_owners = dict(session.execute(
+        select(Post.id, Post.owner_id).where(Post.id.in_({comment.post_id for comment in comments}))
+    ).all())
+    now = datetime.now(timezone.utc)
+    results, created, rows = [], [], []
+    for index, comment in enumerate(comments):
+        if comment.post_id not in post_owners:
+            results.append({'index': index, 'status': 'failed', 'detail': 'post not found'})
+            continue
+        # one microsecond apart, so the path segments of a batch are distinct and in request order
+        created_at = now + timedelta(microseconds=index)
+        rows.append({'id': new_id(post_owners[comment.post_id]), 'content': comment.content, 'post_id': comment.post_id,
+                     'owner_id': owner_id, 'path': comment_path_segment(created_at), 'depth': 0, 'created_at': created_at})
+        record_change(session, 'comment', rows[-1]['id'], owner_id, 'create',
+                      CommentPublic(id=rows[-1]['id'], content=comment.content, owner_id=owner_id, post_id=comment.post_id,
+                                    created_at=created_at))
+        created.append({'index': index, 'status': 'created'})
+        results.append(created[-1])
+    if not rows:
+        return _bulk_result(results)
+
+    for shard_id, shard_rows in split_by_shard(rows, lambda row: post_owners[row['post_id']]).items():
+        session.execute(insert(Comment.__table__), shard_rows, bind_arguments={'shard_id': shard_id})
+    new_comments: dict[UUID, int] = {}
+    for row in rows:
+        new_comments[row['post_id']] = new_comments.get(row['post_id'], 0) + 1
+        notify(session, post_owners[row['post_id']], 'comment', row['post_id'], owner_id)
+    counters = bulk_adjust_post_counters(session, comments=new_comments)
+    session.commit()
+    for result, row in zip(created, rows):
+        result['id'] = row['id']
+        publish_post_event(row['post_id'], post_owners[row['post_id']], 'comment', comment_id=str(row['id']),
+                           user_id=str(owner_id), parent_id=None, content=row['content'],
+                           comments_count=counters[row['post_id']][1])
+    logger.info('Created comments in bulk', extra={'count': len(rows), 'failed': len(results) - len(rows), 'user_id': owner_id})
+    return _bulk_result(results)
+
+def get_comment_thread(post_id: UUID, session: SessionDep, cursor: str | None, limit: int, max_depth: int,
+                       parent: Comment | None = None) -> dict:
+    """
+    Get a page of a comment thread in display order: the replies to parent (top-level comments of
+    the post if parent is None) together with their replies up to max_depth levels below them.
+
+    One query selects the page of top-level comments by path, a second one fetches their subtrees
+    with a single range scan on the (post_id, path) index. The cursor is the path of the last
+    top-level comment of the previous page.
+    """
+    logger.debug('Getting comment thread', extra={'post_id': post_id, 'parent_id': parent.id if parent else None, 'cursor': cursor, 'limit': limit, 'max_depth': max_depth})
+    root_depth = parent.depth + 1 if parent else 0
+    if cursor is not None and (not COMMENT_PATH_PATTERN.fullmatch(cursor)
+                               or len(cursor) != COMMENT_PATH_SEGMENT_LENGTH * (root_depth + 1)):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid cursor')
+
+    stmt = select(Comment.path).where(Comment.post_id == post_id, Comment.depth == root_depth)
+    if parent:
+        stmt = stmt.where(comment_subtree(parent.path))
+    if cursor:
+        stmt = stmt.where(Comment.path > cursor)
+    root_paths = session.execute(stmt.order_by(Comment.path).limit(limit + 1)).scalars().all()
+    has_more = len(root_paths) > limit
+    root_paths = root_paths[:limit]
+    if not root_paths:
+        return {'comments': [], 'next_cursor': None}
+
+    stmt = (
+        select(Comment)
+        .where(Comment.post_id == post_id, Comment.path >= root_paths[0], Comment.path < root_paths[-1] + 'g',
+               Comment.depth <= root_depth + max_depth)
+        .order_by(Comment.path)
+    )
+    comments = list(session.execute(stmt).scalars().all())
+    logger.info('Retrieved comment thread', extra={'post_id': post_id, 'roots': len(root_paths), 'count': len(comments)})
+    return {'comments': comments, 'next_cursor': root_paths[-1] if has_more else None}
+
 def like_post(post_id: UUID, user_id: UUID, session: SessionDep) -> Like:
     """Creates a like object to a specific post"""
     logger.debug('Liking post', extra={'post_id': post_id, 'user_id': user_id})
@@ -166,8 +455,15 @@ def like_post(post_id: UUID, user_id: UUID, session: SessionDep) -> Like:
     
     like = Like(post_id=post_id, user_id=user_id)
     session.add(like)
+    post_owner_id, post_created_at = db_post.owner_id, db_post.created_at
+    likes_count, _ = adjust_post_counters(post_id, session, likes=1)
+    notify(session, post_owner_id, 'like', post_id, user_id)
+    session.flush()
+    record_change(session, 'like', post_id, user_id, 'create', LikePublic(user_id=user_id, post_id=post_id, liked_at=like.liked_at))
     session.commit()
     session.refresh(like)
+    _cache_likes(user_id, {post_id: post_created_at}, liked=True)
+    publish_post_event(post_id, post_owner_id, 'like', user_id=str(user_id), likes_count=likes_count)
     logger.info('Post was liked successfully', extra={'like': like.__dict__, 'post_id': post_id, 'user_id': user_id})
     return like
 
@@ -188,5 +484,121 @@ def delete_like(post_id: UUID, user_id: UUID, session: SessionDep) -> None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='you have not liked this post')
     
     session.delete(like)
+    post_owner_id, post_created_at = db_post.owner_id, db_post.created_at
+    likes_count, _ = adjust_post_counters(post_id, session, likes=-1)
+    record_change(session, 'like', post_id, user_id, 'delete')
+    session.commit()
+    _cache_likes(user_id, {post_id: post_created_at}, liked=False)
+    publish_post_event(post_id, post_owner_id, 'unlike', user_id=str(user_id), likes_count=likes_count)
+    logger.info('Removed a like from post successfully', extra={'like': like.__dict__, 'post_id': post_id, 'user_id': user_id})
+
+def like_posts_bulk(post_ids: list[UUID], user_id: UUID, session: SessionDep) -> dict:
+    """
+    Likes many posts with one multi-row INSERT per shard in one transaction.
+    Posts that don't exist, own posts and posts already liked (or repeated in the request) fail individually,
+    the others are liked.
+    """
+    logger.debug('Liking posts in bulk', extra={'count': len(post_ids), 'user_id': user_id})
+    db_user = session.get(User, user_id)
+    if not db_user:
+        logger.warning("user was not found", extra={'user_id': user_id})
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='user not found')
+
+    posts = {
+        post_id: (owner_id, created_at)
+        for post_id, owner_id, created_at in session.execute(
+            select(Post.id, Post.owner_id, Post.created_at).where(Post.id.in_(set(post_ids)))
+        ).all()
+    }
+    liked = set(session.execute(
+        select(Like.post_id).where(Like.user_id == user_id, Like.post_id.in_(list(posts)))
+    ).scalars().all()) if posts else set()
+    results, new_likes = [], []
+    for index, post_id in enumerate(post_ids):
+        if post_id not in posts:
+            detail = 'post not found'
+        elif posts[post_id][0] == user_id:
+            detail = 'cannot like own post'
+        elif post_id in liked:
+            detail = 'already liked the post'
+        else:
+            liked.add(post_id)
+            new_likes.append(post_id)
+            results.append({'index': index, 'status': 'created', 'id': post_id})
+            continue
+        results.append({'index': index, 'status': 'failed', 'id': post_id, 'detail': detail})
+    if not new_likes:
+        return _bulk_result(results)
+
+    liked_at = datetime.now(timezone.utc)
+    for shard_id, shard_likes in split_by_shard(new_likes, lambda post_id: posts[post_id][0]).items():
+        session.execute(insert(Like.__table__), [{'user_id': user_id, 'post_id': post_id, 'liked_at': liked_at} for post_id in shard_likes],
+                        bind_arguments={'shard_id': shard_id})
+    counters = bulk_adjust_post_counters(session, likes=dict.fromkeys(new_likes, 1))
+    for post_id in new_likes:
+        notify(session, posts[post_id][0], 'like', post_id, user_id)
+        record_change(session, 'like', post_id, user_id, 'create', LikePublic(user_id=user_id, post_id=post_id, liked_at=liked_at))
     session.commit()
-    logger.info('Removed a like from post successfully', extra={'like': like.__dict__, 'post_id': post_id, 'user_id': user_id})
\ No newline at end of file
+    _cache_likes(user_id, {post_id: posts[post_id][1] for post_id in new_likes}, liked=True)
+    for post_id in new_likes:
+        publish_post_event(post_id, posts[post_id][0], 'like', user_id=str(user_id), likes_count=counters[post_id][0])
+    logger.info('Liked posts in bulk', extra={'count': len(new_likes), 'failed': len(results) - len(new_likes), 'user_id': user_id})
+    return _bulk_result(results)
+
+def _as_utc(value: datetime) -> datetime:
+    """SQLite returns naive datetimes (stored as UTC)"""
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+def _load_recent_likes(user_id: UUID, session: SessionDep) -> tuple[datetime, set[UUID]]:
+    """
+    Loads the posts created after the horizon that user_id liked and caches them.
+    For users with more than RECENT_LIKES_MAX such likes the horizon is moved forward.
+    """
+    horizon = datetime.now(timezone.utc) - RECENT_LIKES_WINDOW
+    stmt = (
+        select(Like.post_id, Post.created_at)
+        .join(Post, Post.id == Like.post_id)
+        .where(Like.user_id == user_id, Post.created_at > horizon)
+        .order_by(Post.created_at.desc())
+    )
+    # likes are on the shard of their post, so the likes of a user are spread over all shards
+    rows = merge_shards(session, stmt, lambda row: row.created_at, RECENT_LIKES_MAX + 1, descending=True)
+    if len(rows) > RECENT_LIKES_MAX:
+        # every post created after the first post left out is included
+        horizon = _as_utc(rows[RECENT_LIKES_MAX].created_at)
+        rows = rows[:RECENT_LIKES_MAX]
+    recent = (horizon, {post_id for post_id, _ in rows})
+    recent_likes_cache.set(user_id, recent)
+    logger.debug('Loaded recent likes of user', extra={'user_id': user_id, 'count': len(rows)})
+    return recent
+
+def _cache_likes(user_id: UUID, posts: dict[UUID, datetime], liked: bool) -> None:
+    """Applies likes/unlikes of user_id on posts (post_id -> created_at) to its cached recent likes, if cached"""
+    def change(recent: tuple[datetime, set[UUID]]) -> None:
+        horizon, post_ids = recent
+        for post_id, post_created_at in posts.items():
+            if not liked:
+                post_ids.discard(post_id)
+            elif _as_utc(post_created_at) > horizon:
+                post_ids.add(post_id)
+    recent_likes_cache.update(user_id, change)
+    invalidation_bus.publish('recent_likes', user_id)
+
+def fill_liked_by_me(posts: list[Post], viewer_id: UUID | None, session: SessionDep) -> list[Post]:
+    """
+    Sets liked_by_me on each post of a page for the viewer (left unset without viewer).
+    Recent posts are answered from the viewers cached recent likes, the remaining posts
+    with one WHERE user_id = :viewer AND post_id IN (...) query.
+    """
+    if viewer_id is None or not posts:
+        return posts
+    horizon, recent = recent_likes_cache.get(viewer_id) or _load_recent_likes(viewer_id, session)
+    older = [post.id for post in posts if _as_utc(post.created_at) <= horizon]
+    liked = {post.id for post in posts if post.id in recent}
+    if older:
+        stmt = select(Like.post_id).where(Like.user_id == viewer_id, Like.post_id.in_(older))
+        liked.update(session.execute(stmt).scalars().all())
+    for post in posts:
+        post.liked_by_me = post.id in liked
+    logger.debug('Filled liked_by_me', extra={'user_id': viewer_id, 'posts': len(posts), 'queried': len(older)})
+    return posts
@@ -0,0 +1,24 @@
+from fastapi import HTTPException, status
+from settings import logger
+from profiling import profile_store
+
+"""
+profile_service.py
+
+Handles access to the request profiles of this worker process (see profiling.py), including:
+- Get a summary of the most recent profiled requests
+- Get the full profile of a request
+"""
+
+def get_profiles() -> list[dict]:
+    """Get a summary of the stored profiles, latest first"""
+    logger.debug('Getting request profiles')
+    return profile_store.list()
+
+def get_profile(profile_id: str) -> dict:
+    """Get a stored profile, raises 404 if it is unknown to this worker process"""
+    logger.debug('Getting request profile', extra={'profile_id': profile_id})
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Profile not found')
+    return profile
@@ -0,0 +1,53 @@
+from uuid import UUID
+from sqlalchemy import select
+from models.models import PostMention, PostTag
+from dependencies import SessionDep
+from settings import logger
+from sharding import merge_shards
+from tags import normalize_tag, top_tags
+from .pagination import after_cursor, next_cursor
+from .post_service import get_posts_by_ids
+
+"""
+tag_service.py
+
+Handles reading the index of #tags and @mentions (see tags.py), including:
+- Get a page of the posts using a tag
+- Get a page of the posts mentioning a user
+- Get the most used tags of recent posts
+
+Pages are read from the index (newest post first) and the posts are loaded by id.
+"""
+
+def _index_page(stmt, created_at, post_id, session: SessionDep, cursor: str | None, limit: int) -> tuple[list[UUID], str | None]:
+    """Post ids of a page of index rows (newest first), and the cursor of the next page"""
+    criteria = after_cursor(created_at, post_id, cursor)
+    if criteria is not None:
+        stmt = stmt.where(criteria)
+    stmt = stmt.order_by(created_at.desc(), post_id.desc())
+    rows = merge_shards(session, stmt, lambda row: (row.created_at, row.post_id), limit, descending=True)
+    return [row.post_id for row in rows], next_cursor(rows, limit, 'created_at', 'post_id')
+
+def get_tag_posts_page(tag: str, session: SessionDep, cursor: str | None, limit: int, viewer_id: UUID | None = None) -> dict:
+    """Get a page of the posts using tag (newest first), with liked_by_me filled for viewer_id"""
+    tag = normalize_tag(tag)
+    logger.debug('Getting posts page for tag', extra={'tag': tag, 'cursor': cursor, 'limit': limit})
+    stmt = select(PostTag.post_id, PostTag.created_at).where(PostTag.tag == tag)
+    post_ids, cursor = _index_page(stmt, PostTag.created_at, PostTag.post_id, session, cursor, limit)
+    posts = get_posts_by_ids(post_ids, session, viewer_id)
+    logger.info('Retrieved posts page for tag', extra={'tag': tag, 'count': len(posts)})
+    return {'tag': tag, 'posts': posts, 'next_cursor': cursor}
+
+def get_mention_posts_page(user_id: UUID, session: SessionDep, cursor: str | None, limit: int,
+                           viewer_id: UUID | None = None) -> tuple[list, str | None]:
+    """Get a page of the posts mentioning user_id (newest first) and the next cursor, with liked_by_me filled for viewer_id"""
+    logger.debug('Getting mentions page for user', extra={'user_id': user_id, 'cursor': cursor, 'limit': limit})
+    stmt = select(PostMention.post_id, PostMention.created_at).where(PostMention.user_id == user_id)
+    post_ids, cursor = _index_page(stmt, PostMention.created_at, PostMention.post_id, session, cursor, limit)
+    posts = get_posts_by_ids(post_ids, session, viewer_id)
+    logger.info('Retrieved mentions page for user', extra={'user_id': user_id, 'count': len(posts)})
+    return posts, cursor
+
+def get_top_tags(limit: int) -> list[dict]:
+    """Get the limit most used tags of recent posts, from the periodically refreshed ranking"""
+    return [{'tag': tag, 'posts': posts} for tag, posts in top_tags.get(limit)]
@@ -1,40 +1,101 @@
-from sqlalchemy import select
-from models.models import User
-from schemas.user_schemas import UserRegister, UserUpdate
+import json
+from collections.abc import Iterator
+from itertools import islice
+from datetime import datetime, timezone
+from sqlalchemy import select, insert, update, delete, tuple_
+from sqlalchemy.exc import IntegrityError
+from models.models import User, Post, Comment, Like, RefreshToken, Notification, PostMention, Username
+from schemas.user_schemas import UserRegister, UserUpdate, UserPublic
 from uuid import UUID
 from fastapi import HTTPException, status
 from .authentication_service import hash_password
-from .post_service import get_likes_and_comments_count
+from .pagination import after_cursor, next_cursor
+from .post_service import bulk_adjust_post_counters, fill_liked_by_me
+from .attachment_service import delete_post_attachments
+from .comment_service import delete_comment_subtree
+from .tag_service import get_mention_posts_page
+from tags import unindex_posts
 from dependencies import SessionDep
+from database import SessionLocal, ReadSessionLocal
 from settings import logger
+from ids import uuid7
+from jobs import job, enqueue
+from revocations import revoke
+from sharding import PRIMARY_SHARD, SHARDED, merge_shard_results, merge_shards
+from changes import record_change
 
 """
 user_service.py
 
 Handles posts-related logic, including:
-- Creating a user
+- Creating a user, keeping usernames unique across shards (claim_username)
 - Get a user by ID
-- Get a list of users
+- Get a list of users, oldest first
+- Get cursor-paginated posts, comments and likes made by a user, and posts mentioning a user
+  (comments and likes are on the shards of their posts, their pages are merged across shards)
+- Export all posts, comments and likes made by a user as NDJSON
 - Update a user object based on ID
-- Delete a user object based on ID
+- Delete a user object based on ID (deactivate immediately, purge data in the background)
+- Recording creates, updates and deletes of users in the change feed (changes.py)
 
 
 This module integrates with:
-- SQLAlchemy ORM models (User)
+- SQLAlchemy ORM models (User, Post, Comment, Like, RefreshToken)
 """
+def _username_shard() -> dict:
+    """bind_arguments of statements on the usernames table, which is only used on shard 0"""
+    return {'shard_id': PRIMARY_SHARD} if SHARDED else {}
+
+def claim_username(session: SessionDep, username: str, user_id: UUID) -> None:
+    """
+    Reserves username for user_id in the usernames table (see models.Username), in the callers transaction.
+
+    users.username is only unique per shard, the row of the usernames table on shard 0 is unique
+    across shards: of two users claiming the same name at once, one waits for the other and fails.
+    A row whose user no longer has the name (left by a registration or rename whose transaction
+    failed on the shard of the user after shard 0 committed) is taken over.
+    Raises 409 if another user has the name.
+    """
+    holders = session.execute(select(User.id).where(User.username == username)).scalars().all()
+    if any(holder != user_id for holder in holders):
+        logger.warning('Username already taken', extra={'username': username})
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='User already exist')
+    owner_id = session.execute(
+        select(Username.user_id).where(Username.username == username), bind_arguments=_username_shard()
+    ).scalar_one_or_none()
+    try:
+        if owner_id is None:
+            session.execute(insert(Username).values(username=username, user_id=user_id), bind_arguments=_username_shard())
+            return
+        if owner_id == user_id:
+            return
+        taken_over = session.execute(
+            update(Username).where(Username.username == username, Username.user_id == owner_id).values(user_id=user_id),
+            bind_arguments=_username_shard(),
+        ).rowcount
+    except IntegrityError:
+        taken_over = 0 # claimed meanwhile by another user
+    if not taken_over:
+        logger.warning('Username claimed concurrently', extra={'username': username})
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='User already exist')
+
+def release_username(session: SessionDep, username: str, user_id: UUID) -> None:
+    """Removes the reservation of username by user_id, in the callers transaction"""
+    session.execute(
+        delete(Username).where(Username.username == username, Username.user_id == user_id),
+        bind_arguments=_username_shard(),
+    )
+
 def create_user_object(user: UserRegister, session: SessionDep) -> User:
-    """Creates a new user object if the user does not already exist"""
+    """Creates a new user object if the username is not taken on any shard"""
     logger.debug('Creating new user attempt', extra={'username': user.username})
-    statement = select(User).where(User.username == user.username)
-    user_exist = session.execute(statement).first()
-    if user_exist:
-        logger.warning("Attempt to create new user, but user already exist", extra={"username": user.username})
-        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='User already exist')
-    
     user_data = user.model_dump(exclude={'password'})
     user_data['hashed_password'] = hash_password(user.password)
-    db_user = User(**user_data)
+    db_user = User(id=uuid7(), **user_data)
+    claim_username(session, db_user.username, db_user.id)
     session.add(db_user)
+    session.flush()
+    record_change(session, 'user', db_user.id, db_user.id, 'create', UserPublic.model_validate(db_user))
     session.commit()
     session.refresh(db_user)
     logger.info('New user was created', extra={'user_id': db_user.id, 'username': db_user.username})
@@ -43,54 +104,235 @@ def create_user_object(user: UserRegister, session: SessionDep) -> User:
 def read_users_from_db(session: SessionDep, offset: int, limit: int) -> list[User]:
     """Get a paginated list off users"""
     logger.debug("Fetching users from DB", extra={'offset': offset, 'limit': limit})
-    stmt = select(User).offset(offset).limit(limit)
-    users = session.execute(stmt).scalars().all()
+    stmt = select(User).where(User.deleted_at.is_(None)).order_by(User.created_at, User.id)
+    users = merge_shards(session, stmt, lambda user: (user.created_at, user.id), limit, offset, scalars=True)
     logger.info('Users fetched', extra={'count': len(users)})
     return list(users)
 
-def read_user_including_counts(user_id: UUID, session: SessionDep) -> User:
-    """Get a user including likes_count and comments_count based on ID"""
+def read_user_posts_page(user_id: UUID, session: SessionDep, cursor: str | None, limit: int,
+                         viewer_id: UUID | None = None) -> dict:
+    """Get a user including a page of posts (newest first), with liked_by_me filled for viewer_id"""
     user = read_user(user_id, session)
-    for post in user.posts:
-        likes_count, comments_count = get_likes_and_comments_count(post.id, session)
-        post.likes_count = likes_count
-        post.comments_count = comments_count
+    logger.debug('Getting posts page for user', extra={'user_id': user_id, 'cursor': cursor, 'limit': limit})
+    stmt = select(Post).where(Post.owner_id == user_id)
+    criteria = after_cursor(Post.created_at, Post.id, cursor)
+    if criteria is not None:
+        stmt = stmt.where(criteria)
+    stmt = stmt.order_by(Post.created_at.desc(), Post.id.desc()).limit(limit)
+    posts = list(session.execute(stmt).scalars().all())
+    fill_liked_by_me(posts, viewer_id, session)
+    logger.info('Retrieved posts page for user', extra={'user_id': user_id, 'count': len(posts)})
+    return {**_user_fields(user), 'posts': posts, 'next_cursor': next_cursor(posts, limit, 'created_at', 'id')}
 
-    return user
+def read_user_mentions_page(user_id: UUID, session: SessionDep, cursor: str | None, limit: int,
+                            viewer_id: UUID | None = None) -> dict:
+    """Get a user including a page of posts mentioning the user (newest first), with liked_by_me filled for viewer_id"""
+    user = read_user(user_id, session)
+    posts, cursor = get_mention_posts_page(user_id, session, cursor, limit, viewer_id)
+    return {**_user_fields(user), 'posts': posts, 'next_cursor': cursor}
+
+def read_user_comments_page(user_id: UUID, session: SessionDep, cursor: str | None, limit: int) -> dict:
+    """Get a user including a page of comments made (newest first)"""
+    user = read_user(user_id, session)
+    logger.debug('Getting comments page for user', extra={'user_id': user_id, 'cursor': cursor, 'limit': limit})
+    stmt = select(Comment).where(Comment.owner_id == user_id)
+    criteria = after_cursor(Comment.created_at, Comment.id, cursor)
+    if criteria is not None:
+        stmt = stmt.where(criteria)
+    stmt = stmt.order_by(Comment.created_at.desc(), Comment.id.desc())
+    comments = merge_shards(session, stmt, lambda comment: (comment.created_at, comment.id), limit, descending=True, scalars=True)
+    logger.info('Retrieved comments page for user', extra={'user_id': user_id, 'count': len(comments)})
+    return {**_user_fields(user), 'comments': comments, 'next_cursor': next_cursor(comments, limit, 'created_at', 'id')}
+
+def read_user_likes_page(user_id: UUID, session: SessionDep, cursor: str | None, limit: int) -> dict:
+    """Get a user including a page of liked posts (most recently liked first)"""
+    user = read_user(user_id, session)
+    logger.debug('Getting likes page for user', extra={'user_id': user_id, 'cursor': cursor, 'limit': limit})
+    stmt = select(Like).where(Like.user_id == user_id)
+    criteria = after_cursor(Like.liked_at, Like.post_id, cursor)
+    if criteria is not None:
+        stmt = stmt.where(criteria)
+    stmt = stmt.order_by(Like.liked_at.desc(), Like.post_id.desc())
+    likes = merge_shards(session, stmt, lambda like: (like.liked_at, like.post_id), limit, descending=True, scalars=True)
+    logger.info('Retrieved likes page for user', extra={'user_id': user_id, 'count': len(likes)})
+    return {**_user_fields(user), 'likes': likes, 'next_cursor': next_cursor(likes, limit, 'liked_at', 'post_id')}
+
+EXPORT_BATCH_SIZE = 500
+
+def export_user_data(user_id: UUID) -> Iterator[str]:
+    """
+    Generates a NDJSON export of a user, including all posts, comments and likes made.
+
+    Rows are streamed from the database with a server-side cursor (yield_per), merged across
+    shards, and yielded one batch at a time, so memory stays constant regardless of account size.
+    Uses its own session, as the export outlives the request handler.
+    Closing the generator (e.g. on client disconnect) closes the cursor and session.
+    """
+    logger.debug('Exporting user data', extra={'user_id': user_id})
+    exports = [
+        ('post', select(Post.id, Post.title, Post.content, Post.created_at, Post.updated_at)
+            .where(Post.owner_id == user_id).order_by(Post.created_at, Post.id), lambda row: (row.created_at, row.id)),
+        ('comment', select(Comment.id, Comment.post_id, Comment.content, Comment.created_at, Comment.last_edited)
+            .where(Comment.owner_id == user_id).order_by(Comment.created_at, Comment.id), lambda row: (row.created_at, row.id)),
+        ('like', select(Like.post_id, Like.liked_at)
+            .where(Like.user_id == user_id).order_by(Like.liked_at, Like.post_id), lambda row: (row.liked_at, row.post_id)),
+    ]
+    rows_exported = 0
+    with ReadSessionLocal() as session:
+        user = session.get(User, user_id)
+        if not user:
+            logger.warning("User was not found", extra={'user_id': user_id})
+            return
+        yield _ndjson_line('user', _user_fields(user))
+        for row_type, stmt, key in exports:
+            rows = merge_shard_results(session, stmt, key, yield_per=EXPORT_BATCH_SIZE)
+            while partition := list(islice(rows, EXPORT_BATCH_SIZE)):
+                rows_exported += len(partition)
+                yield ''.join(_ndjson_line(row_type, row._mapping) for row in partition)
+    logger.info('Exported user data', extra={'user_id': user_id, 'rows': rows_exported})
+
+def _ndjson_line(row_type: str, row) -> str:
+    """Serializes a single export row as a NDJSON line"""
+    return json.dumps({'type': row_type, **row}, default=str) + '\n'
+
+def _user_fields(user: User) -> dict:
+    """Column values of a user, without touching the (unbounded) relationship collections"""
+    return {
+        'id': user.id,
+        'username': user.username,
+        'full_name': user.full_name,
+        'is_active': user.is_active,
+        'created_at': user.created_at,
+    }
 
 def read_user(user_id: UUID, session: SessionDep) -> User:
     """Get a user based on ID"""
     logger.debug("Reading user from DB", extra={'user_id': user_id})
     user = session.get(User, user_id)
-    if not user:
+    if not user or user.deleted_at is not None:
         logger.warning("User was not found", extra={'user_id': user_id})
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='User not found')
     logger.info("User retrieved", extra={'user_id': user_id})
     return user
 
 def delete_user(user_id: UUID, session: SessionDep) -> None:
-    """Delete a user based on ID"""
+    """
+    Delete a user based on ID.
+
+    The user is deactivated and its refresh-tokens and access tokens revoked immediately. Posts, comments, likes
+    and tokens are removed afterwards by purge_user, run as a background job enqueued in the
+    same transaction.
+    """
     logger.debug('Deleting user request', extra={'user_id': user_id})
     user = session.get(User, user_id)
-    if not user:
+    if not user or user.deleted_at is not None:
         logger.warning("User was not found", extra={'user_id': user_id})
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='User not found')
-    session.delete(user)
+    user.is_active = False
+    user.deleted_at = datetime.now(timezone.utc)
+    session.execute(update(RefreshToken).where(RefreshToken.user_id == user_id).values(revoked=True))
+    revoke(session, user_id)
+    enqueue(session, 'purge_user', {'user_id': str(user_id)})
+    record_change(session, 'user', user_id, user_id, 'delete')
     session.commit()
-    logger.info('User deleted', extra={'user_id': user_id})
+    logger.info('User marked as deleted', extra={'user_id': user_id})
+
+PURGE_CHUNK_SIZE = 500
+
+def purge_user(user_id: UUID) -> None:
+    """
+    Removes all data of a user marked as deleted, then the user itself.
+
+    Rows are removed with bulk DELETE ... WHERE statements in chunks of PURGE_CHUNK_SIZE,
+    each chunk in its own short transaction, so no long-running locks are held and nothing is
+    loaded into the ORM. likes_count/comments_count of other users' posts and reply_count of
+    other users' comments are adjusted.
+    Safe to re-run if interrupted.
+    """
+    logger.debug('Purging user', extra={'user_id': user_id})
+    with SessionLocal() as session:
+        user = session.get(User, user_id)
+        if not user or user.deleted_at is None:
+            logger.warning('User to purge was not found or not deleted', extra={'user_id': user_id})
+            return
+
+        # likes made by the user
+        while post_ids := session.execute(
+            select(Like.post_id).where(Like.user_id == user_id).limit(PURGE_CHUNK_SIZE)
+        ).scalars().all():
+            session.execute(delete(Like).where(Like.user_id == user_id, Like.post_id.in_(post_ids)))
+            bulk_adjust_post_counters(session, likes={post_id: -1 for post_id in post_ids})
+            session.commit()
+
+        # comments made by the user, including the replies to them
+        # (shallowest first, so nested comments of the user are mostly removed with their ancestor)
+        while comments := session.execute(
+            select(Comment.id, Comment.post_id, Comment.parent_id, Comment.owner_id, Comment.path)
+            .where(Comment.owner_id == user_id).order_by(Comment.depth).limit(PURGE_CHUNK_SIZE)
+        ).all():
+            for comment in comments:
+                delete_comment_subtree(comment, session)
+            session.commit()
+
+        # notifications of the user, and the user as latest actor in notifications of others
+        while notification_ids := session.execute(
+            select(Notification.id).where(Notification.recipient_id == user_id).limit(PURGE_CHUNK_SIZE)
+        ).scalars().all():
+            session.execute(delete(Notification).where(Notification.id.in_(notification_ids)))
+            session.commit()
+        session.execute(update(Notification).where(Notification.actor_id == user_id).values(actor_id=None))
+        session.execute(delete(PostMention).where(PostMention.user_id == user_id))
+        session.commit()
+
+        # posts made by the user, including likes and comments made by others on them
+        while post_ids := session.execute(
+            select(Post.id).where(Post.owner_id == user_id).limit(PURGE_CHUNK_SIZE)
+        ).scalars().all():
+            while like_keys := session.execute(
+                select(Like.user_id, Like.post_id).where(Like.post_id.in_(post_ids)).limit(PURGE_CHUNK_SIZE)
+            ).all():
+                session.execute(delete(Like).where(tuple_(Like.user_id, Like.post_id).in_(like_keys)))
+                session.commit()
+            # deepest first, replies reference their parent comment
+            while comment_ids := session.execute(
+                select(Comment.id).where(Comment.post_id.in_(post_ids)).order_by(Comment.depth.desc()).limit(PURGE_CHUNK_SIZE)
+            ).scalars().all():
+                session.execute(delete(Comment).where(Comment.id.in_(comment_ids)))
+                session.commit()
+            session.execute(delete(Notification).where(Notification.post_id.in_(post_ids)))
+            delete_post_attachments(post_ids, session)
+            unindex_posts(session, post_ids)
+            session.execute(delete(Post).where(Post.id.in_(post_ids)))
+            session.commit()
+
+        session.execute(delete(RefreshToken).where(RefreshToken.user_id == user_id))
+        release_username(session, user.username, user_id)
+        session.execute(delete(User).where(User.id == user_id))
+        session.commit()
+    logger.info('User purged', extra={'user_id': user_id})
+
+@job('purge_user', max_attempts=10)
+def purge_user_job(user_id: str) -> None:
+    """Background job running purge_user"""
+    purge_user(UUID(user_id))
 
 def update_user(user_id: UUID, user: UserUpdate, session: SessionDep) -> User:
     """Update existing user based on ID"""
     logger.debug('Updating user request', extra={'user_id': user_id, 'fields': list(user.model_dump().keys()), 'values': list(user.model_dump().values())})
     db_user = session.get(User, user_id)
-    if not db_user:
+    if not db_user or db_user.deleted_at is not None:
         logger.warning("User was not found", extra={'user_id': user_id})
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='User not found')
     updated_data = user.model_dump(exclude_unset=True)
+    username = updated_data.get('username')
+    if username is not None and username != db_user.username:
+        claim_username(session, username, user_id)
+        release_username(session, db_user.username, user_id)
     for field, value in updated_data.items():
         setattr(db_user, field, value)
     
     session.add(db_user)
+    record_change(session, 'user', user_id, user_id, 'update', UserPublic.model_validate(db_user))
     session.commit()
     session.refresh(db_user)
     logger.info('User updated', extra={'user_id': user_id})
@@ -20,6 +20,44 @@ Attributes:
     access_token_expire_minutes (int): Number of minutes before access tokens expire.
     refresh_token_expire_days (int): Number of days before refresh tokens expire.
     database_url (str): Database connection string (e.g. SQLite, PostgreSQL).
+    host (str): Interface the production server (server.py) binds to.
+    port (int): Port the production server binds to.
+    web_concurrency (int): Number of worker processes. 0 means one per CPU core.
+    graceful_timeout (int): Seconds in-flight requests get to finish on SIGTERM before workers are killed.
+    keepalive (int): Seconds to keep idle HTTP keep-alive connections open.
+    max_requests (int): Restart a worker after this many requests (with jitter). 0 disables.
+    admin_token (str): Token for the /admin/* endpoints, sent in the X-Admin-Token header. Empty disables them.
+    slow_query_ms (int): Statements running longer than this many milliseconds are logged. 0 disables.
+    slow_query_explain (bool): Capture the query plan of a slow statement the first time it is logged.
+    stateless_auth (bool): Authenticate requests from the claims of the access token, checked against the
+        in-memory revocation list (revocations.py), instead of loading the user from the database.
+    revocation_refresh_seconds (float): Interval for reloading the revocation list in stateless_auth mode.
+    sqlite_profile (bool): Use WAL mode, a single writer connection and a read-only pool for SQLite file databases (see database.py).
+    sqlite_busy_timeout_ms (int): Milliseconds a SQLite connection waits for the write lock before failing.
+    sqlite_mmap_size_mb (int): Size of the memory-mapped part of the SQLite database file, per connection.
+    sqlite_cache_size_mb (int): SQLite page cache size, per connection.
+    sqlite_read_pool_size (int): Number of read-only SQLite connections kept open per process.
+    bulk_rate_limit (str): Items per client the bulk write endpoints accept, e.g. '1000/minute' (see rate_limit.py).
+    storage_backend (str): Where uploaded files are stored, 'local' or 's3' (see storage.py).
+    storage_path (str): Directory of the 'local' storage backend.
+    s3_bucket (str): Bucket of the 's3' storage backend.
+    s3_endpoint_url (str): Endpoint of an S3-compatible store, empty for AWS S3.
+    s3_region (str): Region of the bucket, empty for the boto3 default.
+    s3_access_key_id (str): Access key of the 's3' backend, empty for the boto3 default credentials.
+    s3_secret_access_key (str): Secret key of the 's3' backend.
+    max_upload_mb (int): Maximum size of an uploaded attachment.
+    thumbnail_max_side (int): Maximum width and height of attachment thumbnails in pixels.
+    thumbnail_processes (int): Number of processes rendering thumbnails, per server process (see thumbnails.py).
+    shard_urls (list[str]): Database URLs of shards 1..N-1 (JSON list), database_url is shard 0. Empty disables sharding (see sharding.py).
+    shard_map_refresh_seconds (float): Interval for reloading the assignment of buckets to shards.
+    changes_retention_hours (float): Age after which change feed entries are deleted, older cursors get 410 (see changes.py).
+    changes_compact_after_minutes (float): Age after which change feed entries superseded by a newer change of the same entity are deleted.
+    top_tags_window_hours (float): Age of the posts counted for GET /tags/top (see tags.py).
+    top_tags_refresh_seconds (float): Interval for recounting the top tags, per server process.
+    views_flush_seconds (float): Interval for persisting the viewers of posts counted by a server process (see views.py).
+    trace_sample_rate (float): Share of requests whose trace is written to trace_file (see tracing.py).
+    trace_slow_ms (int): Requests running longer than this many milliseconds have their trace written. 0 disables.
+    trace_file (str): File the traces are appended to, in OTLP/JSON lines.
 """
 class Settings(BaseSettings):
     app_name: str = "defaultappname"
@@ -28,6 +66,43 @@ class Settings(BaseSettings):
     access_token_expire_minutes: int = 15
     refresh_token_expire_days: int = 7
     database_url: str = "sqlite:///database.db"
+    host: str = "0.0.0.0"
+    port: int = 8000
+    web_concurrency: int = 0
+    graceful_timeout: int = 30
+    keepalive: int = 5
+    max_requests: int = 0
+    admin_token: str = ""
+    slow_query_ms: int = 200
+    slow_query_explain: bool = False
+    stateless_auth: bool = False
+    revocation_refresh_seconds: float = 5
+    sqlite_profile: bool = False
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_mmap_size_mb: int = 256
+    sqlite_cache_size_mb: int = 32
+    sqlite_read_pool_size: int = 8
+    bulk_rate_limit: str = "1000/minute"
+    storage_backend: str = "local"
+    storage_path: str = "media"
+    s3_bucket: str = ""
+    s3_endpoint_url: str = ""
+    s3_region: str = ""
+    s3_access_key_id: str = ""
+    s3_secret_access_key: str = ""
+    max_upload_mb: int = 10
+    thumbnail_max_side: int = 320
+    thumbnail_processes: int = 1
+    shard_urls: list[str] = []
+    shard_map_refresh_seconds: float = 5
+    changes_retention_hours: float = 168
+    changes_compact_after_minutes: float = 60
+    top_tags_window_hours: float = 24
+    top_tags_refresh_seconds: float = 60
+    views_flush_seconds: float = 30
+    trace_sample_rate: float = 0
+    trace_slow_ms: int = 1000
+    trace_file: str = "logs/traces.jsonl"
     model_config = SettingsConfigDict(env_file="../.env", extra='ignore')
 
 @lru_cache
@@ -44,6 +119,7 @@ def setup_logging():
     config_file = pathlib.Path("logging_config.json")
     with open(config_file) as f_in:
         config = json.load(f_in)
+    pathlib.Path("logs").mkdir(exist_ok=True)
     logging.config.dictConfig(config)
 
 logger = logging.getLogger('app')
\ No newline at end of file
@@ -0,0 +1,393 @@
+import asyncio
+import hashlib
+import heapq
+import time
+from collections.abc import Callable, Iterable, Iterator
+from itertools import islice
+from uuid import UUID
+from sqlalchemy import Engine, inspect, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import ORMExecuteState, Session, object_session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter, BooleanClauseList, ColumnClause
+from settings import get_settings, logger
+from ids import time_ordered_uuid, uuid7
+
+"""
+sharding.py
+
+Optional horizontal sharding of the user-owned tables across several databases.
+
+database_url is shard 0, the shard_urls setting lists the URLs of shards 1..N-1. Without
+shard_urls nothing is sharded and none of this applies (SHARDED is False).
+
+Placement:
+    Every user hashes into one of SHARD_BUCKETS buckets (user_bucket), every bucket is assigned
+    to one shard. The assignment is kept in the shard_buckets table of shard 0 (ShardMap), so
+    adding a shard moves nothing until rebalance.py moves buckets onto it.
+    - users and refresh_tokens live in the bucket of the user
+    - posts live in the bucket of their owner
+    - comments, likes, attachments, notifications, post_tags and post_mentions live in the bucket
+      of the post they belong to, so a like or comment and the counters of its post are written in one transaction on
+      one database, and a thread or the likes of a post are read from one shard
+    - jobs and revocations are not bucketed, they are written to the shard of the transaction
+      that enqueues them (home_shard) and read from all shards
+
+Routing:
+    Rows created while sharded get UUIDv8 ids carrying the bucket in their 12 lowest bits
+    (new_id, time-ordered like the UUIDv7 ids of ids.py), so a post, comment, attachment or refresh token is found from its id alone.
+    Sessions (database.ShardSession) route with the choosers below:
+    - inserts by the user or post of the row
+    - statements by an equality or IN criterion of the WHERE clause on a routing column
+      (a user id column, or a row id carrying a bucket), all shards otherwise
+    - Session.get by the primary key
+    Results of a statement run on several shards are concatenated. Ordered pages are merged
+    with merge_shards (a k-way merge of the per shard pages). Sharded sessions do not support
+    the ORM bulk INSERT/UPDATE (a list of parameter dicts), bulk writes are Core statements on
+    the table, grouped with split_by_shard and run with the shard_id of each group. Ids
+    created before sharding was enabled carry no bucket, statements on them run on every shard.
+
+Cross-shard transactions:
+    A transaction writing to several shards (e.g. a job enqueued on the home shard next to a
+    bulk like of posts on two shards) commits shard by shard, there is no two-phase commit.
+    users.username is unique per shard only, usernames are claimed in the usernames table of shard 0
+    (services.user_service.claim_username) in the transaction registering or renaming the user.
+
+Moving buckets:
+    rebalance.py marks buckets 'moving', waits until every process has seen it, copies their
+    rows, assigns the buckets to the new shard and deletes the old copies. Writes to a moving
+    bucket raise BucketMoving (503, retried by clients and jobs), reads still go to the old
+    shard. The map is reloaded every shard_map_refresh_seconds.
+
+Usage:
+    await shard_map.start(engine, read_engine) / await shard_map.stop() from the FastAPI lifespan.
+    merge_shards(session, stmt, key, limit, offset)   # stmt ordered by key
+    for shard_id, rows in split_by_shard(rows, owner_of).items():
+        session.execute(insert(Model.__table__), rows, bind_arguments={'shard_id': shard_id})
+"""
+
+settings = get_settings()
+
+SHARD_BUCKETS = 4096
+BUCKET_MASK = SHARD_BUCKETS - 1
+PRIMARY_SHARD = 0
+SHARDS = 1 + len(settings.shard_urls)
+SHARDED = SHARDS > 1
+
+# routing columns of the bucketed tables: (columns holding a user id, columns holding a row id of the same bucket)
+ROUTES: dict[str, tuple[frozenset[str], frozenset[str]]] = {
+    'users': (frozenset({'id'}), frozenset()),
+    'refresh_tokens': (frozenset({'user_id'}), frozenset({'id'})),
+    'posts': (frozenset({'owner_id'}), frozenset({'id'})),
+    'comments': (frozenset(), frozenset({'id', 'post_id', 'parent_id'})),
+    'likes': (frozenset(), frozenset({'post_id'})),
+    'attachments': (frozenset(), frozenset({'id', 'post_id'})),
+    'notifications': (frozenset({'recipient_id'}), frozenset({'id', 'post_id'})),
+    'post_tags': (frozenset(), frozenset({'post_id'})),
+    'post_mentions': (frozenset(), frozenset({'post_id'})),
+}
+# tables placed in the bucket of their post, found through the owner of the loaded post for posts without a bucket in the id
+POST_CHILD_TABLES = frozenset({'comments', 'likes', 'attachments', 'post_tags', 'post_mentions'})
+
+class BucketMoving(Exception):
+    """A write to a bucket that rebalance.py is moving to another shard, it can be retried shortly"""
+    def __init__(self, bucket: int) -> None:
+        super().__init__(f'bucket {bucket} is moving to another shard')
+        self.bucket = bucket
+
+class ShardRoutingError(Exception):
+    """A write whose shard cannot be determined, or a bulk write spanning shards"""
+
+def user_bucket(user_id: UUID) -> int:
+    """Bucket of a user, a hash of the user id"""
+    return int.from_bytes(hashlib.blake2b(user_id.bytes, digest_size=8).digest(), 'big') & BUCKET_MASK
+
+def id_bucket(row_id: UUID) -> int | None:
+    """Bucket carried by a row id made by new_id, None for other ids"""
+    return row_id.int & BUCKET_MASK if row_id.version == 8 else None
+
+def _bucket_id(bucket: int) -> UUID:
+    """Time-ordered UUIDv8 with the bucket in its lowest bits"""
+    return time_ordered_uuid(8, bucket, BUCKET_MASK.bit_length())
+
+def new_id(user_id: UUID) -> UUID:
+    """Id of a new row in the bucket of user_id (the owner of the row, or of its post), a plain UUIDv7 without sharding"""
+    return _bucket_id(user_bucket(user_id)) if SHARDED else uuid7()
+
+class ShardMap:
+    """Assignment of buckets to shards, loaded from the shard_buckets table of shard 0"""
+    def __init__(self, shards: int, refresh_seconds: float) -> None:
+        self.shards = shards
+        self.refresh_seconds = refresh_seconds
+        self._shard_of = [bucket % shards for bucket in range(SHARD_BUCKETS)]
+        self._moving: frozenset[int] = frozenset()
+        self._read_engine: Engine | None = None
+        self._task: asyncio.Task | None = None
+
+    def shard(self, bucket: int) -> int:
+        return self._shard_of[bucket]
+
+    def shard_of_user(self, user_id: UUID) -> int:
+        return self._shard_of[user_bucket(user_id)]
+
+    def check_writable(self, bucket: int) -> None:
+        if bucket in self._moving:
+            raise BucketMoving(bucket)
+
+    def seed(self, engine: Engine) -> None:
+        """
+        Records an assignment if the table is empty, so adding a shard later moves nothing: all buckets
+        on shard 0 if it already has users (sharding enabled on an existing database, rebalance.py
+        spreads them), bucket modulo shards otherwise.
+        """
+        with engine.connect() as connection:
+            if connection.execute(text('SELECT 1 FROM shard_buckets LIMIT 1')).first():
+                return
+            existing = connection.execute(text('SELECT 1 FROM users LIMIT 1')).first() is not None
+        try:
+            with engine.begin() as connection:
+                connection.execute(
+                    text('INSERT INTO shard_buckets (bucket, shard, moving) VALUES (:bucket, :shard, false)'),
+                    [{'bucket': bucket, 'shard': PRIMARY_SHARD if existing else bucket % self.shards}
+                     for bucket in range(SHARD_BUCKETS)],
+                )
+            logger.info('Shard map seeded', extra={'shards': self.shards, 'buckets': SHARD_BUCKETS, 'existing': existing})
+        except IntegrityError:
+            pass # seeded by another worker process
+
+    def refresh(self, engine: Engine) -> None:
+        """Reloads the assignment"""
+        with engine.connect() as connection:
+            rows = connection.execute(text('SELECT bucket, shard, moving FROM shard_buckets')).all()
+        shard_of = [bucket % self.shards for bucket in range(SHARD_BUCKETS)]
+        moving = set()
+        for bucket, shard, is_moving in rows:
+            if shard >= self.shards:
+                raise RuntimeError(f'bucket {bucket} is assigned to shard {shard}, only {self.shards} shards are configured')
+            shard_of[bucket] = shard
+            if is_moving:
+                moving.add(bucket)
+        self._shard_of, self._moving = shard_of, frozenset(moving)
+        logger.debug('Shard map refreshed', extra={'moving': len(moving)})
+
+    async def start(self, engine: Engine, read_engine: Engine) -> None:
+        """Loads the assignment (engines of shard 0) and starts reloading it periodically, nothing to do without sharding"""
+        if self.shards == 1 or self._task is not None:
+            return
+        self._read_engine = read_engine
+        await asyncio.to_thread(self.seed, engine)
+        await asyncio.to_thread(self.refresh, read_engine)
+        self._task = asyncio.create_task(self._run())
+        logger.info('Shard map started', extra={'shards': self.shards, 'refresh_seconds': self.refresh_seconds})
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        self._task = None
+        logger.info('Shard map stopped')
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                await asyncio.to_thread(self.refresh, self._read_engine)
+            except Exception:
+                logger.exception('Refreshing the shard map failed')
+
+shard_map = ShardMap(SHARDS, settings.shard_map_refresh_seconds)
+
+def _table(mapper) -> str | None:
+    return mapper.local_table.name if mapper is not None else None
+
+def _bucket(table: str, column: str, value) -> int | None:
+    """Bucket of the rows of table whose column is value, None if the column does not route"""
+    if not isinstance(value, UUID):
+        return None
+    user_columns, id_columns = ROUTES[table]
+    if column in user_columns:
+        return user_bucket(value)
+    if column in id_columns:
+        return id_bucket(value)
+    return None
+
+def _row_bucket(table: str, values: Callable[[str], object]) -> int | None:
+    """Bucket of a row of table from its column values (values(column) returns None for unknown columns)"""
+    user_columns, id_columns = ROUTES[table]
+    for column in (*user_columns, *id_columns):
+        bucket = _bucket(table, column, values(column))
+        if bucket is not None:
+            return bucket
+    return None
+
+def _conjuncts(clause) -> Iterator:
+    if isinstance(clause, BooleanClauseList) and clause.operator is operators.and_:
+        for inner in clause.clauses:
+            yield from _conjuncts(inner)
+    elif clause is not None:
+        yield clause
+
+def _criteria_buckets(statement, parameters) -> set[int] | None:
+    """Buckets of the rows an equality or IN criterion of the WHERE clause restricts statement to, None if there is none"""
+    for criterion in _conjuncts(getattr(statement, 'whereclause', None)):
+        if not (isinstance(criterion, BinaryExpression) and criterion.operator in (operators.eq, operators.in_op)
+                and isinstance(criterion.left, ColumnClause) and isinstance(criterion.right, BindParameter)):
+            continue
+        table = getattr(criterion.left.table, 'name', None)
+        if table not in ROUTES:
+            continue
+        value = criterion.right.effective_value
+        if value is None and isinstance(parameters, dict):
+            value = parameters.get(criterion.right.key)
+        values = value if criterion.operator is operators.in_op else [value]
+        buckets = {_bucket(table, criterion.left.name, item) for item in values or ()}
+        if buckets and None not in buckets:
+            return buckets
+    return None
+
+def _shards_of(buckets: Iterable[int], write: bool) -> list[int]:
+    shards = set()
+    for bucket in buckets:
+        if write:
+            shard_map.check_writable(bucket)
+        shards.add(shard_map.shard(bucket))
+    return sorted(shards)
+
+def _loaded_post_owner(session: Session, post_id) -> UUID | None:
+    """Owner of a post loaded in session, the post of a new comment, like or attachment is loaded before"""
+    for key, obj in session.identity_map.items():
+        if key[0].__table__.name == 'posts' and key[1] == (post_id,):
+            return obj.owner_id
+    return None
+
+def _instance_bucket(table: str, instance, session: Session | None) -> int | None:
+    bucket = _row_bucket(table, lambda column: getattr(instance, column, None))
+    if bucket is None and table in POST_CHILD_TABLES and session is not None:
+        owner_id = _loaded_post_owner(session, instance.post_id)
+        bucket = user_bucket(owner_id) if owner_id is not None else None
+    return bucket
+
+def home_shard(session: Session) -> int:
+    """Shard a transaction writes its bucketed rows to, where its jobs and revocations are written as well"""
+    if 'home_shard' in session.info:
+        return session.info['home_shard']
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        table = instance.__table__.name
+        if table in ROUTES:
+            state = inspect(instance)
+            token = state.key[2] if state.key else state.identity_token
+            if token is not None:
+                return token
+            bucket = _instance_bucket(table, instance, session)
+            if bucket is not None:
+                return shard_map.shard(bucket)
+    return PRIMARY_SHARD
+
+def shard_chooser(mapper, instance, clause=None, **kw) -> int:
+    """Shard of a new row (instance), assigns the id of new rows of bucketed tables"""
+    table = _table(mapper)
+    if instance is None:
+        return PRIMARY_SHARD # statements without a mapped entity
+    session = object_session(instance)
+    if table not in ROUTES:
+        return home_shard(session) if session is not None else PRIMARY_SHARD
+    if table == 'users' and instance.id is None:
+        set_committed_value(instance, 'id', uuid7())
+    bucket = _instance_bucket(table, instance, session)
+    if bucket is None:
+        raise ShardRoutingError(f'no shard for a new row of {table}')
+    shard_map.check_writable(bucket)
+    if 'id' in ROUTES[table][1] and getattr(instance, 'id', None) is None:
+        set_committed_value(instance, 'id', _bucket_id(bucket))
+    shard_id = shard_map.shard(bucket)
+    if session is not None:
+        session.info.setdefault('home_shard', shard_id)
+    return shard_id
+
+def identity_chooser(mapper, primary_key, *, lazy_loaded_from, **kw) -> list[int]:
+    """Shards a row with this primary key can be in"""
+    table = _table(mapper)
+    if table in ROUTES:
+        for column, value in zip(mapper.primary_key, primary_key):
+            bucket = _bucket(table, column.name, value)
+            if bucket is not None:
+                return [shard_map.shard(bucket)]
+    return list(range(SHARDS))
+
+def execute_chooser(context: ORMExecuteState) -> list[int]:
+    """Shards an ORM statement without a shard_id runs on"""
+    table = _table(context.bind_mapper)
+    if table is None:
+        return [PRIMARY_SHARD]
+    if table not in ROUTES:
+        return list(range(SHARDS))
+    write = context.is_insert or context.is_update or context.is_delete
+    parameters = context.parameters
+    if isinstance(parameters, list) or context.is_insert:
+        # bulk INSERT, or UPDATE by primary key, the rows have to be on one shard
+        rows = parameters if isinstance(parameters, list) else [parameters or {}]
+        buckets = {_row_bucket(table, row.get) for row in rows}
+        if None in buckets:
+            raise ShardRoutingError(f'no shard for a row written to {table}, pass the shard_id')
+        shards = _shards_of(buckets, write)
+        if len(shards) > 1:
+            raise ShardRoutingError(f'rows written to {table} are on several shards, split them with split_by_shard')
+    else:
+        buckets = _criteria_buckets(context.statement, parameters)
+        if buckets is not None:
+            shards = _shards_of(buckets, write)
+        elif context.is_select and context.lazy_loaded_from is not None and table != 'users':
+            # relationships between bucketed rows (e.g. Post.likes) stay in the bucket of the parent
+            shards = [context.lazy_loaded_from.identity_token]
+        else:
+            shards = list(range(SHARDS))
+    if write and len(shards) == 1:
+        context.session.info.setdefault('home_shard', shards[0])
+    return shards
+
+def shard_ids() -> list[int | None]:
+    """shard_id of each shard to pass as bind argument, [None] (no shard) without sharding"""
+    return list(range(SHARDS)) if SHARDED else [None]
+
+def split_by_shard(items: Iterable, owner_of: Callable[[object], UUID]) -> dict[int | None, list]:
+    """Groups items by the shard of their owner (owner_of returns a user id), {None: items} without sharding"""
+    groups: dict[int | None, list] = {}
+    for item in items:
+        groups.setdefault(shard_map.shard_of_user(owner_of(item)) if SHARDED else None, []).append(item)
+    return groups
+
+def merge_shard_results(session: Session, stmt, key: Callable, descending: bool = False, scalars: bool = False,
+                        yield_per: int | None = None) -> Iterator:
+    """
+    Runs stmt, ordered by key, on every shard and merges the results lazily into one ordered stream
+    (k-way merge). The shards are queried one after the other.
+    """
+    if yield_per is not None:
+        stmt = stmt.execution_options(yield_per=yield_per)
+    results = []
+    for shard_id in shard_ids():
+        result = session.execute(stmt, bind_arguments={'shard_id': shard_id})
+        results.append(result.scalars() if scalars else result)
+    if len(results) == 1:
+        return iter(results[0])
+    return heapq.merge(*results, key=key, reverse=descending)
+
+def merge_shards(session: Session, stmt, key: Callable, limit: int, offset: int = 0, descending: bool = False,
+                 scalars: bool = False) -> list:
+    """
+    A page (offset, limit) of stmt, ordered by key, over all shards: every shard returns its first
+    offset + limit rows, the page is taken from their k-way merge.
+    """
+    if not SHARDED:
+        result = session.execute(stmt.offset(offset).limit(limit))
+        return list(result.scalars() if scalars else result)
+    started = time.perf_counter()
+    pages = []
+    for shard_id in shard_ids():
+        result = session.execute(stmt.limit(offset + limit), bind_arguments={'shard_id': shard_id})
+        pages.append((result.scalars() if scalars else result).all())
+    page = list(islice(heapq.merge(*pages, key=key, reverse=descending), offset, offset + limit))
+    logger.debug('Merged shard pages', extra={'shards': len(pages), 'rows': sum(map(len, pages)),
+                                              'duration_ms': round((time.perf_counter() - started) * 1000, 1)})
+    return page
@@ -0,0 +1,327 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+from collections.abc import AsyncIterator, Iterator
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import IO, NamedTuple, Protocol
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+from settings import get_settings, logger
+
+"""
+storage.py
+
+Object storage for uploaded files (post attachments), on local disk or in an S3-compatible store.
+
+Backends (storage_backend setting):
+    - 'local': files below storage_path. An object is written to a temporary file next to its
+      final path, fsynced and renamed into place on commit, so readers never see partial files.
+    - 's3': objects in s3_bucket, optionally on another endpoint (s3_endpoint_url, e.g. MinIO).
+      Objects larger than S3_PART_SIZE are written as multipart upload, part by part.
+      Requires boto3 (pip install boto3), imported only when the backend is used.
+
+Uploads are streamed (save_stream): the chunks of the request body are hashed and written as
+they arrive, in a thread so the event loop is not blocked by the disk or network. At most one
+chunk (local) or one S3 part is held in memory per upload, whatever the size of the file.
+
+Downloads are streamed too (object_response), with support for:
+    - conditional requests: If-None-Match against the ETag (the SHA-256 of the content) and
+      If-Modified-Since, answered with 304 without reading the object
+    - single byte ranges (Range, honoured only if If-Range matches), answered with 206, or
+      416 if the range starts beyond the end of the object
+Objects are immutable (a new upload gets a new key), so responses may be cached indefinitely.
+"""
+
+STORAGE_CHUNK_SIZE = 64 * 1024
+S3_PART_SIZE = 8 * 1024 * 1024 # S3 requires parts of at least 5 MiB, except the last one
+SNIFF_BYTES = 32
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+class StoredObject(NamedTuple):
+    """An object written by save_stream"""
+    key: str
+    size: int
+    etag: str # SHA-256 hex digest of the content
+    head: bytes # first SNIFF_BYTES bytes, to detect the file type
+
+class UploadTooLarge(Exception):
+    """The stream is larger than the allowed size, nothing was stored"""
+
+class RangeNotSatisfiable(Exception):
+    """The requested byte range starts beyond the end of the object"""
+
+class ObjectWriter(Protocol):
+    def write(self, chunk: bytes) -> None: ...
+    def commit(self) -> None: ...
+    def abort(self) -> None: ...
+
+class Storage(Protocol):
+    def writer(self, key: str) -> ObjectWriter: ...
+    def put(self, key: str, data: bytes) -> None: ...
+    def read(self, key: str, start: int = 0, end: int | None = None) -> Iterator[bytes]: ...
+    def open(self, key: str) -> IO[bytes]: ...
+    def delete(self, key: str) -> None: ...
+
+class LocalWriter:
+    """Writes an object to a temporary file, renamed to its final path on commit"""
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, self._tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.upload-')
+        self._file = os.fdopen(fd, 'wb')
+        self._path = path
+
+    def write(self, chunk: bytes) -> None:
+        self._file.write(chunk)
+
+    def commit(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._tmp_path, self._path)
+
+    def abort(self) -> None:
+        self._file.close()
+        Path(self._tmp_path).unlink(missing_ok=True)
+
+class LocalStorage:
+    """Objects as files below root, the key is the relative path"""
+    def __init__(self, root: str) -> None:
+        self.root = Path(root)
+
+    def _path(self, key: str) -> Path:
+        return self.root / key
+
+    def writer(self, key: str) -> LocalWriter:
+        return LocalWriter(self._path(key))
+
+    def put(self, key: str, data: bytes) -> None:
+        writer = self.writer(key)
+        try:
+            writer.write(data)
+            writer.commit()
+        except BaseException:
+            writer.abort()
+            raise
+
+    def read(self, key: str, start: int = 0, end: int | None = None) -> Iterator[bytes]:
+        """Chunks of the object from start to end (inclusive), the file is opened on the first iteration"""
+        with open(self._path(key), 'rb') as file:
+            file.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                chunk = file.read(STORAGE_CHUNK_SIZE if remaining is None else min(STORAGE_CHUNK_SIZE, remaining))
+                if not chunk:
+                    return
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def open(self, key: str) -> IO[bytes]:
+        return open(self._path(key), 'rb')
+
+    def delete(self, key: str) -> None:
+        self._path(key).unlink(missing_ok=True)
+
+class S3Writer:
+    """Buffers an object up to S3_PART_SIZE, larger objects are uploaded as multipart upload part by part"""
+    def __init__(self, client, bucket: str, key: str) -> None:
+        self._client, self._bucket, self._key = client, bucket, key
+        self._buffer = bytearray()
+        self._upload_id: str | None = None
+        self._parts: list[dict] = []
+
+    def write(self, chunk: bytes) -> None:
+        self._buffer += chunk
+        if len(self._buffer) >= S3_PART_SIZE:
+            self._upload_part()
+
+    def _upload_part(self) -> None:
+        if self._upload_id is None:
+            self._upload_id = self._client.create_multipart_upload(Bucket=self._bucket, Key=self._key)['UploadId']
+        number = len(self._parts) + 1
+        response = self._client.upload_part(Bucket=self._bucket, Key=self._key, UploadId=self._upload_id,
+                                            PartNumber=number, Body=bytes(self._buffer))
+        self._parts.append({'ETag': response['ETag'], 'PartNumber': number})
+        self._buffer.clear()
+
+    def commit(self) -> None:
+        if self._upload_id is None:
+            self._client.put_object(Bucket=self._bucket, Key=self._key, Body=bytes(self._buffer))
+            return
+        if self._buffer:
+            self._upload_part()
+        self._client.complete_multipart_upload(Bucket=self._bucket, Key=self._key, UploadId=self._upload_id,
+                                               MultipartUpload={'Parts': self._parts})
+
+    def abort(self) -> None:
+        self._buffer.clear()
+        if self._upload_id is not None:
+            self._client.abort_multipart_upload(Bucket=self._bucket, Key=self._key, UploadId=self._upload_id)
+
+class S3Storage:
+    """Objects in an S3 bucket, the key is the object key"""
+    def __init__(self, bucket: str, endpoint_url: str = '', region: str = '',
+                 access_key_id: str = '', secret_access_key: str = '') -> None:
+        import boto3 # optional dependency, only needed for this backend
+        self.bucket = bucket
+        # empty settings fall back to the default credential chain / configuration of boto3
+        self.client = boto3.client('s3', endpoint_url=endpoint_url or None, region_name=region or None,
+                                   aws_access_key_id=access_key_id or None,
+                                   aws_secret_access_key=secret_access_key or None)
+
+    def writer(self, key: str) -> S3Writer:
+        return S3Writer(self.client, self.bucket, key)
+
+    def put(self, key: str, data: bytes) -> None:
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data)
+
+    def read(self, key: str, start: int = 0, end: int | None = None) -> Iterator[bytes]:
+        """Chunks of the object from start to end (inclusive), fetched with a ranged GET on the first iteration"""
+        extra = {} if start == 0 and end is None else {'Range': f'bytes={start}-{"" if end is None else end}'}
+        body = self.client.get_object(Bucket=self.bucket, Key=key, **extra)['Body']
+        try:
+            yield from body.iter_chunks(STORAGE_CHUNK_SIZE)
+        finally:
+            body.close()
+
+    def open(self, key: str) -> IO[bytes]:
+        """Downloads the object to a seekable file, in memory up to S3_PART_SIZE"""
+        file = tempfile.SpooledTemporaryFile(max_size=S3_PART_SIZE)
+        self.client.download_fileobj(self.bucket, key, file)
+        file.seek(0)
+        return file
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+@lru_cache
+def get_storage() -> Storage:
+    """The storage configured by the storage_backend setting, created once per process"""
+    settings = get_settings()
+    if settings.storage_backend == 'local':
+        storage = LocalStorage(settings.storage_path)
+    elif settings.storage_backend == 's3':
+        storage = S3Storage(settings.s3_bucket, settings.s3_endpoint_url, settings.s3_region,
+                            settings.s3_access_key_id, settings.s3_secret_access_key)
+    else:
+        raise ValueError(f'Unknown storage backend {settings.storage_backend}')
+    logger.info('Storage configured', extra={'backend': settings.storage_backend})
+    return storage
+
+def _write_chunk(writer: ObjectWriter, digest, chunk: bytes) -> None:
+    digest.update(chunk)
+    writer.write(chunk)
+
+async def save_stream(storage: Storage, key: str, chunks: AsyncIterator[bytes], max_size: int) -> StoredObject:
+    """
+    Writes a stream of chunks (e.g. a request body) to key as it arrives, hashing it on the way.
+    Raises UploadTooLarge once more than max_size bytes arrived, then nothing is stored.
+    """
+    writer = await asyncio.to_thread(storage.writer, key)
+    digest, size, head = hashlib.sha256(), 0, b''
+    try:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            size += len(chunk)
+            if size > max_size:
+                raise UploadTooLarge(f'larger than {max_size} bytes')
+            if len(head) < SNIFF_BYTES:
+                head += chunk[:SNIFF_BYTES - len(head)]
+            await asyncio.to_thread(_write_chunk, writer, digest, chunk)
+        await asyncio.to_thread(writer.commit)
+    except BaseException:
+        await asyncio.to_thread(writer.abort)
+        raise
+    logger.debug('Stream stored', extra={'key': key, 'size': size})
+    return StoredObject(key, size, digest.hexdigest(), head)
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    (start, end) of a Range header for an object of size bytes, end inclusive.
+    None if the header is to be ignored (other unit, malformed or several ranges).
+    Raises RangeNotSatisfiable if the range starts beyond the end of the object.
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, separator, last = spec.strip().partition('-')
+    if not separator or not (first.isdigit() or first == '') or not (last.isdigit() or last == ''):
+        return None
+    if first == '': # suffix range, the last N bytes
+        if last == '':
+            return None
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable()
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if last and end < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+def _as_utc(value: datetime) -> datetime:
+    """SQLite returns naive datetimes (stored as UTC)"""
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+def _not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None: # takes precedence over If-Modified-Since
+        tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        return '*' in tags or etag in tags
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since is None:
+        return False
+    try:
+        since = _as_utc(parsedate_to_datetime(if_modified_since))
+    except (TypeError, ValueError):
+        return False
+    return last_modified.replace(microsecond=0) <= since
+
+def _if_range_matches(request: Request, etag: str, last_modified: datetime) -> bool:
+    if_range = request.headers.get('if-range')
+    if if_range is None:
+        return True
+    if if_range.strip().startswith(('"', 'W/')):
+        return if_range.strip() == etag # weak tags never match
+    try:
+        return _as_utc(parsedate_to_datetime(if_range)) == last_modified.replace(microsecond=0)
+    except (TypeError, ValueError):
+        return False
+
+def object_response(request: Request, storage: Storage, key: str, *, size: int, etag: str,
+                    content_type: str, last_modified: datetime) -> Response:
+    """Streams an object, answering conditional and range requests (see module docstring)"""
+    quoted_etag = f'"{etag}"'
+    last_modified = _as_utc(last_modified)
+    headers = {
+        'ETag': quoted_etag,
+        'Last-Modified': format_datetime(last_modified, usegmt=True),
+        'Cache-Control': IMMUTABLE_CACHE_CONTROL,
+        'Accept-Ranges': 'bytes',
+        'X-Content-Type-Options': 'nosniff',
+    }
+    if _not_modified(request, quoted_etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    range_header = request.headers.get('range')
+    if range_header is not None and _if_range_matches(request, quoted_etag, last_modified):
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**headers, 'Content-Range': f'bytes */{size}'})
+    if byte_range is None:
+        return StreamingResponse(storage.read(key), media_type=content_type,
+                                 headers={**headers, 'Content-Length': str(size)})
+    start, end = byte_range
+    return StreamingResponse(storage.read(key, start, end), status_code=206, media_type=content_type,
+                             headers={**headers, 'Content-Range': f'bytes {start}-{end}/{size}',
+                                      'Content-Length': str(end - start + 1)})
@@ -0,0 +1,140 @@
+import asyncio
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+from database import ReadSessionLocal
+from models.models import PostMention, PostTag, User
+from settings import get_settings, logger
+from sharding import shard_ids, split_by_shard
+
+"""
+tags.py
+
+Inverted index of the #tags and @mentions in the content of posts.
+
+Indexing:
+    create_post_object, create_posts_bulk and update_post (post_service.py) extract the tags and
+    mentions of the content and write them to post_tags and post_mentions in the transaction
+    writing the post (index_posts, unindex_posts before re-indexing an update).
+    - a tag is '#' followed by a letter and up to 49 letters, digits or '_', not preceded by a
+      letter, digit or '&' (so 'a#b' and '&#39;' are no tags). Tags are case-folded.
+    - a mention is '@' followed by a username, not preceded by a letter or digit (so e-mail
+      addresses are no mentions). Usernames of no active user are ignored.
+    Rows carry the created_at of the post, GET /tags/{tag}/posts and GET /users/{user_id}/mentions
+    page through (tag, created_at, post_id) and (user_id, created_at, post_id) index ranges.
+    With sharding the rows live in the bucket of their post.
+
+Top tags (TopTags, every worker process):
+    GET /tags/top is served from memory. The posts per tag of the last top_tags_window_hours
+    are counted every top_tags_refresh_seconds with one GROUP BY per shard, so the ranking
+    lags behind by up to one interval.
+
+Usage:
+    index_posts(session, [{'id': post.id, 'owner_id': post.owner_id, 'content': post.content, 'created_at': post.created_at}])
+    top_tags.get(limit)
+    await top_tags.start() / await top_tags.stop() from the FastAPI lifespan.
+"""
+
+settings = get_settings()
+TOP_TAGS_LIMIT = 100
+TOP_TAGS_WINDOW = timedelta(hours=settings.top_tags_window_hours)
+TAG_PATTERN = re.compile(r'(?<![\w&])#([^\W\d_]\w{0,49})(?!\w)')
+MENTION_PATTERN = re.compile(r'(?<!\w)@([a-zA-Z0-9_]{3,20})(?!\w)')
+
+def normalize_tag(tag: str) -> str:
+    """Tag as stored, without a leading '#' and case-folded"""
+    return tag.removeprefix('#').casefold()
+
+def extract_tags(content: str) -> set[str]:
+    return {normalize_tag(tag) for tag in TAG_PATTERN.findall(content)}
+
+def extract_mentions(content: str) -> set[str]:
+    """Usernames mentioned in content"""
+    return set(MENTION_PATTERN.findall(content))
+
+def unindex_posts(session: Session, post_ids: list[UUID]) -> None:
+    """Removes the tags and mentions of posts, in the callers transaction"""
+    session.execute(delete(PostTag).where(PostTag.post_id.in_(post_ids)))
+    session.execute(delete(PostMention).where(PostMention.post_id.in_(post_ids)))
+
+def index_posts(session: Session, posts: list[dict]) -> None:
+    """
+    Writes the tags and mentions of posts (dicts with id, owner_id, content and created_at),
+    in the callers transaction. The usernames of all posts are resolved with one query.
+    """
+    mentions = {post['id']: extract_mentions(post['content']) for post in posts}
+    usernames = set().union(*mentions.values())
+    user_ids = dict(session.execute(
+        select(User.username, User.id).where(User.username.in_(usernames), User.deleted_at.is_(None))
+    ).all()) if usernames else {}
+    tag_rows, mention_rows = [], []
+    for post in posts:
+        tag_rows.extend({'post_id': post['id'], 'tag': tag, 'created_at': post['created_at'], 'owner_id': post['owner_id']}
+                        for tag in extract_tags(post['content']))
+        mention_rows.extend({'post_id': post['id'], 'user_id': user_ids[username], 'created_at': post['created_at'],
+                             'owner_id': post['owner_id']} for username in mentions[post['id']] if username in user_ids)
+    for table, rows in ((PostTag.__table__, tag_rows), (PostMention.__table__, mention_rows)):
+        for shard_id, shard_rows in split_by_shard(rows, lambda row: row['owner_id']).items():
+            # owner_id only routes the row, insert() of the table ignores keys that are no column
+            session.execute(insert(table), shard_rows, bind_arguments={'shard_id': shard_id})
+    logger.debug('Posts indexed', extra={'posts': len(posts), 'tags': len(tag_rows), 'mentions': len(mention_rows)})
+
+class TopTags:
+    """In-memory ranking of the tags of recent posts, recounted periodically"""
+    def __init__(self, refresh_seconds: float) -> None:
+        self.refresh_seconds = refresh_seconds
+        self._top: list[tuple[str, int]] = []
+        self._lock = threading.Lock()
+        self._task: asyncio.Task | None = None
+
+    def refresh(self) -> None:
+        """Recounts the posts per tag of the last TOP_TAGS_WINDOW on every shard"""
+        started = time.monotonic()
+        cutoff = datetime.now(timezone.utc) - TOP_TAGS_WINDOW
+        counts: Counter[str] = Counter()
+        stmt = select(PostTag.tag, func.count()).where(PostTag.created_at >= cutoff).group_by(PostTag.tag)
+        with ReadSessionLocal() as session:
+            for shard_id in shard_ids():
+                for tag, posts in session.execute(stmt, bind_arguments={'shard_id': shard_id}):
+                    counts[tag] += posts
+        top = sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:TOP_TAGS_LIMIT]
+        with self._lock:
+            self._top = top
+        logger.debug('Top tags refreshed', extra={'tags': len(counts), 'duration_ms': round((time.monotonic() - started) * 1000, 1)})
+
+    def get(self, limit: int) -> list[tuple[str, int]]:
+        """The limit most used tags as (tag, posts), most used first"""
+        with self._lock:
+            return self._top[:limit]
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        try:
+            await asyncio.to_thread(self.refresh)
+        except Exception:
+            logger.exception('Counting the top tags failed')
+        self._task = asyncio.create_task(self._run())
+        logger.info('Top tags started', extra={'refresh_seconds': self.refresh_seconds})
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        self._task = None
+        logger.info('Top tags stopped')
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception:
+                logger.exception('Counting the top tags failed')
+
+top_tags = TopTags(settings.top_tags_refresh_seconds)
@@ -0,0 +1,33 @@
+import json
+import os
+import shutil
+import tempfile
+
+"""
+conftest.py
+
+The tests run against three SQLite shards in a temporary directory: database_url is shard 0,
+shard_urls lists shards 1 and 2 (see sharding.py). Settings are read when the application modules
+are imported, so the environment is set in pytest_configure, before the test modules are collected.
+
+Usage (from the backend directory):
+    pip install -r requirements-dev.txt
+    python -m pytest
+"""
+
+SHARD_FILES = ('shard0.db', 'shard1.db', 'shard2.db')
+
+_directory: str | None = None
+
+def pytest_configure(config) -> None:
+    global _directory
+    _directory = tempfile.mkdtemp(prefix='backend-tests-')
+    urls = [f'sqlite:///{os.path.join(_directory, name)}' for name in SHARD_FILES]
+    os.environ['DATABASE_URL'] = urls[0]
+    os.environ['SHARD_URLS'] = json.dumps(urls[1:])
+    os.environ['SHARD_MAP_REFRESH_SECONDS'] = '0.1'
+    os.environ['STORAGE_PATH'] = os.path.join(_directory, 'media')
+
+def pytest_unconfigure(config) -> None:
+    if _directory is not None:
+        shutil.rmtree(_directory, ignore_errors=True)
@@ -0,0 +1,105 @@
+from uuid import UUID
+import pytest
+from alembic import command
+from alembic.config import Config
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+import rebalance
+from database import shard_engines
+from main import app
+from models.models import Post, User
+from rate_limit import limiter
+from sharding import SHARDS, shard_map, user_bucket
+
+"""
+test_sharding.py
+
+Sharding (sharding.py) against the three SQLite shards set up by conftest.py:
+- pages of GET /posts/ merged across shards, newest first
+- usernames unique across shards
+- moving a bucket to another shard with rebalance.move_buckets
+"""
+
+PASSWORD = 'supersecret123!'
+
+@pytest.fixture(scope='module')
+def client():
+    command.upgrade(Config('alembic.ini'), 'head') # every shard, see migrations/env.py
+    limiter.enabled = False
+    with TestClient(app) as test_client: # the lifespan seeds and loads the shard map
+        yield test_client
+    limiter.enabled = True
+
+def register(client: TestClient, username: str) -> tuple[UUID, dict]:
+    """Registers a user, returns its id and the headers authenticating as it"""
+    response = client.post('/users/', json={'username': username, 'password': PASSWORD})
+    assert response.status_code == 200, response.text
+    token = client.post('/auth/token', data={'username': username, 'password': PASSWORD}).json()['access_token']
+    return UUID(response.json()['id']), {'Authorization': f'Bearer {token}'}
+
+def create_post(client: TestClient, headers: dict, title: str) -> dict:
+    response = client.post('/posts/', json={'title': title, 'content': 'content'}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def rows_per_shard(model, *criteria) -> list[int]:
+    counts = []
+    for writer, _ in shard_engines:
+        with writer.connect() as connection:
+            counts.append(connection.execute(select(func.count()).select_from(model).where(*criteria)).scalar_one())
+    return counts
+
+def test_posts_are_merged_newest_first_across_shards(client):
+    users = [register(client, f'poster{number}') for number in range(6)]
+    assert len({shard_map.shard_of_user(user_id) for user_id, _ in users}) > 1
+    titles = [f'ordered{number}' for number in range(12)]
+    for number, title in enumerate(titles):
+        create_post(client, users[number % len(users)][1], title)
+    assert sum(count > 0 for count in rows_per_shard(Post, Post.title.in_(titles))) > 1
+
+    pages = [client.get('/posts/', params={'offset': offset, 'limit': 5}).json() for offset in (0, 5, 10, 15)]
+    listed = [post['title'] for page in pages for post in page if post['title'] in titles]
+    assert listed == titles[::-1]
+
+def test_username_is_unique_across_shards(client):
+    user_id, headers = register(client, 'unique')
+    shard = shard_map.shard_of_user(user_id)
+    # every attempt gets a new id, whose bucket can be on any shard
+    for _ in range(2 * SHARDS):
+        response = client.post('/users/', json={'username': 'unique', 'password': PASSWORD})
+        assert response.status_code == 409
+    _, other_headers = register(client, 'renamed')
+    assert client.put('/users/me', json={'username': 'unique'}, headers=other_headers).status_code == 409
+    assert rows_per_shard(User, User.username == 'unique')[shard] == 1
+    assert sum(rows_per_shard(User, User.username == 'unique')) == 1
+    response = client.post('/auth/token', data={'username': 'unique', 'password': PASSWORD})
+    assert response.status_code == 200, response.text
+
+def test_move_bucket(client, monkeypatch):
+    user_id, headers = register(client, 'mover')
+    post = create_post(client, headers, 'before the move')
+    bucket = user_bucket(user_id)
+    source = shard_map.shard(bucket)
+    target = (source + 1) % SHARDS
+
+    writes_while_moving = []
+    def settle() -> None:
+        # what _settle waits for: every process reloaded the shard map
+        shard_map.refresh(shard_engines[0][1])
+        if shard_map.shard(bucket) == source:
+            response = client.post('/posts/', json={'title': 'moving', 'content': 'content'}, headers=headers)
+            writes_while_moving.append(response.status_code)
+    monkeypatch.setattr(rebalance, '_settle', settle)
+    rebalance.move_buckets([bucket], target)
+
+    assert writes_while_moving == [503]
+    assert shard_map.shard(bucket) == target
+    for model, criterion in ((User, User.id == user_id), (Post, Post.owner_id == user_id)):
+        counts = rows_per_shard(model, criterion)
+        assert counts[target] == 1 and counts[source] == 0, (model.__tablename__, counts)
+
+    response = client.get(f'/users/{user_id}/posts')
+    assert response.status_code == 200, response.text
+    assert [listed['id'] for listed in response.json()['posts']] == [post['id']]
+    create_post(client, headers, 'after the move')
+    assert rows_per_shard(Post, Post.owner_id == user_id)[target] == 2
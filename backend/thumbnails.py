@@ -0,0 +1,113 @@
+import hashlib
+import io
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import NamedTuple
+from PIL import ExifTags, Image, ImageOps
+from settings import get_settings, logger
+from storage import get_storage
+
+"""
+thumbnails.py
+
+Thumbnails of uploaded images, rendered in a pool of worker processes.
+
+Decoding and resizing an image is CPU-bound and holds the GIL, in a thread it would slow down
+every request of the server process. ThumbnailPool runs render_thumbnail in separate processes
+(thumbnail_processes per server process, started on first use), the calling thread - a job
+worker of the 'media' queue - waits for the result. The worker processes are spawned, not
+forked, as the server process runs threads whose locks a fork could copy in a held state.
+
+A pool process reads the original from the storage itself and writes the thumbnail back, so
+only keys and the small result cross the process boundary.
+
+Images larger than MAX_IMAGE_PIXELS are rejected (decompression bombs), JPEGs are decoded at
+a reduced scale (draft mode) when they are much larger than the thumbnail.
+
+Usage:
+    thumbnail = thumbnail_pool.render(key, thumbnail_key)  # None if not a readable image
+    thumbnail_pool.stop() from the FastAPI lifespan.
+"""
+
+THUMBNAIL_FORMAT = 'WEBP'
+THUMBNAIL_CONTENT_TYPE = 'image/webp'
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_TIMEOUT_SECONDS = 60
+MAX_IMAGE_PIXELS = 50_000_000
+ROTATING_ORIENTATIONS = {5, 6, 7, 8} # EXIF orientations swapping width and height
+
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+settings = get_settings()
+
+class Thumbnail(NamedTuple):
+    """Result of render_thumbnail, width/height are those of the original as displayed"""
+    width: int
+    height: int
+    size: int
+    etag: str # SHA-256 hex digest of the thumbnail
+
+def render_thumbnail(key: str, thumbnail_key: str, max_side: int) -> Thumbnail | None:
+    """
+    Renders the thumbnail (at most max_side pixels wide and high) of the image at key to thumbnail_key.
+    Runs in a pool process. Returns None if the object is not a readable image.
+    """
+    with get_storage().open(key) as file:
+        try:
+            with Image.open(file) as image:
+                width, height = image.size
+                if image.getexif().get(ExifTags.Base.Orientation) in ROTATING_ORIENTATIONS:
+                    width, height = height, width
+                image.draft('RGB', (max_side, max_side))
+                thumbnail = ImageOps.exif_transpose(image)
+                thumbnail.thumbnail((max_side, max_side))
+                if thumbnail.mode not in ('RGB', 'RGBA'):
+                    thumbnail = thumbnail.convert('RGBA' if thumbnail.has_transparency_data else 'RGB')
+                output = io.BytesIO()
+                thumbnail.save(output, THUMBNAIL_FORMAT, quality=THUMBNAIL_QUALITY)
+        except (OSError, ValueError, Image.DecompressionBombError) as exc:
+            logger.warning('Image could not be read', extra={'key': key, 'error': repr(exc)})
+            return None
+    data = output.getvalue()
+    get_storage().put(thumbnail_key, data)
+    return Thumbnail(width, height, len(data), hashlib.sha256(data).hexdigest())
+
+class ThumbnailPool:
+    """Process pool rendering the thumbnails of this server process"""
+    def __init__(self, processes: int, max_side: int) -> None:
+        self.processes = processes
+        self.max_side = max_side
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context('spawn'))
+                logger.info('Thumbnail pool started', extra={'processes': self.processes})
+            return self._executor
+
+    def render(self, key: str, thumbnail_key: str) -> Thumbnail | None:
+        """Renders a thumbnail in a pool process, blocking the calling thread (not the event loop) until it is done"""
+        executor = self._get_executor()
+        try:
+            future = executor.submit(render_thumbnail, key, thumbnail_key, self.max_side)
+            return future.result(timeout=THUMBNAIL_TIMEOUT_SECONDS)
+        except BrokenProcessPool:
+            # a pool process died (e.g. killed for memory), the next render starts a new pool
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False)
+            raise
+
+    def stop(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+            logger.info('Thumbnail pool stopped')
+
+thumbnail_pool = ThumbnailPool(settings.thumbnail_processes, settings.thumbnail_max_side)
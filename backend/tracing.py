@@ -0,0 +1,333 @@
+import asyncio
+import contextvars
+import functools
+import importlib
+import inspect
+import json
+import logging
+import os
+import pkgutil
+import random
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+from settings import get_settings, logger
+
+"""
+tracing.py
+
+In-process request tracing, without an external collector.
+
+Every HTTP request gets a trace (TracingMiddleware): the trace id of an incoming W3C
+`traceparent` header, or a new one. It is returned in the X-Trace-Id header and is attached
+to every JSON log record written while the request runs (TraceContextFilter, see
+logging_config.json), so `grep <trace id> logs/app.log.jsonl` finds the logs of one request.
+
+Spans of a trace (the current span is a contextvar, so it follows the request into the
+threadpool running sync endpoints and dependencies):
+    - the request, named after its route ('GET /posts/{post_id}')
+    - every function of the services package (instrument_services, called from main.py),
+      except FastAPI dependencies captured in Annotated[..., Depends()] at import time
+    - every DB statement (database.py), with the normalized SQL
+    - bcrypt hashing and verification (authentication_service.py)
+    - serialization of the response model (instrument_serialization)
+Spans are only recorded while a request is traced, service functions called by job workers cost
+one contextvar lookup.
+
+Export:
+    A trace is written when its request is slower than trace_slow_ms, or sampled: with
+    probability trace_sample_rate, or when the incoming traceparent has the sampled flag.
+    Traces are appended to trace_file, one OTLP/JSON ExportTraceServiceRequest per line (the
+    format of the OpenTelemetry collector's file exporter, readable by its otlpjsonfile receiver),
+    by a background task every TRACE_FLUSH_SECONDS. The file is rotated at TRACE_FILE_MAX_BYTES
+    keeping one backup. With trace_sample_rate and trace_slow_ms 0 no spans are recorded,
+    requests still get trace ids.
+
+Usage:
+    with span('render', {'items': 3}): ...
+    await trace_exporter.start() / await trace_exporter.stop() from the FastAPI lifespan.
+"""
+
+settings = get_settings()
+TRACE_FLUSH_SECONDS = 1.0
+TRACE_FILE_MAX_BYTES = 10 * 2**20
+MAX_SPANS_PER_TRACE = 1000
+MAX_PENDING_TRACES = 1000
+SPAN_KIND_INTERNAL, SPAN_KIND_SERVER, SPAN_KIND_CLIENT = 1, 2, 3
+STATUS_CODE_UNSET, STATUS_CODE_ERROR = 0, 2
+TRACEPARENT_PATTERN = re.compile(r'00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})')
+TRACING_ENABLED = settings.trace_sample_rate > 0 or settings.trace_slow_ms > 0
+
+class Trace:
+    """The spans of one request"""
+    def __init__(self, trace_id: str, sampled: bool, record: bool) -> None:
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.record = record
+        self.spans: list[Span] = []
+        self.dropped_spans = 0
+        self._lock = threading.Lock()
+
+    def add(self, span: 'Span') -> None:
+        with self._lock:
+            if len(self.spans) < MAX_SPANS_PER_TRACE:
+                self.spans.append(span)
+            else:
+                self.dropped_spans += 1
+
+class Span:
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'kind', 'start_ns', 'end_ns', 'attributes', 'error')
+
+    def __init__(self, trace: Trace, parent_id: str | None, name: str, kind: int = SPAN_KIND_INTERNAL,
+                 attributes: dict[str, Any] | None = None, start_ns: int | None = None) -> None:
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes or {}
+        self.error: str | None = None
+
+    def end(self, end_ns: int | None = None) -> None:
+        self.end_ns = end_ns if end_ns is not None else time.time_ns()
+        if self.trace.record:
+            self.trace.add(self)
+
+    def to_otlp(self) -> dict:
+        otlp = {
+            'traceId': self.trace.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            'status': {'code': STATUS_CODE_UNSET} if self.error is None else {'code': STATUS_CODE_ERROR, 'message': self.error},
+        }
+        if self.parent_id:
+            otlp['parentSpanId'] = self.parent_id
+        return otlp
+
+current_span: contextvars.ContextVar[Span | None] = contextvars.ContextVar('current_span', default=None)
+
+def _otlp_attribute(key: str, value: Any) -> dict:
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+@contextmanager
+def span(name: str, attributes: dict[str, Any] | None = None) -> Iterator[Span | None]:
+    """Runs the block in a child span of the current span, does nothing outside a recorded trace"""
+    parent = current_span.get()
+    if parent is None or not parent.trace.record:
+        yield None
+        return
+    child = Span(parent.trace, parent.span_id, name, attributes=attributes)
+    reset = current_span.set(child)
+    try:
+        yield child
+    except BaseException as exc:
+        child.error = type(exc).__name__
+        raise
+    finally:
+        current_span.reset(reset)
+        child.end()
+
+def record_span(name: str, duration: float, attributes: dict[str, Any], kind: int = SPAN_KIND_INTERNAL) -> None:
+    """Adds a span that ended now and took duration seconds to the current trace"""
+    parent = current_span.get()
+    if parent is None or not parent.trace.record:
+        return
+    end_ns = time.time_ns()
+    Span(parent.trace, parent.span_id, name, kind, attributes, start_ns=end_ns - int(duration * 1e9)).end(end_ns)
+
+def recording() -> bool:
+    """Whether the current request records spans, to skip building costly span attributes"""
+    parent = current_span.get()
+    return parent is not None and parent.trace.record
+
+def traced(func: Callable, name: str) -> Callable:
+    """func running in a span called name when called in a recorded trace"""
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            if not recording():
+                return await func(*args, **kwargs)
+            with span(name):
+                return await func(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not recording():
+            return func(*args, **kwargs)
+        with span(name):
+            return func(*args, **kwargs)
+    return wrapper
+
+def instrument_services() -> None:
+    """
+    Replaces the functions defined in the modules of the services package by traced() wrappers.
+    Callers looking them up on the module (services.post_service.get_posts(...)) and calls
+    within a module get the wrapper. Generators are left alone, their span would end before they run.
+    """
+    if not TRACING_ENABLED:
+        return
+    import services
+    for module_info in pkgutil.iter_modules(services.__path__):
+        module = importlib.import_module(f'services.{module_info.name}')
+        for attribute, value in list(vars(module).items()):
+            if (inspect.isfunction(value) and value.__module__ == module.__name__
+                    and not getattr(value, '__wrapped__', None)
+                    and not inspect.isgeneratorfunction(value) and not inspect.isasyncgenfunction(value)):
+                setattr(module, attribute, traced(value, f'{module_info.name}.{attribute}'))
+
+def instrument_serialization() -> None:
+    """Traces the validation and serialization of response models, which FastAPI runs after the endpoint"""
+    if not TRACING_ENABLED:
+        return
+    import fastapi.routing
+    serialize_response = fastapi.routing.serialize_response
+    if getattr(serialize_response, '__wrapped__', None):
+        return
+    # the request handlers look serialize_response up in the module globals on every call
+    fastapi.routing.serialize_response = traced(serialize_response, 'serialize_response')
+
+class TraceContextFilter(logging.Filter):
+    """Adds the trace_id and span_id of the current span to log records written during a request"""
+    def filter(self, record: logging.LogRecord) -> bool:
+        current = current_span.get()
+        if current is not None:
+            record.trace_id = current.trace.trace_id
+            record.span_id = current.span_id
+        return True
+
+class TraceExporter:
+    """Appends finished traces to trace_file in OTLP/JSON, from a background task"""
+    def __init__(self, path: str, flush_seconds: float) -> None:
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self.resource = {'attributes': [_otlp_attribute('service.name', settings.app_name),
+                                        _otlp_attribute('process.pid', os.getpid())]}
+        self._pending: list[str] = []
+        self._dropped = 0
+        self._lock = threading.Lock()
+        self._task: asyncio.Task | None = None
+
+    def export(self, trace: Trace) -> None:
+        """Queues a finished trace, dropped when MAX_PENDING_TRACES are queued already"""
+        spans = [span.to_otlp() for span in trace.spans]
+        line = json.dumps({'resourceSpans': [{
+            'resource': self.resource,
+            'scopeSpans': [{'scope': {'name': 'app.tracing'}, 'spans': spans}],
+        }]}, separators=(',', ':'), default=str)
+        with self._lock:
+            if len(self._pending) < MAX_PENDING_TRACES:
+                self._pending.append(line)
+            else:
+                self._dropped += 1
+
+    def flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, []
+            dropped, self._dropped = self._dropped, 0
+        if dropped:
+            logger.warning('Traces dropped, the exporter falls behind', extra={'traces': dropped})
+        if not pending:
+            return
+        try:
+            if os.path.exists(self.path) and os.path.getsize(self.path) > TRACE_FILE_MAX_BYTES:
+                os.replace(self.path, self.path + '.1')
+        except OSError:
+            pass # another process rotated it
+        # one write per batch in append mode, lines of several processes don't interleave
+        with open(self.path, 'a', encoding='utf-8') as file:
+            file.write(''.join(line + '\n' for line in pending))
+
+    async def start(self) -> None:
+        if self._task is not None or not TRACING_ENABLED:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._task = asyncio.create_task(self._run())
+        logger.info('Trace exporter started', extra={'path': self.path, 'sample_rate': settings.trace_sample_rate,
+                                                     'slow_ms': settings.trace_slow_ms})
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        self._task = None
+        try:
+            await asyncio.to_thread(self.flush)
+        except Exception:
+            logger.exception('Exporting traces failed')
+        logger.info('Trace exporter stopped')
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception:
+                logger.exception('Exporting traces failed')
+
+trace_exporter = TraceExporter(settings.trace_file, TRACE_FLUSH_SECONDS)
+
+def _incoming_trace(scope) -> tuple[str | None, str | None, bool]:
+    """trace id, parent span id and sampled flag of the traceparent header"""
+    for name, value in scope['headers']:
+        if name == b'traceparent':
+            match = TRACEPARENT_PATTERN.fullmatch(value.decode('latin-1').strip())
+            if match and match.group(1) != '0' * 32:
+                return match.group(1), match.group(2), int(match.group(3), 16) & 1 == 1
+    return None, None, False
+
+class TracingMiddleware:
+    """ASGI middleware running every request in a trace"""
+    def __init__(self, app) -> None:
+        self.app = app
+        self.slow_ns = settings.trace_slow_ms * 1_000_000
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        trace_id, parent_id, sampled = _incoming_trace(scope)
+        sampled = sampled or random.random() < settings.trace_sample_rate
+        trace = Trace(trace_id or secrets.token_hex(16), sampled, record=TRACING_ENABLED)
+        root = Span(trace, parent_id, f"{scope['method']} {scope['path']}", SPAN_KIND_SERVER,
+                    {'http.request.method': scope['method'], 'url.path': scope['path']})
+        reset = current_span.set(root)
+
+        async def send_with_trace_id(message) -> None:
+            if message['type'] == 'http.response.start':
+                root.attributes['http.response.status_code'] = message['status']
+                if message['status'] >= 500:
+                    root.error = f"HTTP {message['status']}"
+                message = {**message, 'headers': [*message.get('headers', []), (b'x-trace-id', trace.trace_id.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        except BaseException as exc:
+            root.error = type(exc).__name__
+            raise
+        finally:
+            current_span.reset(reset)
+            route = scope.get('route')
+            if route is not None and hasattr(route, 'path'):
+                root.name = f"{scope['method']} {route.path}"
+                root.attributes['http.route'] = route.path
+            root.end()
+            if trace.record and (trace.sampled or root.end_ns - root.start_ns >= self.slow_ns > 0):
+                if trace.dropped_spans:
+                    root.attributes['dropped_spans'] = trace.dropped_spans
+                trace_exporter.export(trace)